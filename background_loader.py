@@ -0,0 +1,160 @@
+"""CSC111 Winter 2025 Project: Spotify Song Recommendation System
+
+This Python module contains the loader that builds the song graph on a background thread,
+so that the window stays responsive and can show the progress of the build.
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of students
+taking CSC111 at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult our Course Syllabus.
+
+This file is Copyright (c) 2025 Cindy Yang, Kate Shen, Kristen Wong, Sara Kopilovic.
+"""
+from __future__ import annotations
+import threading
+from typing import Any, Callable, Optional
+
+from instrumentation import Metrics
+from recommender import WeightedGraph
+from snapshot import SnapshotGraph
+
+
+class BuildCancelled(Exception):
+    """Raised inside a graph build once its loader has been cancelled."""
+
+
+class _ProgressMetrics(Metrics):
+    """The metrics of a background build, which stop the build once it is cancelled.
+
+    Instance Attributes:
+        - cancelled: Whether the build has been cancelled.
+    """
+    cancelled: bool
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.cancelled = False
+
+    def count(self, name: str, amount: int = 1) -> None:
+        """Increase the counter with the given name by amount.
+
+        Raise BuildCancelled if the build has been cancelled.
+        """
+        if self.cancelled:
+            raise BuildCancelled
+        super().count(name, amount)
+
+
+class BackgroundLoader:
+    """A loader building the song graph on a background thread.
+
+    The graph is built by a function like main.load_graph, called with metrics and on_vertices
+    keyword arguments. Its progress is read from the counters of those metrics: the rows parsed,
+    then the pairs of songs compared, out of every pair or of the pairs_planned counter if the
+    build counts it, then the edges linked. The build checks whether it was
+    cancelled whenever it updates a counter.
+
+    Instance Attributes:
+        - graph: The graph being built, as soon as every song is a vertex, or None before that.
+                 Its edges are only complete once ready is True.
+        - ready: Whether the graph, including its edges, is complete.
+        - error: The exception the build failed with, if it failed.
+
+    Private Instance Attributes:
+        - _load: The function building the graph.
+        - _args: The positional arguments of _load.
+        - _kwargs: The keyword arguments of _load, other than metrics and on_vertices.
+        - _metrics: The metrics the build reports its progress to.
+        - _thread: The thread running the build, once started.
+    """
+    graph: Optional[WeightedGraph | SnapshotGraph]
+    ready: bool
+    error: Optional[BaseException]
+    _load: Callable[..., WeightedGraph | SnapshotGraph]
+    _args: tuple
+    _kwargs: dict[str, Any]
+    _metrics: _ProgressMetrics
+    _thread: Optional[threading.Thread]
+
+    def __init__(self, load: Callable[..., WeightedGraph | SnapshotGraph], *args: Any, **kwargs: Any) -> None:
+        """Initialize a loader that builds the graph with load(*args, **kwargs)."""
+        self.graph = None
+        self.ready = False
+        self.error = None
+        self._load = load
+        self._args = args
+        self._kwargs = kwargs
+        self._metrics = _ProgressMetrics()
+        self._thread = None
+
+    def start(self) -> None:
+        """Start building the graph on a background thread."""
+        self._thread = threading.Thread(target=self._run, name='graph-loader', daemon=True)
+        self._thread.start()
+
+    def cancel(self, timeout: Optional[float] = 5.0) -> None:
+        """Stop the build and wait up to timeout seconds for its thread to finish.
+
+        A build that does not stop in time is abandoned; its thread is a daemon thread, so it
+        does not keep the program running.
+        """
+        self._metrics.cancelled = True
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @property
+    def done(self) -> bool:
+        """Whether the build has finished, failed or been cancelled."""
+        return self.ready or self.error is not None
+
+    def progress(self) -> dict[str, Any]:
+        """Return the stage of the build ('parsing', 'comparing', 'linking', 'ready', 'failed' or
+        'cancelled'), the number of rows parsed, and the fraction of the current stage done, or
+        None if it is unknown.
+        """
+        counters = self._metrics.counters
+        rows = counters.get('rows_parsed', 0)
+        if self.ready:
+            return {'stage': 'ready', 'rows': rows, 'fraction': 1.0}
+        elif isinstance(self.error, BuildCancelled):
+            return {'stage': 'cancelled', 'rows': rows, 'fraction': None}
+        elif self.error is not None:
+            return {'stage': 'failed', 'rows': rows, 'fraction': None}
+        elif self.graph is None:
+            return {'stage': 'parsing', 'rows': rows, 'fraction': None}
+        elif 'edges_linked' in counters:
+            return {'stage': 'linking', 'rows': rows,
+                    'fraction': counters['edges_linked'] / max(counters.get('edges_accepted', 1), 1)}
+
+        pairs = counters.get('pairs_planned', rows * (rows - 1) // 2)
+        compared = counters.get('similarity_evaluations')
+        return {'stage': 'comparing', 'rows': rows,
+                'fraction': None if compared is None or pairs == 0 else compared / pairs}
+
+    def _run(self) -> None:
+        """Build the graph, recording the result or the error it failed with."""
+        try:
+            graph = self._load(*self._args, metrics=self._metrics, on_vertices=self._publish, **self._kwargs)
+            graph.use_metrics(None)
+            self.graph = graph
+            self.ready = True
+        except Exception as error:  # Reported by progress instead of lost with the thread
+            self.error = error
+
+    def _publish(self, graph: WeightedGraph | SnapshotGraph) -> None:
+        """Make the graph available as soon as every song is a vertex."""
+        self.graph = graph
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['threading', 'instrumentation', 'recommender', 'snapshot'],
+        'allowed-io': [],
+        'max-line-length': 120
+    })
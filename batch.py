@@ -0,0 +1,284 @@
+"""CSC111 Winter 2025 Project: Spotify Song Recommendation System
+
+This Python module contains the command line batch mode of the recommendation system. It
+reads lists of seed songs as JSON lines from a file or stdin, and writes their
+recommendations as JSON lines, in input order, without opening a window.
+
+Every input line is either a JSON list of song names, or a JSON object with the song names
+under "songs" and optionally an "id" and a "limit":
+
+    ["Hello", "Yellow"]
+    {"id": "user-7", "songs": ["Hello", "Yellow"], "limit": 10}
+
+Every output line holds the input line number, the id if one was given, the song each seed
+name resolved to (or null), and the recommendations, or an error if the line is malformed.
+
+For example:
+
+    python batch.py --songs data/spotify_songs_small.csv --input seeds.jsonl --output recommendations.jsonl
+
+If the job is interrupted, running it again with --resume continues after the last chunk
+that was completely written.
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of students
+taking CSC111 at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult our Course Syllabus.
+
+This file is Copyright (c) 2025 Cindy Yang, Kate Shen, Kristen Wong, Sara Kopilovic.
+"""
+from __future__ import annotations
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from typing import Any, BinaryIO, Iterator, Optional, TextIO
+
+from recommender import WeightedGraph
+from snapshot import SnapshotGraph
+
+# The graph of the current worker process, under 'graph' once it is loaded
+_worker_graph: dict[str, WeightedGraph | SnapshotGraph] = {}
+
+# Keep pygame, imported by main, from printing its banner into the output on stdout
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+
+def read_chunks(file: BinaryIO, chunk_size: int, offset: int = 0,
+                line: int = 0) -> Iterator[tuple[int, list[bytes], int]]:
+    """Yield the (number of the first line, lines, offset after the last line) of every chunk
+    of up to chunk_size lines of file, which is positioned at the given byte offset and line.
+    """
+    lines = []
+    for raw in file:
+        offset += len(raw)
+        lines.append(raw)
+        if len(lines) == chunk_size:
+            yield line, lines, offset
+            line += len(lines)
+            lines = []
+    if lines:
+        yield line, lines, offset
+
+
+def recommend_lines(graph: WeightedGraph | SnapshotGraph, first_line: int, lines: list[bytes],
+                    limit: int = 5) -> str:
+    """Return the output lines for the given input lines, the first of which is line
+    number first_line of the input.
+
+    Lines asking for the same limit are scored together with recommend_songs_batch when the
+    graph supports it.
+    """
+    records = []
+    by_limit = {}
+    for number, raw in enumerate(lines, first_line):
+        record = {'line': number}
+        try:
+            _parse(json.loads(raw), limit, record)
+        except (ValueError, UnicodeDecodeError) as error:
+            records.append({'line': number, 'error': str(error)})
+            continue
+        record['seeds'] = [graph.find_song_id(name) for name in record['songs']]
+        records.append(record)
+        by_limit.setdefault(record.pop('limit'), []).append(record)
+
+    for record_limit, group in by_limit.items():
+        seed_lists = [record.pop('songs') for record in group]
+        if hasattr(graph, 'recommend_songs_batch'):
+            results = graph.recommend_songs_batch(seed_lists, record_limit)
+        else:
+            results = [graph.recommend_songs(seed_list, record_limit) for seed_list in seed_lists]
+        for record, result in zip(group, results):
+            record['recommendations'] = result
+
+    return ''.join(json.dumps(record) + '\n' for record in records)
+
+
+def _parse(request: Any, limit: int, record: dict) -> None:
+    """Store the id, songs and limit of the given input line in record.
+
+    Raise a ValueError if it is not a list of song names or an object holding one.
+    """
+    if isinstance(request, dict):
+        if 'id' in request:
+            record['id'] = request['id']
+        limit = request.get('limit', limit)
+        request = request.get('songs')
+    if not isinstance(request, list) or not all(isinstance(song, str) for song in request):
+        raise ValueError('expected a list of song names')
+    if not isinstance(limit, int) or isinstance(limit, bool) or limit < 1:
+        raise ValueError('limit must be a positive integer')
+    record['songs'] = request
+    record['limit'] = limit
+
+
+def run_batch(graph_source: tuple[str, Optional[str]], input_file: BinaryIO, output_file: TextIO,
+              workers: int = 1, chunk_size: int = 1000, limit: int = 5,
+              checkpoint: Optional[str] = None, resume: bool = False,
+              progress: Optional[TextIO] = None, progress_interval: float = 5.0) -> dict:
+    """Write the recommendations for every line of input_file to output_file, and return the
+    number of lines written, the seconds taken and the throughput.
+
+    The graph is loaded with main.load_graph from graph_source, a (songs_file, snapshot_file)
+    pair. With more than one worker, the chunks are scored on a pool of worker processes.
+    Forked workers share the graph loaded here; otherwise every worker memory-maps the
+    snapshot, or builds its own graph if there is none. At most two chunks per worker are in
+    progress at once, and their output is written in input order.
+
+    If checkpoint is given, the input and output offsets after every chunk written are saved
+    there once the output is flushed to disk. If resume is also True, the job continues from
+    the saved offsets: the output is truncated to its saved size, and the input is skipped to
+    its saved offset. output_file must then be opened in a mode that allows truncating it.
+
+    Report the throughput to progress every progress_interval seconds, if it is given.
+    """
+    from main import load_graph
+
+    offset, line = 0, 0
+    if checkpoint is not None and resume and os.path.exists(checkpoint):
+        with open(checkpoint, 'r', encoding='utf-8') as file:
+            state = json.load(file)
+        offset, line = state['input_offset'], state['lines']
+        output_file.seek(state['output_offset'])
+        output_file.truncate()
+        _skip(input_file, offset)
+    first_line = line
+
+    songs_file, snapshot_file = graph_source
+    graph = _worker_graph['graph'] = load_graph(songs_file, snapshot_file=snapshot_file)
+    if workers > 1 and hasattr(graph, 'recommend_songs_batch'):
+        graph.recommend_songs_batch([[]])  # Build the adjacency arrays once, for forked workers to share
+    context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+    pool = context.Pool(workers, _attach_graph, (songs_file, snapshot_file)) if workers > 1 else None
+
+    start = last_report = time.perf_counter()
+    pending = deque()
+    try:
+        for chunk_line, lines, chunk_offset in read_chunks(input_file, chunk_size, offset, line):
+            if pool is None:
+                pending.append((recommend_lines(graph, chunk_line, lines, limit), chunk_offset, len(lines)))
+            else:
+                pending.append((pool.apply_async(_recommend_lines, (chunk_line, lines, limit)), chunk_offset,
+                                len(lines)))
+            while pending and (pool is None or len(pending) >= 2 * workers):
+                line = _commit(pending.popleft(), output_file, checkpoint, line)
+            if progress is not None and time.perf_counter() - last_report >= progress_interval:
+                last_report = time.perf_counter()
+                _report(progress, line - first_line, last_report - start)
+        while pending:
+            line = _commit(pending.popleft(), output_file, checkpoint, line)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    seconds = time.perf_counter() - start
+    report = {'lines': line - first_line, 'first_line': first_line, 'seconds': seconds,
+              'lines_per_second': (line - first_line) / seconds if seconds > 0 else 0.0}
+    if progress is not None:
+        _report(progress, line - first_line, seconds)
+    return report
+
+
+def _commit(chunk: tuple[Any, int, int], output_file: TextIO, checkpoint: Optional[str], line: int) -> int:
+    """Write the output of the given (output or pending result, input offset, line count) chunk,
+    save the checkpoint if there is one, and return the number of input lines written so far.
+    """
+    output, input_offset, count = chunk
+    output_file.write(output if isinstance(output, str) else output.get())
+    line += count
+    if checkpoint is not None:
+        output_file.flush()
+        os.fsync(output_file.fileno())
+        state = {'input_offset': input_offset, 'output_offset': output_file.tell(), 'lines': line}
+        with open(checkpoint + '.tmp', 'w', encoding='utf-8') as file:
+            json.dump(state, file)
+        os.replace(checkpoint + '.tmp', checkpoint)
+    return line
+
+
+def _skip(file: BinaryIO, offset: int) -> None:
+    """Move file forward to the given byte offset, reading through it if it cannot seek."""
+    if file.seekable():
+        file.seek(offset)
+        return
+    while offset > 0:
+        skipped = len(file.read(min(offset, 1 << 20)))
+        if skipped == 0:
+            return
+        offset -= skipped
+
+
+def _report(progress: TextIO, lines: int, seconds: float) -> None:
+    """Write the number of lines written and the throughput to progress."""
+    progress.write(f'{lines} lines in {seconds:.1f}s ({lines / max(seconds, 1e-9):.0f} lines/s)\n')
+    progress.flush()
+
+
+def _attach_graph(songs_file: str, snapshot_file: Optional[str]) -> None:
+    """Load the graph of a new worker process, unless it was inherited from its parent."""
+    if 'graph' not in _worker_graph:
+        from main import load_graph
+
+        _worker_graph['graph'] = load_graph(songs_file, snapshot_file=snapshot_file)
+
+
+def _recommend_lines(first_line: int, lines: list[bytes], limit: int) -> str:
+    """Return the output lines for the given input lines, using the graph of this worker process."""
+    return recommend_lines(_worker_graph['graph'], first_line, lines, limit)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """Run the batch job described by the command line arguments argv."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Write recommendations for lists of seed songs as JSON lines.')
+    parser.add_argument('--songs', default='data/spotify_songs_smaller.csv')
+    parser.add_argument('--snapshot', help='the snapshot file to load the graph from, or save it to')
+    parser.add_argument('--input', default='-', help='the file of seed song lists, or - for stdin')
+    parser.add_argument('--output', default='-', help='the file to write to, or - for stdout')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--limit', type=int, default=5)
+    parser.add_argument('--resume', action='store_true', help='continue after the last chunk written')
+    args = parser.parse_args(argv)
+
+    if args.resume and args.output == '-':
+        parser.error('--resume needs --output')
+    input_file = sys.stdin.buffer if args.input == '-' else open(args.input, 'rb')
+    checkpoint = None if args.output == '-' else args.output + '.checkpoint'
+    if args.output == '-':
+        output_file = sys.stdout
+    else:
+        mode = 'r+' if args.resume and os.path.exists(args.output) and os.path.exists(checkpoint) else 'w'
+        output_file = open(args.output, mode, encoding='utf-8')
+
+    try:
+        run_batch((args.songs, args.snapshot), input_file, output_file, args.workers, args.chunk_size, args.limit,
+                  checkpoint, args.resume, sys.stderr)
+    finally:
+        if input_file is not sys.stdin.buffer:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+    if checkpoint is not None and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+
+if __name__ == '__main__':
+    main()
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['argparse', 'collections', 'json', 'multiprocessing', 'os', 'sys', 'time', 'main',
+                          'recommender', 'snapshot'],
+        'allowed-io': ['run_batch', '_commit', '_report', 'main'],
+        'max-line-length': 120
+    })
@@ -0,0 +1,369 @@
+"""CSC111 Winter 2025 Project: Spotify Song Recommendation System
+
+This Python module contains the benchmark suite of the recommendation system: a generator
+of synthetic song catalogs in the format of data/spotify_songs_*.csv, and a harness that
+times the hot paths on them and compares the results with a stored baseline.
+
+Run it from the project directory, for example:
+
+    python benchmark.py --sizes 1000 10000 --output benchmark.json --baseline data/benchmark_baseline.json
+
+It exits with status 1 if a metric regressed by more than the tolerance. With --precisions,
+it instead compares the precisions the direct vector search can store feature vectors in:
+
+    python benchmark.py --sizes 1000000 --precisions --queries 100
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of students
+taking CSC111 at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult our Course Syllabus.
+
+This file is Copyright (c) 2025 Cindy Yang, Kate Shen, Kristen Wong, Sara Kopilovic.
+"""
+from __future__ import annotations
+import csv
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from typing import Optional
+
+import numpy as np
+
+from instrumentation import Metrics
+
+BENCHMARK_VERSION = 1
+
+# The columns of the song catalogs, in order
+CATALOG_COLUMNS = ['track_id', 'artists', 'album_name', 'track_name', 'popularity', 'duration_ms', 'explicit',
+                   'danceability', 'energy', 'key', 'loudness', 'mode', 'speechiness', 'acousticness',
+                   'instrumentalness', 'liveness', 'valence', 'tempo', 'time_signature', 'track_genre']
+
+# The (a, b) parameters of the beta distribution of every feature between 0 and 1, and the
+# fraction of songs where it is exactly 0, fitted to data/spotify_songs_small.csv
+_BETA_FEATURES = {
+    'danceability': (3.80, 3.53, 0.0),
+    'energy': (1.43, 0.90, 0.0),
+    'speechiness': (0.87, 12.09, 0.0),
+    'acousticness': (0.31, 0.58, 0.13),
+    'instrumentalness': (0.07, 0.29, 0.56),
+    'liveness': (0.83, 3.24, 0.0),
+    'valence': (1.10, 1.27, 0.0)
+}
+
+# The genres songs are drawn from; every genre shifts the features of its songs differently
+_GENRES = ['acoustic', 'afrobeat', 'alt-rock', 'alternative', 'ambient', 'anime', 'black-metal', 'bluegrass',
+           'blues', 'brazil', 'breakbeat', 'british', 'cantopop', 'chicago-house', 'children', 'chill',
+           'classical', 'club', 'comedy', 'country', 'dance', 'dancehall', 'death-metal', 'deep-house',
+           'disco', 'disney', 'drum-and-bass', 'dub', 'dubstep', 'edm', 'electro', 'electronic', 'emo',
+           'folk', 'forro', 'french', 'funk', 'garage', 'german', 'gospel', 'goth', 'grindcore', 'groove',
+           'grunge', 'guitar', 'happy', 'hard-rock', 'hardcore', 'hip-hop', 'honky-tonk', 'house', 'indie',
+           'industrial', 'j-pop', 'jazz', 'k-pop', 'latin', 'metal', 'opera', 'piano', 'pop', 'punk', 'r-n-b',
+           'reggae', 'rock', 'salsa', 'samba', 'sleep', 'soul', 'study', 'tango', 'techno', 'trance', 'world-music']
+
+# The words titles, artists and albums are made of
+_WORDS = ['love', 'night', 'heart', 'fire', 'dream', 'rain', 'summer', 'home', 'light', 'dance', 'blue', 'gold',
+          'wild', 'river', 'moon', 'sun', 'city', 'road', 'girl', 'boy', 'time', 'stars', 'ocean', 'shadow',
+          'silver', 'storm', 'sweet', 'lonely', 'electric', 'golden', 'broken', 'angel', 'ghost', 'paradise',
+          'forever', 'midnight', 'tonight', 'yesterday', 'tomorrow', 'sky', 'wind', 'snow', 'winter', 'spring',
+          'morning', 'echo', 'mirror', 'velvet', 'crystal', 'diamond', 'paper', 'stone', 'glass', 'neon',
+          'desert', 'island', 'garden', 'highway', 'thunder', 'secret', 'magic', 'fever', 'holy', 'crazy',
+          'young', 'free', 'lost', 'hollow', 'bright', 'dark', 'cold', 'warm', 'slow', 'fast', 'happy', 'sad',
+          'red', 'green', 'black', 'white', 'honey', 'sugar', 'cherry', 'lemon', 'rose', 'lily', 'wolf',
+          'tiger', 'bird', 'horse', 'king', 'queen', 'prince', 'soldier', 'sailor', 'stranger', 'lover',
+          'friend', 'mother', 'father', 'baby', 'radio', 'television', 'machine', 'rocket', 'satellite']
+
+# The fraction of songs that reuse the title of an earlier song, as in the bundled catalog
+_DUPLICATE_TITLE_FRACTION = 0.12
+
+# The metrics compared with the baseline, all of which are better when lower
+COMPARED_METRICS = ['load_graph_seconds', 'find_song_id_us', 'recommend_songs_p50_us', 'recommend_songs_p99_us',
+                    'generate_random_song_list_us', 'peak_rss_mb', 'allocated_peak_mb']
+
+
+def generate_catalog(path: str, rows: int, seed: int = 111) -> None:
+    """Write a synthetic song catalog with the given number of rows to path.
+
+    The features follow distributions fitted to the bundled catalog, shifted per genre so
+    that similar songs cluster, and some titles are reused by several songs. The same seed
+    always produces the same file.
+    """
+    rng = np.random.default_rng(seed)
+    names = random.Random(seed)
+    genres = rng.integers(0, len(_GENRES), rows)
+    genre_shift = rng.normal(0.0, 0.6, (len(_GENRES), len(_BETA_FEATURES) + 2))
+
+    columns = {}
+    for f, (feature, (a, b, zero_fraction)) in enumerate(_BETA_FEATURES.items()):
+        # Shift the beta distribution's parameters in log space, per genre
+        scale = np.exp(genre_shift[genres, f])
+        values = rng.beta(a * scale, b / scale)
+        values[rng.random(rows) < zero_fraction] = 0.0
+        columns[feature] = np.round(values, 4)
+    columns['tempo'] = np.round(np.clip(rng.normal(121.3 + 15 * genre_shift[genres, -2], 28.0), 0, 243), 3)
+    columns['loudness'] = np.round(np.clip(-rng.gamma(2.7, 3.3, rows) + 2 * genre_shift[genres, -1], -45, 1), 3)
+    columns['popularity'] = np.clip(rng.normal(34.2, 21.9, rows), 0, 100).astype(int)
+    columns['duration_ms'] = np.clip(rng.lognormal(12.33, 0.37, rows), 30000, 1500000).astype(int)
+    columns['explicit'] = np.where(rng.random(rows) < 0.06, 'TRUE', 'FALSE')
+    columns['key'] = rng.integers(0, 12, rows)
+    columns['mode'] = (rng.random(rows) < 0.655).astype(int)
+    columns['time_signature'] = rng.choice([3, 4, 5, 1], rows, p=[0.095, 0.882, 0.013, 0.010])
+
+    # Larger catalogs get longer titles, so that the share of reused titles stays about the same
+    extra_words = max(0, math.ceil(math.log(rows / 10000, 20))) if rows > 10000 else 0
+    titles = []
+    artists = [_title(names, 2) for _ in range(max(1, rows // 8))]
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(CATALOG_COLUMNS)
+        for i in range(rows):
+            if titles and names.random() < _DUPLICATE_TITLE_FRACTION:
+                title = names.choice(titles)
+            else:
+                title = _title(names, names.choice([2, 2, 3, 3, 4]) + extra_words)
+                titles.append(title)
+            artist = artists[int(len(artists) * names.random() ** 2)]
+            track_id = ''.join(names.choice('0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz')
+                               for _ in range(22))
+            writer.writerow([track_id, artist, _title(names, 2), title]
+                            + [columns[column][i] for column in CATALOG_COLUMNS[4:19]] + [_GENRES[genres[i]]])
+
+
+def _title(names: random.Random, words: int) -> str:
+    """Return a title of the given number of random words."""
+    return ' '.join(names.choice(_WORDS) for _ in range(words)).title()
+
+
+def catalog_path(rows: int, seed: int, directory: str = 'data/synthetic') -> str:
+    """Return the path of the synthetic catalog with the given rows and seed, generating it
+    if it does not exist yet.
+    """
+    path = os.path.join(directory, f'spotify_songs_{rows}_{seed}.csv')
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        generate_catalog(path + '.tmp', rows, seed)
+        os.replace(path + '.tmp', path)
+    return path
+
+
+def benchmark_catalog(path: str, exact_limit: int = 50000, allocation_limit: int = 100000,
+                      queries: int = 2000, seed: int = 111) -> dict:
+    """Return the metrics of the hot paths of the recommendation system on the catalog at path.
+
+    Graphs of more than exact_limit songs are built with the approximate nearest-neighbour
+    index instead of comparing every pair. Allocations are traced in a second build, skipped
+    for catalogs of more than allocation_limit songs. Run this in a fresh process, since the
+    peak resident set size covers the whole process.
+    """
+    from main import generate_random_song_list, load_graph, read_songs
+    from neighbour_index import RandomProjectionForest
+
+    rows = sum(1 for _ in read_songs(path))
+    index = RandomProjectionForest(8, 64) if rows > exact_limit else None
+    metrics = {'rows': rows, 'build': 'exact' if index is None else 'forest'}
+
+    start = time.perf_counter()
+    graph = load_graph(path, index)
+    metrics['load_graph_seconds'] = time.perf_counter() - start
+    items, indptr, _, _ = graph.to_csr()
+    metrics['edges'] = int(indptr[-1])
+
+    rng = random.Random(seed)
+    names = [graph.get_vertex(rng.choice(items)).metadata['track_name'] for _ in range(queries)]
+    lookups = [name if i % 4 == 0 else name.upper() if i % 4 == 1 else f' {name.lower()} ' if i % 4 == 2
+               else f'missing {name}' for i, name in enumerate(names)]
+    start = time.perf_counter()
+    for name in lookups:
+        graph.find_song_id(name)
+    metrics['find_song_id_us'] = (time.perf_counter() - start) / len(lookups) * 1e6
+
+    latencies = []
+    for _ in range(queries):
+        seeds = rng.sample(items, 3)
+        start = time.perf_counter()
+        graph.recommend_songs(seeds, 5)
+        latencies.append(time.perf_counter() - start)
+    metrics['recommend_songs_p50_us'] = float(np.percentile(latencies, 50)) * 1e6
+    metrics['recommend_songs_p99_us'] = float(np.percentile(latencies, 99)) * 1e6
+
+    calls = max(1, queries // 20)
+    start = time.perf_counter()
+    for _ in range(calls):
+        generate_random_song_list(graph)
+    metrics['generate_random_song_list_us'] = (time.perf_counter() - start) / calls * 1e6
+
+    metrics['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    if rows <= allocation_limit:
+        del graph
+        tracemalloc.start()
+        graph = load_graph(path, index)
+        metrics['allocated_peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        metrics['allocated_mb'] = tracemalloc.get_traced_memory()[0] / 2 ** 20
+        tracemalloc.stop()
+    return metrics
+
+
+def benchmark_precisions(path: str, queries: int = 100, seed: int = 111, limit: int = 10) -> list[dict]:
+    """Return the memory, speed and accuracy of the direct vector search on the catalog at path
+    with its feature vectors stored in every precision of vector_search.PRECISIONS.
+
+    Every precision answers the same queries of 3 random seed songs. Their answers are compared
+    with every song ranked by its exact score, computed like the similarity scores of a
+    WeightedGraph by VectorSearch.exact_scores: agreement is the fraction of queries answered
+    exactly like that ranking, and scan_recall the fraction of its top limit songs that are
+    among the top limit songs by the scores of the stored vectors alone, before rescoring.
+    """
+    from main import read_songs
+    from recommender import normalized_features
+    from vector_search import PRECISIONS, VectorSearch
+
+    metadatas = list(read_songs(path))
+    features, magnitudes = normalized_features(metadatas)
+    popularity = np.array([metadata['popularity'] for metadata in metadatas])
+    rng = random.Random(seed)
+    seed_lists = [rng.sample(range(len(metadatas)), 3) for _ in range(queries)]
+
+    exact_search = VectorSearch(features, magnitudes, popularity)
+    expected = []
+    for seeds in seed_lists:
+        scores = exact_search.exact_scores(seeds, np.arange(len(metadatas)))
+        scores[seeds] = -np.inf
+        expected.append(np.lexsort((np.arange(len(metadatas)), -popularity, -scores))[:limit])
+
+    results = []
+    for precision in PRECISIONS:
+        start = time.perf_counter()
+        search = VectorSearch(features, magnitudes, popularity, precision)
+        entry = {'rows': len(metadatas), 'precision': precision, 'build_seconds': time.perf_counter() - start,
+                 'scan_bytes_per_song': search.memory_usage() / len(metadatas)}
+
+        metrics, latencies, agreed, recalled = Metrics(), [], 0, 0
+        for seeds, best in zip(seed_lists, expected):
+            start = time.perf_counter()
+            rows, _ = search.search(seeds, limit, metrics=metrics)
+            latencies.append(time.perf_counter() - start)
+            agreed += np.array_equal(rows, best)
+
+            approximate = search.approximate_scores(seeds)
+            approximate[seeds] = -np.inf
+            recalled += len(np.intersect1d(np.argpartition(-approximate, limit)[:limit], best))
+
+        entry['search_p50_ms'] = float(np.percentile(latencies, 50)) * 1000
+        entry['search_p99_ms'] = float(np.percentile(latencies, 99)) * 1000
+        entry['candidates_rescored'] = metrics.counters['candidates_rescored'] / queries
+        entry['agreement'] = agreed / queries
+        entry['scan_recall'] = recalled / (queries * limit)
+        results.append(entry)
+    return results
+
+
+def run_benchmarks(sizes: list[int], seed: int = 111, exact_limit: int = 50000,
+                   allocation_limit: int = 100000, queries: int = 2000) -> dict:
+    """Return the benchmark results on synthetic catalogs of every size in sizes, each measured
+    in a fresh process, along with a description of this machine.
+    """
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for rows in sizes:
+        path = catalog_path(rows, seed)
+        with context.Pool(1) as pool:
+            metrics = pool.apply(benchmark_catalog, (path, exact_limit, allocation_limit, queries, seed))
+        metrics['size'] = rows
+        results.append(metrics)
+
+    return {
+        'version': BENCHMARK_VERSION,
+        'seed': seed,
+        'machine': {'python': platform.python_version(), 'numpy': np.__version__,
+                    'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'results': results
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.25) -> list[str]:
+    """Return a description of every metric of results that is more than tolerance worse than
+    the same metric for the same catalog size in baseline.
+    """
+    baseline_sizes = {entry['size']: entry for entry in baseline['results']}
+    regressions = []
+    for entry in results['results']:
+        expected = baseline_sizes.get(entry['size'])
+        if expected is None:
+            continue
+        for metric in COMPARED_METRICS:
+            if metric in entry and metric in expected and entry[metric] > expected[metric] * (1 + tolerance):
+                regressions.append(f"{entry['size']} rows: {metric} {entry[metric]:.4g} "
+                                   f"(baseline {expected[metric]:.4g}, +{entry[metric] / expected[metric] - 1:.0%})")
+    return regressions
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Run the benchmarks as described by the command line arguments argv, print the results
+    and any regressions, and return the exit status.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the recommendation system on synthetic catalogs.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--seed', type=int, default=111)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--exact-limit', type=int, default=50000)
+    parser.add_argument('--allocation-limit', type=int, default=100000)
+    parser.add_argument('--output', help='the file to write the results to, as JSON')
+    parser.add_argument('--baseline', help='the results to compare with, as JSON')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--update-baseline', action='store_true', help='write the results to the baseline file')
+    parser.add_argument('--precisions', action='store_true',
+                        help='compare the precisions of the direct vector search instead')
+    args = parser.parse_args(argv)
+
+    if args.precisions:
+        for rows in args.sizes:
+            for entry in benchmark_precisions(catalog_path(rows, args.seed), args.queries, args.seed):
+                print(json.dumps(entry))
+        return 0
+
+    results = run_benchmarks(args.sizes, args.seed, args.exact_limit, args.allocation_limit, args.queries)
+    for entry in results['results']:
+        print(json.dumps(entry))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline and args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+    elif args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print('REGRESSION', regression)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    status = main()
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['argparse', 'csv', 'json', 'math', 'multiprocessing', 'os', 'platform', 'random', 'resource',
+                          'sys', 'time', 'tracemalloc', 'numpy', 'instrumentation', 'main', 'neighbour_index',
+                          'recommender', 'vector_search'],
+        'allowed-io': ['generate_catalog', 'main'],
+        'max-line-length': 120
+    })
+
+    sys.exit(status)
@@ -0,0 +1,325 @@
+"""CSC111 Winter 2025 Project: Spotify Song Recommendation System
+
+This Python module contains the instrumentation of the recommendation system: timers and
+counters for the stages of building the graph and answering queries, the sinks they are
+reported to, and an opt-in profiler for a single build or query.
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of students
+taking CSC111 at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult our Course Syllabus.
+
+This file is Copyright (c) 2025 Cindy Yang, Kate Shen, Kristen Wong, Sara Kopilovic.
+"""
+from __future__ import annotations
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import time
+import tracemalloc
+from contextlib import nullcontext
+from typing import Any, Optional, TextIO
+
+# The context manager used in place of a stage timer when instrumentation is disabled
+DISABLED = nullcontext()
+
+# The profiling modes supported by Metrics.profile_next
+PROFILE_MODES = ('cprofile', 'tracemalloc')
+
+
+class Metrics:
+    """The timers and counters of the instrumented operations of the recommendation system.
+
+    An operation, such as load_graph or recommend_songs, is made of named stages. Each stage
+    adds its time to a timer, and the operation can increase named counters. When a top-level
+    operation finishes, a record of its time, stages and counters is emitted to every sink,
+    and the totals over all operations are kept in timers and counters.
+
+    Instance Attributes:
+        - sinks: The objects that every operation record is emitted to; see MemorySink.
+        - operations: The number of times every operation finished.
+        - timers: The total seconds spent in every stage and operation.
+        - counters: The total of every counter.
+
+    Private Instance Attributes:
+        - _current: The record of the operation in progress, or None if there is none.
+        - _profile_mode: The profiler to run during the next operation, if any.
+
+    Representation Invariants:
+        - self._profile_mode is None or self._profile_mode in PROFILE_MODES
+    """
+    sinks: list
+    operations: dict[str, int]
+    timers: dict[str, float]
+    counters: dict[str, int]
+    _current: Optional[dict]
+    _profile_mode: Optional[str]
+
+    def __init__(self, sinks: Optional[list] = None) -> None:
+        self.sinks = [] if sinks is None else sinks
+        self.operations = {}
+        self.timers = {}
+        self.counters = {}
+        self._current = None
+        self._profile_mode = None
+
+    def count(self, name: str, amount: int = 1) -> None:
+        """Increase the counter with the given name by amount."""
+        self.counters[name] = self.counters.get(name, 0) + amount
+        if self._current is not None:
+            counters = self._current['counters']
+            counters[name] = counters.get(name, 0) + amount
+
+    def add_time(self, name: str, seconds: float) -> None:
+        """Add seconds to the timer of the stage with the given name."""
+        self.timers[name] = self.timers.get(name, 0.0) + seconds
+        if self._current is not None:
+            stages = self._current['stages']
+            stages[name] = stages.get(name, 0.0) + seconds
+
+    def stage(self, name: str) -> _Stage:
+        """Return a context manager that times the stage with the given name."""
+        return _Stage(self, name)
+
+    def operation(self, name: str) -> _Stage | _Operation:
+        """Return a context manager that records the operation with the given name.
+
+        An operation started inside another one is timed as a stage of the outer operation.
+        """
+        if self._current is not None:
+            return _Stage(self, name)
+        return _Operation(self, name)
+
+    def profile_next(self, mode: str = 'cprofile') -> None:
+        """Profile the next top-level operation with cProfile or tracemalloc, and include the
+        report in its record under 'profile'.
+
+        Raise a ValueError if mode is not in PROFILE_MODES.
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError
+        self._profile_mode = mode
+
+    def snapshot(self) -> dict:
+        """Return a copy of the totals of these metrics."""
+        return {'operations': dict(self.operations), 'timers': dict(self.timers), 'counters': dict(self.counters)}
+
+    def reset(self) -> None:
+        """Reset every total of these metrics to zero."""
+        self.operations.clear()
+        self.timers.clear()
+        self.counters.clear()
+
+
+class _Stage:
+    """A context manager adding the time spent inside it to a stage timer of a Metrics."""
+    _metrics: Metrics
+    _name: str
+    _start: float
+
+    def __init__(self, metrics: Metrics, name: str) -> None:
+        self._metrics = metrics
+        self._name = name
+        self._start = 0.0
+
+    def __enter__(self) -> _Stage:
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._metrics.add_time(self._name, time.perf_counter() - self._start)
+
+
+class _Operation:
+    """A context manager recording a top-level operation of a Metrics, profiling it if asked to."""
+    _metrics: Metrics
+    _name: str
+    _start: float
+    _profiler: Optional[cProfile.Profile]
+    _tracing: bool
+
+    def __init__(self, metrics: Metrics, name: str) -> None:
+        self._metrics = metrics
+        self._name = name
+        self._start = 0.0
+        self._profiler = None
+        self._tracing = False
+
+    def __enter__(self) -> _Operation:
+        metrics = self._metrics
+        metrics._current = {'operation': self._name, 'time': time.time(), 'seconds': 0.0,
+                            'stages': {}, 'counters': {}}
+        if metrics._profile_mode == 'cprofile':
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif metrics._profile_mode == 'tracemalloc' and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        metrics._profile_mode = None
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        seconds = time.perf_counter() - self._start
+        metrics, record = self._metrics, self._metrics._current
+        if self._profiler is not None:
+            self._profiler.disable()
+            record['profile'] = _cprofile_report(self._profiler)
+        elif self._tracing:
+            record['profile'] = _tracemalloc_report(tracemalloc.take_snapshot(), tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+        record['seconds'] = seconds
+        metrics._current = None
+        metrics.operations[self._name] = metrics.operations.get(self._name, 0) + 1
+        metrics.timers[self._name] = metrics.timers.get(self._name, 0.0) + seconds
+        for sink in metrics.sinks:
+            sink.emit(record)
+
+
+def _cprofile_report(profiler: cProfile.Profile, limit: int = 25) -> str:
+    """Return the limit functions of the profile with the most cumulative time, as text."""
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(limit)
+    return output.getvalue()
+
+
+def _tracemalloc_report(snapshot: tracemalloc.Snapshot, peak: int, limit: int = 25) -> str:
+    """Return the peak traced memory and the limit lines that allocated the most memory still
+    held at the end of the snapshot, as text.
+    """
+    lines = [f'peak traced memory: {peak / 2 ** 20:.1f} MiB']
+    for statistic in snapshot.statistics('lineno')[:limit]:
+        lines.append(str(statistic))
+    return '\n'.join(lines) + '\n'
+
+
+class MemorySink:
+    """A sink keeping every operation record in a list.
+
+    Instance Attributes:
+        - records: The records emitted to this sink, oldest first.
+        - max_records: The number of most recent records kept, or None to keep all of them.
+    """
+    records: list[dict]
+    max_records: Optional[int]
+
+    def __init__(self, max_records: Optional[int] = None) -> None:
+        self.records = []
+        self.max_records = max_records
+
+    def emit(self, record: dict) -> None:
+        """Keep the given operation record."""
+        self.records.append(record)
+        if self.max_records is not None and len(self.records) > self.max_records:
+            del self.records[:len(self.records) - self.max_records]
+
+
+class JsonLinesSink:
+    """A sink writing every operation record as a line of JSON.
+
+    Instance Attributes:
+        - file: The open text file the records are written to.
+    """
+    file: TextIO
+
+    def __init__(self, file: str | TextIO) -> None:
+        """Initialize a sink appending to the file at the given path, or writing to the given open file."""
+        self.file = open(file, 'a', encoding='utf-8') if isinstance(file, str) else file
+
+    def emit(self, record: dict) -> None:
+        """Write the given operation record to the file."""
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+    def close(self) -> None:
+        """Close the file."""
+        self.file.close()
+
+
+class PrometheusSink:
+    """A sink keeping the totals of the operation records it receives, which it can dump in the
+    Prometheus text exposition format.
+
+    Instance Attributes:
+        - prefix: The prefix of every metric name.
+        - metrics: The totals of the records emitted to this sink.
+    """
+    prefix: str
+    metrics: Metrics
+
+    def __init__(self, prefix: str = 'recommender') -> None:
+        self.prefix = prefix
+        self.metrics = Metrics()
+
+    def emit(self, record: dict) -> None:
+        """Add the given operation record to the totals."""
+        for name, seconds in record['stages'].items():
+            self.metrics.add_time(name, seconds)
+        for name, amount in record['counters'].items():
+            self.metrics.count(name, amount)
+        name = record['operation']
+        self.metrics.operations[name] = self.metrics.operations.get(name, 0) + 1
+        self.metrics.add_time(name, record['seconds'])
+
+    def text(self) -> str:
+        """Return the totals in the Prometheus text exposition format."""
+        return prometheus_text(self.metrics.snapshot(), self.prefix)
+
+    def dump(self, path: str) -> None:
+        """Replace the file at the given path with the totals in the Prometheus text exposition format."""
+        with open(path + '.tmp', 'w', encoding='utf-8') as file:
+            file.write(self.text())
+        os.replace(path + '.tmp', path)
+
+
+def prometheus_text(snapshot: dict, prefix: str = 'recommender') -> str:
+    """Return the totals in snapshot, as returned by Metrics.snapshot, in the Prometheus text
+    exposition format.
+
+    >>> print(prometheus_text({'operations': {'load_graph': 1}, 'timers': {'load_graph': 2.5},
+    ...                        'counters': {'rows_skipped': 3}}), end='')
+    # TYPE recommender_operations_total counter
+    recommender_operations_total{operation="load_graph"} 1
+    # TYPE recommender_stage_seconds_total counter
+    recommender_stage_seconds_total{stage="load_graph"} 2.5
+    # TYPE recommender_rows_skipped_total counter
+    recommender_rows_skipped_total 3
+    """
+    lines = [f'# TYPE {prefix}_operations_total counter']
+    for name, calls in sorted(snapshot['operations'].items()):
+        lines.append(f'{prefix}_operations_total{{operation="{_label(name)}"}} {calls}')
+    lines.append(f'# TYPE {prefix}_stage_seconds_total counter')
+    for name, seconds in sorted(snapshot['timers'].items()):
+        lines.append(f'{prefix}_stage_seconds_total{{stage="{_label(name)}"}} {seconds!r}')
+    for name, amount in sorted(snapshot['counters'].items()):
+        metric = f"{prefix}_{re.sub('[^a-zA-Z0-9_]', '_', name)}_total"
+        lines.append(f'# TYPE {metric} counter')
+        lines.append(f'{metric} {amount}')
+    return '\n'.join(lines) + '\n'
+
+
+def _label(value: str) -> str:
+    """Return value escaped for use as a Prometheus label value."""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['cProfile', 'contextlib', 'io', 'json', 'os', 'pstats', 're', 'time', 'tracemalloc'],
+        'allowed-io': ['JsonLinesSink.__init__', 'PrometheusSink.dump'],
+        'max-line-length': 120
+    })
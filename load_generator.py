@@ -0,0 +1,151 @@
+"""CSC111 Winter 2025 Project: Spotify Song Recommendation System
+
+This Python module contains a load generator for the recommendation server in server.py.
+It opens several connections, pipelines recommendation requests on each of them, and
+reports the throughput and latency of the server.
+
+With the server running, for example:
+
+    python load_generator.py --port 8765 --connections 16 --requests 20000 --depth 32
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of students
+taking CSC111 at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult our Course Syllabus.
+
+This file is Copyright (c) 2025 Cindy Yang, Kate Shen, Kristen Wong, Sara Kopilovic.
+"""
+from __future__ import annotations
+import asyncio
+import json
+import random
+import time
+from typing import Any, Optional
+
+import numpy as np
+
+
+async def open_connection(host: str = '127.0.0.1', port: int = 8765,
+                          path: Optional[str] = None) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """Open a connection to the server on the given TCP host and port, or on the Unix socket at
+    path if it is given.
+    """
+    if path is not None:
+        return await asyncio.open_unix_connection(path, limit=1 << 20)
+    return await asyncio.open_connection(host, port, limit=1 << 20)
+
+
+async def request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, message: dict) -> Any:
+    """Send a single request on the given connection and return its result.
+
+    Raise a RuntimeError if the server answers with an error.
+    """
+    writer.write((json.dumps(message) + '\n').encode('utf-8'))
+    await writer.drain()
+    response = json.loads(await reader.readline())
+    if not response['ok']:
+        raise RuntimeError(response['error'])
+    return response['result']
+
+
+async def run_load(host: str = '127.0.0.1', port: int = 8765, path: Optional[str] = None,
+                   connections: int = 8, requests: int = 10000, depth: int = 16, seeds: int = 3,
+                   limit: int = 5, seed: int = 111) -> dict:
+    """Send requests recommendation requests to the server, spread over the given number of
+    connections with up to depth requests in flight on each, and return the throughput and
+    latency of the server along with its stats.
+
+    Every request asks for limit recommendations for seeds songs sampled from the server.
+    """
+    reader, writer = await open_connection(host, port, path)
+    songs = await request(reader, writer, {'op': 'sample', 'count': 100})
+    rng = random.Random(seed)
+
+    shares = [requests // connections + (i < requests % connections) for i in range(connections)]
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(*(_drive_connection(host, port, path, share, depth, songs, seeds, limit,
+                                                        random.Random(rng.random()))
+                                      for share in shares))
+    seconds = time.perf_counter() - start
+
+    stats = await request(reader, writer, {'op': 'stats'})
+    writer.close()
+    latencies = [latency for connection_latencies, _ in outcomes for latency in connection_latencies]
+    p50, p99 = np.percentile(latencies, [50, 99]) if latencies else (0.0, 0.0)
+    return {
+        'requests': requests,
+        'errors': sum(errors for _, errors in outcomes),
+        'seconds': seconds,
+        'throughput': requests / seconds,
+        'latency_p50_ms': float(p50) * 1000,
+        'latency_p99_ms': float(p99) * 1000,
+        'server': stats
+    }
+
+
+async def _drive_connection(host: str, port: int, path: Optional[str], count: int, depth: int,
+                            songs: list[str], seeds: int, limit: int,
+                            rng: random.Random) -> tuple[list[float], int]:
+    """Send count recommendation requests on a new connection, with up to depth in flight, and
+    return the latency of every request and the number of error responses.
+    """
+    reader, writer = await open_connection(host, port, path)
+    in_flight = asyncio.Semaphore(depth)
+    sent_at = []
+
+    async def send() -> None:
+        for i in range(count):
+            await in_flight.acquire()
+            message = {'id': i, 'op': 'recommend', 'songs': rng.sample(songs, min(seeds, len(songs))),
+                       'limit': limit}
+            sent_at.append(time.perf_counter())
+            writer.write((json.dumps(message) + '\n').encode('utf-8'))
+            await writer.drain()
+
+    sender = asyncio.create_task(send())
+    latencies, errors = [], 0
+    for i in range(count):
+        response = json.loads(await reader.readline())
+        latencies.append(time.perf_counter() - sent_at[i])
+        errors += not response['ok']
+        in_flight.release()
+
+    await sender
+    writer.close()
+    return latencies, errors
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """Run the load described by the command line arguments argv and print the report."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Measure the throughput and latency of the recommendation server.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='the Unix socket of the server instead of TCP')
+    parser.add_argument('--connections', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--depth', type=int, default=16, help='the requests in flight on every connection')
+    parser.add_argument('--seeds', type=int, default=3)
+    parser.add_argument('--limit', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_load(args.host, args.port, args.unix, args.connections, args.requests, args.depth,
+                                  args.seeds, args.limit))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['argparse', 'asyncio', 'json', 'random', 'time', 'numpy'],
+        'allowed-io': ['main'],
+        'max-line-length': 120
+    })
@@ -17,16 +17,26 @@ from __future__ import annotations
 
 import csv
 import random
+import time
 import webbrowser
+from typing import Callable, Iterator, Optional
+
 import pygame
+from background_loader import BackgroundLoader
+from instrumentation import DISABLED, Metrics
+from neighbour_index import RandomProjectionForest
+from parallel_build import ParallelBuilder
 from recommender import WeightedGraph
+from rendering import FrameScheduler, TextCache
+from sharding import ShardedGraph, assign_shards, build_sharded_graph
+from snapshot import SnapshotGraph, load_snapshot, save_snapshot
 
 
-def load_graph(songs_file: str) -> WeightedGraph:
-    """Load song data and build similarity graph."""
-    graph2 = WeightedGraph()
-    songs = []
+def read_songs(songs_file: str, metrics: Optional[Metrics] = None) -> Iterator[dict]:
+    """Yield the metadata of every song in songs_file, skipping rows that cannot be parsed.
 
+    If metrics is given, the rows parsed and skipped are counted there.
+    """
     with open(songs_file, 'r', encoding='utf-8') as file:
         reader = csv.reader(file)
         next(reader)
@@ -34,6 +44,7 @@ def load_graph(songs_file: str) -> WeightedGraph:
         for row in reader:
             try:
                 metadata = {
+                    'track_id': row[0],
                     'track_name': row[3],
                     'artists': row[1],
                     'album_name': row[2],
@@ -44,34 +55,104 @@ def load_graph(songs_file: str) -> WeightedGraph:
                     'tempo': float(row[17]),
                     'loudness': float(row[9]),
                     'acousticness': float(row[11]),
-                    'instrumentalness': float(row[12])
+                    'instrumentalness': float(row[12]),
+                    'duration_ms': int(row[5]),
+                    'explicit': row[6] == 'TRUE',
+                    'track_genre': row[19]
                 }
-                track_name = metadata['track_name']
-                graph2.add_vertex(track_name, metadata)
-                songs.append(track_name)
             except (IndexError, ValueError):
+                if metrics is not None:
+                    metrics.count('rows_skipped')
                 continue
+            if metrics is not None:
+                metrics.count('rows_parsed')
+            yield metadata
+
+
+def load_graph(songs_file: str, index: Optional[RandomProjectionForest] = None,
+               snapshot_file: Optional[str] = None, workers: int = 1, metrics: Optional[Metrics] = None,
+               on_vertices: Optional[Callable[[WeightedGraph | SnapshotGraph | ShardedGraph], None]] = None,
+               shard_by: Optional[str] = None) -> WeightedGraph | SnapshotGraph | ShardedGraph:
+    """Load song data and build similarity graph.
+
+    If index is given, edges are found with that approximate nearest-neighbour index instead of
+    comparing every pair of songs. Otherwise every pair is compared, on the given number of worker
+    processes; the edges do not depend on the number of workers. If snapshot_file is given, the
+    graph is memory-mapped from that snapshot when it is up to date with songs_file; otherwise the
+    graph is built and saved there for the next run.
+
+    If shard_by is 'genre' or 'features', the songs are partitioned into shards by genre or by
+    clusters of their audio features, and a sharding.ShardedGraph is built instead, with the
+    shards built on the given number of worker processes. snapshot_file is then a directory
+    holding a snapshot of every shard, and only the shards whose songs changed are built again.
+
+    If metrics is given, the stages of the build are recorded there as a load_graph operation,
+    and the returned graph records the stages of its queries there too. If on_vertices is
+    given, it is called with the graph as soon as every song is a vertex, before the edges
+    are built.
+    """
+    if metrics is None:
+        return _load_graph(songs_file, index, snapshot_file, workers, None, on_vertices, shard_by)
+    with metrics.operation('load_graph'):
+        graph = _load_graph(songs_file, index, snapshot_file, workers, metrics, on_vertices, shard_by)
+    graph.use_metrics(metrics)
+    return graph
+
+
+def _load_graph(songs_file: str, index: Optional[RandomProjectionForest], snapshot_file: Optional[str],
+                workers: int, metrics: Optional[Metrics],
+                on_vertices: Optional[Callable[[WeightedGraph | SnapshotGraph | ShardedGraph], None]],
+                shard_by: Optional[str] = None) -> WeightedGraph | SnapshotGraph | ShardedGraph:
+    """Load song data and build similarity graph as described by load_graph."""
+    similarity_threshold = 0.3
+    if shard_by is not None:
+        with DISABLED if metrics is None else metrics.stage('parse'):
+            rows = list(read_songs(songs_file, metrics))
+        return build_sharded_graph(rows, assign_shards(rows, shard_by), snapshot_file, similarity_threshold, 20,
+                                   index, workers, metrics=metrics, on_vertices=on_vertices)
+
+    build_settings = {
+        'threshold': similarity_threshold,
+        'top_k': 20,
+        'index': None if index is None else [index.n_trees, index.leaf_size, index.seed],
+        'duplicates': 'first'
+    }
+    if snapshot_file is not None:
+        with DISABLED if metrics is None else metrics.stage('load_snapshot'):
+            snapshot = load_snapshot(snapshot_file, songs_file, build_settings)
+        if snapshot is not None:
+            if on_vertices is not None:
+                on_vertices(snapshot)
+            return snapshot
 
-    for m in range(len(songs)):
-        song1 = songs[m]
-        if song1 not in graph2.get_all_vertices():
-            continue
-
-        similarities = []
-        for j in range(m + 1, len(songs)):
-            song2 = songs[j]
-            if song2 not in graph2.get_all_vertices():
-                continue
-
-            similarity = graph2.get_similarity_score(song1, song2)
-            similarity_threshold = 0.3
-            if similarity > similarity_threshold:
-                similarities.append((song2, similarity))
-
-        # Keep top 20 most similar songs
-        similarities.sort(key=lambda x: -x[1])
-        for song2, similarity in similarities[:20]:
-            graph2.add_edge(song1, song2, similarity)
+    graph2 = WeightedGraph()
+    graph2.use_metrics(metrics)
+    songs = []
+    added = set()
+
+    with DISABLED if metrics is None else metrics.stage('parse'):
+        rows = list(read_songs(songs_file, metrics))
+
+    with DISABLED if metrics is None else metrics.stage('add_vertices'):
+        for metadata in rows:
+            track_id = metadata['track_id']
+            # A song listed again, under another genre, keeps its first row, as in sharding
+            if track_id not in added:
+                added.add(track_id)
+                graph2.add_vertex(track_id, metadata)
+                songs.append(track_id)
+    if on_vertices is not None:
+        on_vertices(graph2)
+
+    # Connect each song to its top 20 most similar later songs above the similarity threshold
+    if index is None and workers > 1:
+        graph2.add_similarity_edges(songs, similarity_threshold, 20, ParallelBuilder(workers))
+    else:
+        graph2.add_similarity_edges(songs, similarity_threshold, 20, index)
+
+    if snapshot_file is not None:
+        with DISABLED if metrics is None else metrics.stage('save_snapshot'):
+            save_snapshot(graph2, snapshot_file, songs_file, build_settings)
 
     return graph2
 
@@ -82,8 +163,9 @@ def get_spotify_search_url(track1: str, artist1: str) -> str:
     return f"https://open.spotify.com/search/{query.replace(' ', '%20')}"
 
 
-def generate_random_song_list(graph1: WeightedGraph, sample_size: int = 7) -> list[tuple[str, str]]:
-    """Generate a new random list of songs from the graph."""
+def generate_random_song_list(graph1: WeightedGraph | SnapshotGraph,
+                              sample_size: int = 7) -> list[tuple[str, str, str]]:
+    """Generate a new random list of songs from the graph, as (track, artist, track_id) tuples."""
     all_vertices = list(graph1.get_all_vertices())
     sample_size = min(sample_size, len(all_vertices))
     random_songs = random.sample(all_vertices, sample_size)
@@ -93,11 +175,47 @@ def generate_random_song_list(graph1: WeightedGraph, sample_size: int = 7) -> li
         vertex = graph1.get_vertex(s)
         if vertex:
             meta = vertex.metadata
-            song_list_.append((meta['track_name'], meta['artists']))
+            song_list_.append((meta['track_name'], meta['artists'], s))
+
+    return song_list_
+
+
+def search_song_list(graph1: WeightedGraph | SnapshotGraph, query: str,
+                     sample_size: int = 7) -> list[tuple[str, str, str]]:
+    """Return the songs of the graph best matching the free-text query, as (track, artist, track_id)
+    tuples.
+    """
+    song_list_ = []
+    for s in graph1.search_songs(query, sample_size):
+        vertex = graph1.get_vertex(s)
+        if vertex:
+            meta = vertex.metadata
+            song_list_.append((meta['track_name'], meta['artists'], s))
 
     return song_list_
 
 
+def loading_message(progress: dict) -> str:
+    """Return the message shown on the home screen for the progress of a background build,
+    as returned by BackgroundLoader.progress.
+
+    >>> loading_message({'stage': 'comparing', 'rows': 1000, 'fraction': 0.25})
+    'Comparing 1000 songs... 25%'
+    """
+    stage, fraction = progress['stage'], progress['fraction']
+    if stage == 'parsing':
+        return f"Loading songs... {progress['rows']} read"
+    elif stage == 'comparing' and fraction is not None:
+        return f"Comparing {progress['rows']} songs... {fraction:.0%}"
+    elif stage == 'comparing':
+        return f"Comparing {progress['rows']} songs..."
+    elif stage == 'linking':
+        return f"Connecting similar songs... {fraction:.0%}"
+    elif stage == 'failed':
+        return "Could not load the songs."
+    return ''
+
+
 def truncate_text(text: str, max_length: int) -> str:
     """Truncate the text to the specified maximum length and append '...' if it exceeds the limit."""
     if len(text) > max_length:
@@ -105,15 +223,21 @@ def truncate_text(text: str, max_length: int) -> str:
     return text
 
 
-if __name__ == '__main__':
-    import doctest
-
-    doctest.testmod()
-    import python_ta
-
-    # pygame setup
-    pygame.init()
-    screen = pygame.display.set_mode((1280, 720))
+def run_app(screen: pygame.Surface, loader: BackgroundLoader, fps: int = 60,
+            events: Callable[[], list[pygame.event.Event]] = pygame.event.get, max_frames: Optional[int] = None,
+            text_cache: Optional[TextCache] = None, full_redraw: bool = False) -> dict:
+    """Run the recommender system in the window screen until it is closed, or for max_frames
+    frames if given, using the graph built by loader, and return the number of frames, the
+    number redrawn, the seconds spent on every frame redrawn, and the hits and misses of the
+    text cache.
+
+    The frame rate is capped at fps, or not at all if it is 0. The events of every frame are
+    read from events. Frames are only redrawn after an event other than a mouse motion, when
+    the mouse moves onto or off a button, or when the loading progress changes, and a change of
+    button only updates that button on the display. If full_redraw is True, every frame is
+    redrawn and updates the whole display instead.
+    """
+    # window state
     current = "home"
     window_y = screen.get_height()
     window_x = screen.get_width()
@@ -122,10 +246,10 @@ if __name__ == '__main__':
     user_input_text = ''
 
     # different fonts
-    TITLE_FONT = pygame.font.Font("Fonts/Audiowide/Audiowide-Regular.ttf", int(window_y * 0.06))
-    SUBTITLE_FONT = pygame.font.Font("Fonts/Audiowide/Audiowide-Regular.ttf", int(window_y * 0.04))
-    PARAGRAPH_FONT = pygame.font.Font("Fonts/MPPLUS Rounded 1c/MPLUSRounded1c-Regular.ttf", int(window_y * 0.03))
-    BIG_PARAGRAPH_FONT = pygame.font.Font("Fonts/MPPLUS Rounded 1c/MPLUSRounded1c-Regular.ttf", int(window_y * 0.04))
+    title_font = pygame.font.Font("Fonts/Audiowide/Audiowide-Regular.ttf", int(window_y * 0.06))
+    subtitle_font = pygame.font.Font("Fonts/Audiowide/Audiowide-Regular.ttf", int(window_y * 0.04))
+    paragraph_font = pygame.font.Font("Fonts/MPPLUS Rounded 1c/MPLUSRounded1c-Regular.ttf", int(window_y * 0.03))
+    big_paragraph_font = pygame.font.Font("Fonts/MPPLUS Rounded 1c/MPLUSRounded1c-Regular.ttf", int(window_y * 0.04))
 
     # button variables
     start_button = None
@@ -141,46 +265,70 @@ if __name__ == '__main__':
     dropdown_menu = []
     listen_menu = []
     limit_menu = []
-    song_names = []
+    song_ids = []
     rec_listen_buttons = []
     limit_selected = [0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
     error_message = False
 
-    # creating graph and randomized song options
-    graph = load_graph('data/spotify_songs_smaller.csv')
-    song_list = generate_random_song_list(graph)
-    dropdown_selected = [0] * len(song_list)
-
-    while running:
-        # getting position of user's mouse
-        mouse = pygame.mouse.get_pos()
+    # the graph built in the background; the song options are picked as soon as its songs are loaded
+    graph = None
+    random_song_list = []
+    song_list = random_song_list
+    dropdown_selected = []
+
+    # frame rate cap, text cache and the parts of the window to redraw
+    frame = FrameScheduler(fps, full_redraw)
+    if text_cache is None:
+        text_cache = TextCache()
+    frame_seconds = []
+    mouse = pygame.mouse.get_pos()
+
+    while running and (max_frames is None or frame.frames < max_frames):
+        frame_start = time.perf_counter()
+
+        # picking the song options once the songs are loaded, and using the graph once its edges are built
+        if not random_song_list and loader.graph is not None:
+            random_song_list = generate_random_song_list(loader.graph)
+            song_list = random_song_list
+            dropdown_selected = [0] * len(song_list)
+        if graph is None and loader.ready:
+            graph = loader.graph
+
+        for event in events():
+            # getting position of user's mouse; anything else redraws the window
+            if event.type == pygame.MOUSEMOTION:
+                mouse = event.pos
+                continue
+            frame.invalidate()
 
-        for event in pygame.event.get():
             # quitting the program
             if event.type == pygame.QUIT:
                 running = False
             # clicking buttons
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 # start button on homepage
-                if start_button and start_button.collidepoint(event.pos) and current == "home":
+                if start_button and start_button.collidepoint(event.pos) and current == "home" and graph:
                     current = "recommender"
                 # button functions in recommender tab
                 elif current == "recommender":
+                    # search box
+                    user_input_active = bool(user_input and user_input.collidepoint(event.pos))
+
                     # song options
                     for option in range(len(dropdown_menu)):
                         if dropdown_menu[option].collidepoint(event.pos):
-                            song_names.append(song_list[option][0])
+                            song_ids.append(song_list[option][2])
                             dropdown_selected[option] += 1
                             error_message = False
                         # spotify listen buttons
                         elif listen_menu[option].collidepoint(event.pos):
-                            track, artist = song_list[option]
+                            track, artist, _ = song_list[option]
                             url = get_spotify_search_url(track, artist)
                             webbrowser.open(url)
 
                     # enter button once songs have been selected
                     if input_enter and input_enter.collidepoint(event.pos):
-                        if not song_names:
+                        if not song_ids:
                             error_message = True
                         else:
                             current = "limit"
@@ -203,7 +351,7 @@ if __name__ == '__main__':
                     if limit_enter and limit_enter.collidepoint(event.pos):
                         # Get recommendations
                         if rec_limit is not None:
-                            recommendations = graph.recommend_songs(song_names, rec_limit)
+                            recommendations = graph.recommend_songs(song_ids, rec_limit)
                             current = "recommendations"
                         else:
                             error_message = True
@@ -212,9 +360,11 @@ if __name__ == '__main__':
                 elif current == "recommendations":
                     # resetting variables when program resets (try again button)
                     if return_button and return_button.collidepoint(event.pos):
-                        song_names = []
+                        song_ids = []
                         rec_limit = None
-                        song_list = generate_random_song_list(graph)
+                        user_input_text = ''
+                        random_song_list = generate_random_song_list(graph)
+                        song_list = random_song_list
                         dropdown_selected = [0] * len(song_list)
                         limit_selected = [0] * 10
                         error_message = False
@@ -227,54 +377,114 @@ if __name__ == '__main__':
                             url = get_spotify_search_url(rec['track'], rec['artist'])
                             webbrowser.open(url)
 
+            # typing in the search box
+            elif event.type == pygame.KEYDOWN and current == "recommender" and user_input_active:
+                if event.key == pygame.K_BACKSPACE:
+                    user_input_text = user_input_text[:-1]
+                elif event.unicode.isprintable():
+                    user_input_text += event.unicode
+
+                # replace the song options with the best matches, keeping selected songs checked
+                if user_input_text.strip():
+                    song_list = search_song_list(graph, user_input_text)
+                else:
+                    song_list = random_song_list
+                dropdown_selected = [int(song[2] in song_ids) for song in song_list]
+                dropdown_menu = []
+                listen_menu = []
+
+        # redrawing only when something changed: an event, the button under the mouse or the loading progress
+        if graph is None:
+            progress = loader.progress()
+            frame.watch((loading_message(progress), progress['fraction'] and int(400 * progress['fraction'])))
+        else:
+            frame.watch(None)
+        if current == "home":
+            frame.hover([start_button], mouse)
+        elif current == "recommender":
+            frame.hover([input_enter] + listen_menu, mouse)
+        elif current == "limit":
+            frame.hover([limit_enter], mouse)
+        else:
+            frame.hover([return_button] + [button for button, _ in rec_listen_buttons], mouse)
+        if not frame.needs_redraw:
+            frame.tick()
+            continue
+
         # fill the screen with a color to delete anything from last frame
         screen.fill("black")
 
         if current == "home":
             # title and start button
-            title = TITLE_FONT.render("Spotify Recommender System", True, (255, 255, 255))
+            title = text_cache.render(title_font, "Spotify Recommender System", True, (255, 255, 255))
             screen.blit(title, (window_x // 2 - window_x * 0.28, window_y // 2 - window_y * 0.1))
             start_button_rect = pygame.Rect(window_x // 2 - window_x * 0.11, window_y // 2, 250, 50)
 
-            # start button colour change
-            if start_button_rect.collidepoint(mouse):
+            # start button colour change, greyed out until the graph is built
+            if graph is None:
+                button_color = (83, 83, 83)  # Disabled color
+            elif start_button_rect.collidepoint(mouse):
                 button_color = (40, 220, 100)  # Hover color
             else:
                 button_color = (29, 185, 84)  # Normal color
 
             # drawing button
             start_button = pygame.draw.rect(screen, button_color, start_button_rect, border_radius=12)
-            start_button_text = SUBTITLE_FONT.render("START", True, (255, 255, 255))
+            start_button_text = text_cache.render(subtitle_font, "START", True, (255, 255, 255))
             screen.blit(start_button_text, (window_x // 2 - window_x * 0.052, window_y // 2 + window_y * 0.008))
 
+            # loading progress and progress bar while the graph is built
+            if graph is None:
+                loading_text = text_cache.render(paragraph_font, loading_message(progress), True, (150, 150, 150))
+                screen.blit(loading_text, (window_x // 2 - loading_text.get_width() // 2, window_y // 2 + 70))
+                if progress['fraction'] is not None:
+                    pygame.draw.rect(screen, (83, 83, 83), (window_x // 2 - 200, window_y // 2 + 115, 400, 8),
+                                     border_radius=4)
+                    pygame.draw.rect(screen, (29, 185, 84),
+                                     (window_x // 2 - 200, window_y // 2 + 115, int(400 * progress['fraction']), 8),
+                                     border_radius=4)
+
         elif current == "recommender":
 
             # error message if song isn't selected
             if error_message:
-                question_text = PARAGRAPH_FONT.render("Please select at least one song.",
-                                                      True,
-                                                      (255, 255, 255))
+                question_text = text_cache.render(paragraph_font, "Please select at least one song.",
+                                                  True,
+                                                  (255, 255, 255))
                 screen.blit(question_text, (40, 60))
 
             # displaying question
-            question_text = SUBTITLE_FONT.render("From the following list below, select some songs that you like.",
-                                                 True,
-                                                 (255, 255, 255))
+            question_text = text_cache.render(subtitle_font,
+                                              "From the following list below, select some songs that you like.",
+                                              True,
+                                              (255, 255, 255))
             screen.blit(question_text, (40, 30))
 
             # enter button
             input_enter_rect = pygame.Rect(window_x // 2 + 300, 640, 250, 50)
             input_enter_color = (40, 220, 100) if input_enter_rect.collidepoint(mouse) else (29, 185, 84)
             input_enter = pygame.draw.rect(screen, input_enter_color, input_enter_rect, border_radius=12)
-            enter_text = SUBTITLE_FONT.render("NEXT", True, (255, 255, 255))
+            enter_text = text_cache.render(subtitle_font, "NEXT", True, (255, 255, 255))
             screen.blit(enter_text, (window_x // 2 + 380, 647))
 
+            # search box
+            user_input_rect = pygame.Rect(40, 640, 820, 50)
+            user_input = pygame.draw.rect(screen, (29, 185, 84) if user_input_active else (255, 255, 255),
+                                          user_input_rect, 1, border_radius=12)
+            if user_input_text:
+                search_text = text_cache.render(paragraph_font, truncate_text(user_input_text, 70), True,
+                                                (255, 255, 255))
+            else:
+                search_text = text_cache.render(paragraph_font, "Search for a song...", True, (150, 150, 150))
+            screen.blit(search_text, (60, 650))
+
             # song options to choose from
-            for i in range(7):
+            for i in range(len(song_list)):
                 # song options
                 dropdown_option = pygame.draw.rect(screen, (255, 255, 255), (40, 100 + (75 * i), 820, 60), 1)
-                dropdown_text = PARAGRAPH_FONT.render(truncate_text(f"{song_list[i][0]} by {song_list[i][1]}", 70),
-                                                      True, (255, 255, 255))
+                dropdown_text = text_cache.render(paragraph_font,
+                                                  truncate_text(f"{song_list[i][0]} by {song_list[i][1]}", 70),
+                                                  True, (255, 255, 255))
                 screen.blit(dropdown_text, (110, 117 + (75 * i)))
 
                 if dropdown_option not in dropdown_menu:
@@ -284,8 +494,8 @@ if __name__ == '__main__':
                 if dropdown_selected[i] % 2 == 0:
                     checkbox_colour = (255, 255, 255)
                     checkbox_width = 1
-                    if song_list[i][0] in song_names:
-                        song_names.remove(song_list[i][0])
+                    if song_list[i][2] in song_ids:
+                        song_ids.remove(song_list[i][2])
                 else:
                     checkbox_colour = (29, 185, 84)
                     checkbox_width = 0
@@ -296,7 +506,7 @@ if __name__ == '__main__':
                 listen_button_rect = pygame.Rect(880, 102 + (75 * i), 360, 50)
                 listen_button_color = (40, 220, 100) if listen_button_rect.collidepoint(mouse) else (29, 185, 84)
                 listen_button = pygame.draw.rect(screen, listen_button_color, listen_button_rect, border_radius=10)
-                listen_button_text = BIG_PARAGRAPH_FONT.render("Listen", True, (255, 255, 255))
+                listen_button_text = text_cache.render(big_paragraph_font, "Listen", True, (255, 255, 255))
                 screen.blit(listen_button_text, (1015, 109 + (75 * i)))
 
                 if listen_button not in listen_menu:
@@ -305,13 +515,14 @@ if __name__ == '__main__':
         elif current == "limit":
             # error message if limit number is not selected
             if error_message:
-                question_text = PARAGRAPH_FONT.render("Please choose a number.",
-                                                      True,
-                                                      (255, 255, 255))
+                question_text = text_cache.render(paragraph_font, "Please choose a number.",
+                                                  True,
+                                                  (255, 255, 255))
                 screen.blit(question_text, (510, 260))
 
-            question_text = SUBTITLE_FONT.render("Choose the number of recommendations you want from 1-10", True,
-                                                 (255, 255, 255))
+            question_text = text_cache.render(subtitle_font,
+                                              "Choose the number of recommendations you want from 1-10", True,
+                                              (255, 255, 255))
             screen.blit(question_text, (160, 230))
 
             for i in range(10):
@@ -326,7 +537,7 @@ if __name__ == '__main__':
                 # drawing limit buttons
                 num_recs = pygame.draw.rect(screen, limit_colour, (70 + (114 * i), window_y // 2 - 50, 100, 100),
                                             limit_width)
-                num_recs_text = SUBTITLE_FONT.render(f"{i + 1}", True, (255, 255, 255))
+                num_recs_text = text_cache.render(subtitle_font, f"{i + 1}", True, (255, 255, 255))
                 # change in position of '10' since it is a wider character
                 if i < 10:
                     screen.blit(num_recs_text, (108 + (114 * i), window_y // 2 - 20))
@@ -340,20 +551,21 @@ if __name__ == '__main__':
             limit_enter_rect = pygame.Rect(window_x // 2 - 125, 460, 250, 50)
             limit_enter_color = (40, 220, 100) if limit_enter_rect.collidepoint(mouse) else (29, 185, 84)
             limit_enter = pygame.draw.rect(screen, limit_enter_color, limit_enter_rect, border_radius=12)
-            limit_enter_text = SUBTITLE_FONT.render("ENTER", True, (255, 255, 255))
+            limit_enter_text = text_cache.render(subtitle_font, "ENTER", True, (255, 255, 255))
             screen.blit(limit_enter_text, (window_x // 2 - 55, 467))
 
         elif current == "recommendations":
-            question_text = TITLE_FONT.render("Song Recommendations:", True,
+            question_text = text_cache.render(title_font, "Song Recommendations:", True,
                                               (255, 255, 255))
             screen.blit(question_text, (80, 100))
 
             rec_listen_buttons = []
 
             for i, rec in enumerate(recommendations, 1):
-                question_text = BIG_PARAGRAPH_FONT.render(truncate_text(f"{i}. {rec['track']} by {rec['artist']}", 70),
-                                                          True,
-                                                          (255, 255, 255))
+                question_text = text_cache.render(big_paragraph_font,
+                                                  truncate_text(f"{i}. {rec['track']} by {rec['artist']}", 70),
+                                                  True,
+                                                  (255, 255, 255))
                 screen.blit(question_text, (80, 140 + (50 * i)))
 
                 # spotify link buttons
@@ -361,7 +573,7 @@ if __name__ == '__main__':
                 listen_button_color = (40, 220, 100) if listen_button_rect.collidepoint(mouse) else (29, 185, 84)
                 listen_button = pygame.draw.rect(screen, listen_button_color, listen_button_rect, border_radius=10)
 
-                button_text = PARAGRAPH_FONT.render("Listen", True, (255, 255, 255))
+                button_text = text_cache.render(paragraph_font, "Listen", True, (255, 255, 255))
                 screen.blit(button_text, (1090, 140 + (50 * i)))
                 rec_listen_buttons.append((listen_button, rec))
 
@@ -369,15 +581,39 @@ if __name__ == '__main__':
             return_button_rect = pygame.Rect(window_x // 2 + 325, 100, 250, 50)
             return_button_color = (40, 220, 100) if return_button_rect.collidepoint(mouse) else (29, 185, 84)
             return_button = pygame.draw.rect(screen, return_button_color, return_button_rect, border_radius=12)
-            return_button_text = SUBTITLE_FONT.render("TRY AGAIN", True, (255, 255, 255))
+            return_button_text = text_cache.render(subtitle_font, "TRY AGAIN", True, (255, 255, 255))
             screen.blit(return_button_text, (window_x // 2 + 365, 107))
 
-        # flip() the display to put your work on screen
-        pygame.display.flip()
+        # put the changed parts of the display on screen, leaving the rest of the frame to the background build
+        frame.present()
+        frame_seconds.append(time.perf_counter() - frame_start)
+        frame.tick()
+
+    return {'frames': frame.frames, 'redrawn': frame.redrawn, 'frame_seconds': frame_seconds,
+            'text_hits': text_cache.hits, 'text_misses': text_cache.misses}
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
+    import python_ta
+
+    pygame.init()
+
+    # creating graph in the background while the window opens
+    song_loader = BackgroundLoader(load_graph, 'data/spotify_songs_smaller.csv',
+                                   snapshot_file='data/spotify_songs_smaller.graph')
+    song_loader.start()
+    run_app(pygame.display.set_mode((1280, 720)), song_loader)
+
+    # stopping the background build if the window was closed before it finished
+    song_loader.cancel()
 
     python_ta.check_all(config={
         'extra-imports': [
-            'csv', 'random', 'webbrowser', 'pygame', 'recommender'
+            'csv', 'random', 'webbrowser', 'pygame', 'recommender', 'neighbour_index', 'parallel_build', 'snapshot',
+            'typing', 'instrumentation', 'background_loader', 'rendering', 'time', 'sharding'
         ],  # the names (strs) of imported modules
         "forbidden-io-functions": ["print"],
         'max-line-length': 120,
@@ -0,0 +1,278 @@
+"""CSC111 Winter 2025 Project: Spotify Song Recommendation System
+
+This Python module contains the columnar store holding the metadata of the songs of a graph.
+Every song is a row, numbered densely in the order songs are added, and every metadata key is
+a typed column, so a song costs a few array entries instead of a dictionary of Python objects:
+
+    - popularity and the audio features are float32 columns
+    - duration_ms is an int32 column and explicit an int8 column
+    - artists, album_name and track_genre are dictionary-encoded: an int32 code per song,
+      indexing a list of the distinct values
+    - track_id and track_name are interned strings
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of students
+taking CSC111 at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult our Course Syllabus.
+
+This file is Copyright (c) 2025 Cindy Yang, Kate Shen, Kristen Wong, Sara Kopilovic.
+"""
+from __future__ import annotations
+import sys
+from typing import Any, Iterable, Optional
+
+import numpy as np
+
+# The metadata keys stored as float32 columns; a missing value is stored as NaN
+FLOAT_KEYS = ['popularity', 'danceability', 'energy', 'valence', 'tempo', 'loudness', 'acousticness',
+              'instrumentalness']
+
+# The metadata keys stored as integer columns, with their dtype; a missing value is stored as -1
+INTEGER_KEYS = {'duration_ms': np.int32, 'explicit': np.int8}
+
+# The metadata keys stored as dictionary-encoded columns; a missing value is stored as code -1
+CATEGORY_KEYS = ['artists', 'album_name', 'track_genre']
+
+# The metadata keys stored as lists of interned strings; a missing value is stored as None
+STRING_KEYS = ['track_id', 'track_name']
+
+
+class MetadataStore:
+    """The metadata of a list of songs, stored in columns.
+
+    Rows are never reused, so the row of a song is a stable integer id; WeightedGraph uses it as
+    the number of the song's vertex. Metadata keys other than the ones stored in columns are
+    kept in a dictionary per song that has them, so the store can hold any metadata, but the
+    songs of a catalog read by main.read_songs need none.
+
+    Instance Attributes:
+        - floats: The float32 column of every key in FLOAT_KEYS.
+        - integers: The integer column of every key in INTEGER_KEYS.
+        - codes: The code column of every key in CATEGORY_KEYS.
+        - values: The distinct values of every key in CATEGORY_KEYS, indexed by code.
+        - strings: The column of every key in STRING_KEYS.
+
+    Private Instance Attributes:
+        - _float_rows: The float32 columns side by side, in the order of FLOAT_KEYS, so the floats
+                       of a row are read at once; self.floats holds views of its columns.
+        - _size: The number of rows.
+        - _alive: Whether every row still holds a song.
+        - _value_codes: Maps every distinct value of every key in CATEGORY_KEYS to its code.
+        - _names: Maps every lowercased track name to the live rows with that name, in order.
+        - _extras: The metadata of every row under keys not stored in columns, if it has any.
+
+    Representation Invariants:
+        - all(len(column) >= self._size for column in self.floats.values())
+        - all(self.values[key][code] == value for key in CATEGORY_KEYS
+              for value, code in self._value_codes[key].items())
+    """
+    floats: dict[str, np.ndarray]
+    integers: dict[str, np.ndarray]
+    codes: dict[str, np.ndarray]
+    values: dict[str, list[str]]
+    strings: dict[str, list[Optional[str]]]
+    _float_rows: np.ndarray
+    _size: int
+    _alive: np.ndarray
+    _value_codes: dict[str, dict[str, int]]
+    _names: dict[str, list[int]]
+    _extras: dict[int, dict]
+
+    def __init__(self) -> None:
+        self._float_rows = np.empty((0, len(FLOAT_KEYS)), dtype=np.float32)
+        self.floats = {key: self._float_rows[:, j] for j, key in enumerate(FLOAT_KEYS)}
+        self.integers = {key: np.empty(0, dtype=dtype) for key, dtype in INTEGER_KEYS.items()}
+        self.codes = {key: np.empty(0, dtype=np.int32) for key in CATEGORY_KEYS}
+        self.values = {key: [] for key in CATEGORY_KEYS}
+        self.strings = {key: [] for key in STRING_KEYS}
+        self._size = 0
+        self._alive = np.empty(0, dtype=bool)
+        self._value_codes = {key: {} for key in CATEGORY_KEYS}
+        self._names = {}
+        self._extras = {}
+
+    def __len__(self) -> int:
+        """Return the number of rows of this store, including removed rows."""
+        return self._size
+
+    def append(self, metadata: dict) -> int:
+        """Add a row holding the given metadata and return it."""
+        row = self._size
+        if row == len(self._alive):
+            self._grow(max(64, 2 * row))
+        self._size += 1
+        for key in STRING_KEYS:
+            self.strings[key].append(None)
+        self._write(row, metadata)
+        return row
+
+    def replace(self, row: int, metadata: dict) -> None:
+        """Replace the metadata of the given row."""
+        self._clear(row)
+        self._write(row, metadata)
+
+    def remove(self, row: int) -> None:
+        """Remove the song of the given row. Its row is not reused."""
+        self._clear(row)
+        self._alive[row] = False
+
+    def get(self, row: int) -> dict:
+        """Return a new dictionary holding the metadata of the given row, with the keys it was
+        given that are present.
+        """
+        metadata = {}
+        for key in STRING_KEYS:
+            if self.strings[key][row] is not None:
+                metadata[key] = self.strings[key][row]
+        for key in CATEGORY_KEYS:
+            code = int(self.codes[key][row])
+            if code >= 0:
+                metadata[key] = self.values[key][code]
+        for key, value in zip(FLOAT_KEYS, self._float_rows[row].tolist()):
+            if value == value:  # Not NaN
+                metadata[key] = value
+        for key in INTEGER_KEYS:
+            value = int(self.integers[key][row])
+            if value >= 0:
+                metadata[key] = bool(value) if key == 'explicit' else value
+        metadata.update(self._extras.get(row, {}))
+        return metadata
+
+    def value(self, row: int, key: str, default: Any = None) -> Any:
+        """Return the metadata of the given row under key, or default if it has none."""
+        if key in self.floats:
+            value = float(self.floats[key][row])
+            return value if value == value else default
+        elif key in self.codes:
+            code = int(self.codes[key][row])
+            return self.values[key][code] if code >= 0 else default
+        elif key in self.strings:
+            value = self.strings[key][row]
+            return value if value is not None else default
+        elif key in self.integers:
+            value = int(self.integers[key][row])
+            return default if value < 0 else bool(value) if key == 'explicit' else value
+        return self._extras.get(row, {}).get(key, default)
+
+    def column(self, key: str, rows: Iterable[int], default: Optional[float] = None) -> np.ndarray:
+        """Return the numeric metadata under key of the given rows, as float64.
+
+        Rows without a value get default; raise a KeyError if default is None.
+        """
+        rows = np.fromiter(rows, dtype=np.int64)
+        if key in self.floats:
+            column = self.floats[key][rows].astype(np.float64)
+            missing = np.isnan(column)
+        elif key in self.integers:
+            column = self.integers[key][rows].astype(np.float64)
+            missing = column < 0
+        else:
+            column = np.array([self._extras.get(row, {}).get(key, np.nan) for row in rows.tolist()], dtype=float)
+            missing = np.isnan(column)
+        if missing.any():
+            if default is None:
+                raise KeyError(key)
+            column[missing] = default
+        return column
+
+    def find(self, name: str) -> list[int]:
+        """Return the live rows whose lowercased track name is name, in the order they were added."""
+        return self._names.get(name, [])
+
+    def memory_usage(self) -> int:
+        """Return the approximate number of bytes used by the columns of this store.
+
+        Interned strings are counted once per distinct string.
+        """
+        total = sum(column.nbytes for columns in (self.floats, self.integers, self.codes)
+                    for column in columns.values())
+        total += sum(sys.getsizeof(value) for values in self.values.values() for value in values)
+        for strings in self.strings.values():
+            total += sys.getsizeof(strings) + sum(sys.getsizeof(value) for value in set(strings) if value is not None)
+        return total
+
+    def _write(self, row: int, metadata: dict) -> None:
+        """Store the given metadata in the given row, which holds no metadata."""
+        extras = {}
+        for key, value in metadata.items():
+            if key in self.floats and _is_number(value):
+                self.floats[key][row] = value
+            elif key in self.integers and _fits(self.integers[key].dtype, value):
+                self.integers[key][row] = value
+            elif key in self.codes and isinstance(value, str):
+                self.codes[key][row] = self._code(key, value)
+            elif key in self.strings and isinstance(value, str):
+                self.strings[key][row] = sys.intern(value)
+            else:
+                extras[key] = value
+        if extras:
+            self._extras[row] = extras
+        self._alive[row] = True
+
+        name = self.strings['track_name'][row] if 'track_name' in metadata else extras.get('track_name', '')
+        self._names.setdefault(str(name).lower(), []).append(row)
+
+    def _clear(self, row: int) -> None:
+        """Remove the metadata of the given row, and remove it from the name index."""
+        name = self.value(row, 'track_name', '')
+        rows = self._names[str(name).lower()]
+        rows.remove(row)
+        if not rows:
+            del self._names[str(name).lower()]
+
+        self._float_rows[row] = np.nan
+        for column in self.integers.values():
+            column[row] = -1
+        for column in self.codes.values():
+            column[row] = -1
+        for key in STRING_KEYS:
+            self.strings[key][row] = None
+        self._extras.pop(row, None)
+
+    def _code(self, key: str, value: str) -> int:
+        """Return the code of value in the column of key, adding it if it is new."""
+        code = self._value_codes[key].get(value)
+        if code is None:
+            code = len(self.values[key])
+            self._value_codes[key][value] = code
+            self.values[key].append(value)
+        return code
+
+    def _grow(self, capacity: int) -> None:
+        """Make room for capacity rows, with every new row holding no metadata."""
+        def grown(column: np.ndarray, fill: Any) -> np.ndarray:
+            resized = np.full((capacity,) + column.shape[1:], fill, dtype=column.dtype)
+            resized[:self._size] = column[:self._size]
+            return resized
+
+        self._float_rows = grown(self._float_rows, np.nan)
+        self.floats = {key: self._float_rows[:, j] for j, key in enumerate(FLOAT_KEYS)}
+        self.integers = {key: grown(column, -1) for key, column in self.integers.items()}
+        self.codes = {key: grown(column, -1) for key, column in self.codes.items()}
+        self._alive = grown(self._alive, False)
+
+
+def _is_number(value: Any) -> bool:
+    """Return whether value is an int or a float, but not a bool."""
+    return isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool)
+
+
+def _fits(dtype: np.dtype, value: Any) -> bool:
+    """Return whether value is a bool or a non-negative int that an integer column of the given
+    dtype can hold.
+    """
+    return isinstance(value, bool) or isinstance(value, (int, np.integer)) and 0 <= value <= np.iinfo(dtype).max
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['sys', 'numpy'],
+        'allowed-io': [],
+        'max-line-length': 120
+    })
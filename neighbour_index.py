@@ -0,0 +1,311 @@
+"""CSC111 Winter 2025 Project: Spotify Song Recommendation System
+
+This Python module contains an approximate nearest-neighbour index used to build
+the song similarity graph without comparing every pair of songs.
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of students
+taking CSC111 at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult our Course Syllabus.
+
+This file is Copyright (c) 2025 Cindy Yang, Kate Shen, Kristen Wong, Sara Kopilovic.
+"""
+from __future__ import annotations
+import time
+from typing import Optional
+
+import numpy as np
+
+from recommender import pair_scores, select_top_k, similar_pairs
+
+# Upper bound on the number of pair scores held in memory at once when comparing leaves
+_LEAF_BLOCK_ELEMENTS = 1 << 21
+
+# Slack used when filtering leaf candidates, whose unit-vector scores are only approximate
+_LEAF_TOLERANCE = 1e-9
+
+
+class _ProjectionNode:
+    """A node of a random projection tree that songs can be inserted into and removed from.
+
+    Instance Attributes:
+        - members: The rows held by this node if it is a leaf, or None if it is split.
+        - normal: The normal vector of the hyperplane splitting this node, if it is split.
+        - offset: The rows whose unit vector has a dot product with normal above offset go left.
+        - left: The child holding the rows on the positive side of the hyperplane.
+        - right: The child holding the remaining rows.
+    """
+    members: Optional[list[int]]
+    normal: Optional[np.ndarray]
+    offset: float
+    left: Optional[_ProjectionNode]
+    right: Optional[_ProjectionNode]
+
+    def __init__(self, members: list[int]) -> None:
+        self.members = members
+        self.normal = None
+        self.offset = 0.0
+        self.left = None
+        self.right = None
+
+
+class RandomProjectionForest:
+    """An approximate nearest-neighbour index over weighted song feature vectors.
+
+    Each tree recursively splits the songs with random hyperplanes until every leaf holds at
+    most leaf_size songs, which takes O(n log n) time. Only songs sharing a leaf in some tree
+    are compared, so building the graph costs O(n_trees * n * leaf_size) similarity scores
+    instead of O(n^2). More trees or larger leaves find more of the true neighbours at the
+    cost of speed; recall_report measures this trade-off against the exact builder.
+
+    The forest can also be kept up to date as songs are inserted and removed, for incremental
+    graph maintenance with WeightedGraph.ingest. A leaf is split once it holds more than twice
+    leaf_size songs, so every insertion, removal and candidates query takes O(log n) time.
+
+    Instance Attributes:
+        - n_trees: The number of random projection trees in the forest.
+        - leaf_size: The maximum number of songs in a leaf of each tree.
+        - seed: The seed of the random number generator used to choose the hyperplanes.
+
+    Private Instance Attributes:
+        - _roots: The roots of the trees holding the inserted rows, created on first insertion.
+        - _rng: The random number generator used to split the leaves of those trees.
+
+    Representation Invariants:
+        - self.n_trees >= 1
+        - self.leaf_size >= 2
+    """
+    n_trees: int
+    leaf_size: int
+    seed: int
+    _roots: list[_ProjectionNode]
+    _rng: np.random.Generator
+
+    def __init__(self, n_trees: int = 8, leaf_size: int = 64, seed: int = 111) -> None:
+        self.n_trees = n_trees
+        self.leaf_size = leaf_size
+        self.seed = seed
+        self._roots = []
+        self._rng = np.random.default_rng(seed)
+
+    def insert(self, rows: np.ndarray, units: np.ndarray) -> None:
+        """Insert the given rows, whose unit feature vectors are units[rows], into every tree."""
+        if not self._roots:
+            self._roots = [_ProjectionNode([]) for _ in range(self.n_trees)]
+
+        for root in self._roots:
+            for leaf, leaf_rows in _route(root, rows, units):
+                leaf.members.extend(leaf_rows.tolist())
+                if len(leaf.members) > 2 * self.leaf_size:
+                    self._split(leaf, units)
+
+    def remove(self, rows: np.ndarray, units: np.ndarray) -> None:
+        """Remove the given rows, whose unit feature vectors are units[rows], from every tree."""
+        for root in self._roots:
+            missing = set()
+            for leaf, leaf_rows in _route(root, rows, units):
+                removed = set(leaf_rows.tolist())
+                missing.update(removed.difference(leaf.members))
+                leaf.members = [member for member in leaf.members if member not in removed]
+
+            if missing:
+                # Rounding can route a row differently than when it was inserted, so search every leaf
+                stack = [root]
+                while stack:
+                    node = stack.pop()
+                    if node.members is None:
+                        stack.extend((node.left, node.right))
+                    else:
+                        node.members = [member for member in node.members if member not in missing]
+
+    def candidates(self, rows: np.ndarray, units: np.ndarray) -> list[np.ndarray]:
+        """Return the rows sharing a leaf with each of the given rows in some tree, without repeats."""
+        found = {row: [] for row in rows.tolist()}
+        for root in self._roots:
+            for leaf, leaf_rows in _route(root, rows, units):
+                members = np.array(leaf.members, dtype=int)
+                for row in leaf_rows.tolist():
+                    found[row].append(members)
+        return [np.unique(np.concatenate(found[row])) if found[row] else np.empty(0, dtype=int)
+                for row in rows.tolist()]
+
+    def _split(self, leaf: _ProjectionNode, units: np.ndarray) -> None:
+        """Split the given leaf, and any of its new leaves that are still too large."""
+        stack = [leaf]
+        while stack:
+            node = stack.pop()
+            members = np.array(node.members, dtype=int)
+            normal, offset, side = _hyperplane(units, members, self._rng)
+            if side.all() or not side.any():
+                # Leave indistinguishable songs together rather than splitting them at random,
+                # so that every row can still be found by following the hyperplanes
+                continue
+            node.normal, node.offset, node.members = normal, offset, None
+            node.left = _ProjectionNode(members[side].tolist())
+            node.right = _ProjectionNode(members[~side].tolist())
+            stack.extend(child for child in (node.left, node.right) if len(child.members) > 2 * self.leaf_size)
+
+    def similar_pairs(self, features: np.ndarray, magnitudes: np.ndarray, threshold: float = 0.3,
+                      top_k: Optional[int] = 20) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return the (sources, targets, scores) arrays of the approximate top_k edges of every row,
+        in the same format and order as recommender.similar_pairs.
+
+        Scores of the returned edges are exact; only the set of compared pairs is approximate.
+        """
+        n = len(features)
+        roots = np.sqrt(magnitudes)
+        units = np.divide(features, roots[:, None], out=np.zeros_like(features), where=roots[:, None] != 0)
+        rng = np.random.default_rng(self.seed)
+
+        sources, targets = np.empty(0, dtype=int), np.empty(0, dtype=int)
+        raws = np.empty(0)
+        for _ in range(self.n_trees):
+            leaves = self._build_tree(units, rng)
+            tree_sources, tree_targets, tree_raws = self._leaf_pairs(units, leaves, threshold, top_k)
+
+            # Merge this tree's candidates into the best candidates found so far
+            sources = np.concatenate((sources, tree_sources))
+            targets = np.concatenate((targets, tree_targets))
+            raws = np.concatenate((raws, tree_raws))
+            _, unique = np.unique(sources * n + targets, return_index=True)
+            sources, targets, raws = sources[unique], targets[unique], raws[unique]
+            best = select_top_k(sources, targets, raws * raws, top_k)
+            sources, targets, raws = sources[best], targets[best], raws[best]
+
+        # The leaf comparisons use unit vectors, so rescore the survivors exactly
+        scores = pair_scores(features, magnitudes, sources, targets)
+        passed = scores > threshold
+        sources, targets, scores = sources[passed], targets[passed], scores[passed]
+        order = select_top_k(sources, targets, scores, top_k)
+        return sources[order], targets[order], scores[order]
+
+    def _build_tree(self, units: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """Return the leaves of a new random projection tree over the given unit vectors, as a
+        (number of leaves, leaf_size) array of row indices padded with -1.
+        """
+        leaves = []
+        stack = [np.arange(len(units))]
+        while stack:
+            members = stack.pop()
+            if len(members) <= self.leaf_size:
+                leaves.append(members)
+                continue
+
+            _, _, side = _hyperplane(units, members, rng)
+            if side.all() or not side.any():
+                # The members are indistinguishable along this direction, so split them at random
+                side = rng.permutation(len(members)) < len(members) // 2
+            stack.append(members[side])
+            stack.append(members[~side])
+
+        padded = np.full((len(leaves), self.leaf_size), -1)
+        for i, members in enumerate(leaves):
+            padded[i, :len(members)] = np.sort(members)
+        return padded
+
+    def _leaf_pairs(self, units: np.ndarray, leaves: np.ndarray, threshold: float,
+                    top_k: Optional[int]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return the (sources, targets, raw similarities) of the best top_k candidates of every row,
+        comparing each row only to the later rows in its leaf.
+        """
+        size = leaves.shape[1]
+        keep = size if top_k is None else min(top_k, size)
+        chunk = max(1, _LEAF_BLOCK_ELEMENTS // (size * size))
+        later = np.arange(size)[:, None] < np.arange(size)[None, :]
+        all_sources, all_targets, all_raws = [], [], []
+
+        for lo in range(0, len(leaves), chunk):
+            members = leaves[lo:lo + chunk]
+            vectors = units[members]
+            raw = np.einsum('lpf,lqf->lpq', vectors, vectors)
+            valid = later[None, :, :] & (members[:, None, :] >= 0) & (members[:, :, None] >= 0)
+            approx = np.where(valid, raw * raw, -np.inf)
+
+            best = np.argsort(-approx, axis=2, kind='stable')[:, :, :keep]
+            best_approx = np.take_along_axis(approx, best, axis=2)
+            leaf, row, slot = np.nonzero(best_approx > threshold - _LEAF_TOLERANCE)
+            column = best[leaf, row, slot]
+            all_sources.append(members[leaf, row])
+            all_targets.append(members[leaf, column])
+            all_raws.append(raw[leaf, row, column])
+
+        return np.concatenate(all_sources), np.concatenate(all_targets), np.concatenate(all_raws)
+
+
+def _hyperplane(units: np.ndarray, members: np.ndarray, rng: np.random.Generator
+                ) -> tuple[np.ndarray, float, np.ndarray]:
+    """Return the (normal, offset) of a random hyperplane splitting the given rows, along with
+    which of them fall on its positive side.
+
+    The hyperplane lies halfway between two random members, so every member can fall on the same
+    side when they are indistinguishable along that direction.
+    """
+    a, b = units[rng.choice(members, 2, replace=False)]
+    normal = a - b
+    offset = float(normal @ (a + b) / 2)
+    return normal, offset, units[members] @ normal > offset
+
+
+def _route(root: _ProjectionNode, rows: np.ndarray, units: np.ndarray) -> list[tuple[_ProjectionNode, np.ndarray]]:
+    """Return the leaves of the tree at root that the given rows fall into, each paired with its rows."""
+    leaves = []
+    stack = [(root, rows)]
+    while stack:
+        node, node_rows = stack.pop()
+        if len(node_rows) == 0:
+            continue
+        if node.members is not None:
+            leaves.append((node, node_rows))
+        else:
+            side = units[node_rows] @ node.normal > node.offset
+            stack.append((node.left, node_rows[side]))
+            stack.append((node.right, node_rows[~side]))
+    return leaves
+
+
+def recall_report(features: np.ndarray, magnitudes: np.ndarray, settings: list[tuple[int, int]],
+                  threshold: float = 0.3, top_k: Optional[int] = 20) -> list[dict]:
+    """Return the build time and edge recall of a RandomProjectionForest for every
+    (n_trees, leaf_size) pair in settings, measured against the exact builder.
+
+    The first entry describes the exact builder itself. Recall is the fraction of the exact
+    edges that the approximate build also produces.
+    """
+    start = time.perf_counter()
+    exact_sources, exact_targets, _ = similar_pairs(features, magnitudes, threshold, top_k)
+    report = [{'n_trees': None, 'leaf_size': None, 'seconds': time.perf_counter() - start,
+               'edges': len(exact_sources), 'recall': 1.0}]
+    exact_keys = exact_sources * len(features) + exact_targets
+
+    for n_trees, leaf_size in settings:
+        start = time.perf_counter()
+        sources, targets, _ = RandomProjectionForest(n_trees, leaf_size).similar_pairs(
+            features, magnitudes, threshold, top_k)
+        seconds = time.perf_counter() - start
+        found = np.isin(exact_keys, sources * len(features) + targets).sum()
+        report.append({'n_trees': n_trees, 'leaf_size': leaf_size, 'seconds': seconds,
+                       'edges': len(sources), 'recall': float(found / max(len(exact_keys), 1))})
+
+    return report
+
+
+if __name__ == '__main__':
+    from main import read_songs
+    from recommender import normalized_features
+
+    # Compare a range of settings on the bundled catalog to choose one for production
+    features_, magnitudes_ = normalized_features(list(read_songs('data/spotify_songs_small.csv')))
+    for entry in recall_report(features_, magnitudes_, [(2, 32), (4, 64), (8, 64), (8, 128), (16, 128)]):
+        print(entry)
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['numpy', 'recommender', 'main', 'time'],
+        'allowed-io': [],
+        'max-line-length': 120
+    })
@@ -0,0 +1,165 @@
+"""CSC111 Winter 2025 Project: Spotify Song Recommendation System
+
+This Python module contains a builder that finds the edges of the song similarity graph
+on several processes at once.
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of students
+taking CSC111 at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult our Course Syllabus.
+
+This file is Copyright (c) 2025 Cindy Yang, Kate Shen, Kristen Wong, Sara Kopilovic.
+"""
+from __future__ import annotations
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Optional
+
+import numpy as np
+
+from recommender import similar_pairs
+
+# The number of row blocks handed to every worker, so that workers finishing early can take more
+_BLOCKS_PER_WORKER = 4
+
+# The shared feature matrix and magnitudes attached by the current worker process
+_worker_arrays = {}
+
+
+class ParallelBuilder:
+    """An exact graph builder that compares the songs on a pool of worker processes.
+
+    The rows of the feature matrix are split into blocks holding about the same number of
+    pairs, and every block is built by similar_pairs on a worker. Workers read the feature
+    matrix from shared memory instead of receiving a pickled copy, and the blocks are merged
+    in row order, so the edges are identical to the serial build.
+
+    It can be passed as the index of WeightedGraph.add_similarity_edges.
+
+    Instance Attributes:
+        - workers: The number of worker processes.
+    """
+    workers: int
+
+    def __init__(self, workers: Optional[int] = None) -> None:
+        """Initialize a builder using the given number of workers, or one per CPU if None."""
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+
+    def similar_pairs(self, features: np.ndarray, magnitudes: np.ndarray, threshold: float = 0.3,
+                      top_k: Optional[int] = 20) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return the (sources, targets, scores) arrays of the edges kept by the exact graph
+        builder, in the same order as recommender.similar_pairs.
+        """
+        if self.workers <= 1 or len(features) < 2:
+            return similar_pairs(features, magnitudes, threshold, top_k)
+
+        features = np.ascontiguousarray(features, dtype=np.float64)
+        magnitudes = np.ascontiguousarray(magnitudes, dtype=np.float64)
+        memory = shared_memory.SharedMemory(create=True, size=features.nbytes + magnitudes.nbytes)
+        try:
+            np.ndarray(features.shape, np.float64, memory.buf)[:] = features
+            np.ndarray(magnitudes.shape, np.float64, memory.buf, features.nbytes)[:] = magnitudes
+
+            bounds = row_blocks(len(features), self.workers * _BLOCKS_PER_WORKER)
+            with ProcessPoolExecutor(self.workers, initializer=_attach,
+                                     initargs=(memory.name, features.shape)) as executor:
+                blocks = list(executor.map(_build_block, bounds[:-1], bounds[1:],
+                                           [threshold] * (len(bounds) - 1), [top_k] * (len(bounds) - 1)))
+        finally:
+            memory.close()
+            memory.unlink()
+
+        return tuple(np.concatenate([block[part] for block in blocks]) for part in range(3))
+
+
+def row_blocks(n: int, count: int) -> list[int]:
+    """Return the boundaries of at most count consecutive blocks of range(n) that hold about
+    the same number of (i, j) pairs with i < j.
+
+    Row i is paired with the n - i - 1 rows after it, so earlier blocks hold fewer rows.
+
+    >>> row_blocks(10, 3)
+    [0, 2, 4, 10]
+    """
+    # The number of pairs in the rows before row i is i * (2n - i - 1) / 2
+    total = n * (n - 1) / 2
+    bounds = [0]
+    for block in range(1, count):
+        target = total * block / count
+        row = round(((2 * n - 1) - math.sqrt((2 * n - 1) ** 2 - 8 * target)) / 2)
+        if bounds[-1] < row < n:
+            bounds.append(row)
+    bounds.append(n)
+    return bounds
+
+
+def _attach(name: str, shape: tuple[int, int]) -> None:
+    """Attach the shared feature matrix and magnitudes of a build to this worker process."""
+    memory = shared_memory.SharedMemory(name=name)
+    features = np.ndarray(shape, np.float64, memory.buf)
+    _worker_arrays['memory'] = memory
+    _worker_arrays['features'] = features
+    _worker_arrays['magnitudes'] = np.ndarray((shape[0],), np.float64, memory.buf, features.nbytes)
+
+
+def _build_block(start: int, stop: int, threshold: float,
+                 top_k: Optional[int]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return the edges kept for the rows in range(start, stop) of the attached feature matrix."""
+    return similar_pairs(_worker_arrays['features'], _worker_arrays['magnitudes'], threshold, top_k, start, stop)
+
+
+def scaling_report(features: np.ndarray, magnitudes: np.ndarray, worker_counts: list[int],
+                   threshold: float = 0.3, top_k: Optional[int] = 20) -> list[dict]:
+    """Return the build time with every number of workers in worker_counts, its speedup over
+    the serial build, and whether its edges are identical to the serial build.
+
+    The times are measured, never projected, so they only show how the build scales on a host
+    with at least max(worker_counts) cores. With fewer cores, the extra workers share them and
+    the report shows the pool overhead instead.
+    """
+    start = time.perf_counter()
+    expected = similar_pairs(features, magnitudes, threshold, top_k)
+    serial_seconds = time.perf_counter() - start
+    report = [{'workers': 0, 'seconds': serial_seconds, 'speedup': 1.0, 'identical': True}]
+
+    for workers in worker_counts:
+        start = time.perf_counter()
+        result = ParallelBuilder(workers).similar_pairs(features, magnitudes, threshold, top_k)
+        seconds = time.perf_counter() - start
+        identical = all(np.array_equal(part, expected_part) for part, expected_part in zip(result, expected))
+        report.append({'workers': workers, 'seconds': seconds, 'speedup': serial_seconds / seconds,
+                       'identical': identical})
+
+    return report
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
+
+    from main import read_songs
+    from recommender import normalized_features
+
+    # Measure how the build scales on this machine; workers 0 is the serial build. The numbers
+    # for more workers than os.cpu_count() are not a scaling result.
+    features_, magnitudes_ = normalized_features(list(read_songs('data/spotify_songs_small.csv')))
+    print('cores:', os.cpu_count())
+    for entry in scaling_report(features_, magnitudes_, [1, 2, 4, 8, 16, 32]):
+        print(entry)
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['concurrent.futures', 'math', 'multiprocessing', 'numpy', 'os', 'recommender', 'main',
+                          'time'],
+        'allowed-io': [],
+        'max-line-length': 120
+    })
@@ -0,0 +1,232 @@
+"""CSC111 Winter 2025 Project: Spotify Song Recommendation System
+
+This Python module contains the random walk with restart (personalized PageRank) used to
+recommend songs that are several hops away from the seed songs.
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of students
+taking CSC111 at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult our Course Syllabus.
+
+This file is Copyright (c) 2025 Cindy Yang, Kate Shen, Kristen Wong, Sara Kopilovic.
+"""
+from __future__ import annotations
+import time
+from typing import Optional
+
+import numpy as np
+
+from recommendation_cache import RecommendationCache
+
+
+class RandomWalk:
+    """Personalized PageRank over a weighted graph stored in compressed sparse row form.
+
+    A walker starts at a random seed song. At every step it jumps back to a random seed with
+    probability restart, and otherwise moves to a neighbour with probability proportional to
+    the edge weight. Songs are scored by how often the walker visits them. A walker at a song
+    without neighbours jumps back to the seeds.
+
+    Scores can be computed exactly, by power iteration over every edge, or approximately, by
+    pushing probability mass outwards from each seed until what is left at every song is
+    small. Pushes only touch the songs near the seeds, and since the scores of several seeds
+    are the average of their individual scores, the pushed scores of every seed are kept and
+    reused by later queries. Seeds can also be pushed ahead of time with precompute, so that
+    queries only add up stored scores.
+
+    Instance Attributes:
+        - indptr: The edges of row i are edges indptr[i]:indptr[i + 1].
+        - indices: The target row of every edge.
+        - transition: The probability of a walker following every edge, given it moves on.
+
+    Private Instance Attributes:
+        - _sources: The source row of every edge.
+        - _degrees: The number of edges of every row.
+        - _dangling: The rows without edges.
+        - _pushed: The pushed (rows, scores) of the seeds pushed so far, keyed by
+                   (seed row, restart, epsilon).
+        - _estimate: Scratch space holding the pushed score of every row; all zeros between pushes.
+        - _residual: Scratch space holding the mass left to push at every row; all zeros between pushes.
+        - _slots: Scratch space used to remove duplicate rows.
+    """
+    indptr: np.ndarray
+    indices: np.ndarray
+    transition: np.ndarray
+    _sources: np.ndarray
+    _degrees: np.ndarray
+    _dangling: np.ndarray
+    _pushed: RecommendationCache
+    _estimate: np.ndarray
+    _residual: np.ndarray
+    _slots: np.ndarray
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, weights: np.ndarray,
+                 max_pushed: int = 100000) -> None:
+        """Initialize a random walk over the given graph, keeping the pushed scores of up to
+        max_pushed seeds.
+        """
+        n = len(indptr) - 1
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self._degrees = np.diff(self.indptr)
+        self._sources = np.repeat(np.arange(n), self._degrees)
+
+        weights = np.asarray(weights, dtype=np.float64)
+        totals = np.bincount(self._sources, weights=weights, minlength=n)
+        self.transition = weights / np.where(totals > 0, totals, 1.0)[self._sources]
+        self._dangling = np.flatnonzero(totals <= 0)
+
+        self._pushed = RecommendationCache(max_pushed)
+        self._estimate = np.zeros(n)
+        self._residual = np.zeros(n)
+        self._slots = np.zeros(n, dtype=np.int64)
+
+    def visit_scores(self, seeds: list[int], restart: float = 0.15, max_iterations: int = 50,
+                     tolerance: float = 1e-6, epsilon: Optional[float] = None,
+                     deadline: Optional[float] = None) -> tuple[np.ndarray, np.ndarray]:
+        """Return the rows with a nonzero visit probability for walkers restarting at seeds, and
+        those probabilities, computed by push with the given epsilon, or by power iteration if
+        epsilon is None.
+        """
+        if epsilon is not None:
+            return self.push(seeds, restart, epsilon, deadline)
+        scores = self.power_iteration(seeds, restart, max_iterations, tolerance, deadline)
+        rows = np.flatnonzero(scores > 0)
+        return rows, scores[rows]
+
+    def power_iteration(self, seeds: list[int], restart: float = 0.15, max_iterations: int = 50,
+                        tolerance: float = 1e-6, deadline: Optional[float] = None) -> np.ndarray:
+        """Return the visit probability of every row for walkers restarting at seeds.
+
+        Stop after max_iterations, once the scores change by less than tolerance in total, or
+        once time.perf_counter() passes deadline, whichever comes first. The deadline is only
+        checked after a full iteration, so at least one is always run.
+        """
+        n = len(self.indptr) - 1
+        start = np.bincount(seeds, minlength=n) / len(seeds)
+        scores = start.copy()
+        for _ in range(max_iterations):
+            # bincount counts in integers when there are no edges, so convert to float
+            moved = np.bincount(self.indices, weights=scores[self._sources] * self.transition,
+                                minlength=n).astype(np.float64)
+            moved += scores[self._dangling].sum() * start
+            updated = restart * start + (1 - restart) * moved
+            change = np.abs(updated - scores).sum()
+            scores = updated
+            if change < tolerance or (deadline is not None and time.perf_counter() > deadline):
+                break
+        return scores
+
+    def push(self, seeds: list[int], restart: float = 0.15, epsilon: float = 1e-4,
+             deadline: Optional[float] = None) -> tuple[np.ndarray, np.ndarray]:
+        """Return the rows with a nonzero approximate visit probability for walkers restarting
+        at seeds, and those probabilities.
+
+        The mass left unpushed at every row is below epsilon, and the scores are short of
+        their power iteration scores by at most the total unpushed mass. Seeds pushed by an earlier
+        call are not pushed again. Once time.perf_counter() passes deadline, the remaining
+        seeds are pushed for a single round only.
+        """
+        all_rows, all_scores = [], []
+        for seed in seeds:
+            key = (seed, restart, epsilon)
+            pushed = self._pushed.get(key)
+            if pushed is None:
+                *pushed, complete = self._push_seed(seed, restart, epsilon, deadline)
+                if complete:
+                    self._pushed.put(key, pushed, ())
+            all_rows.append(pushed[0])
+            all_scores.append(pushed[1])
+
+        rows, inverse = np.unique(np.concatenate(all_rows), return_inverse=True)
+        return rows, np.bincount(inverse, weights=np.concatenate(all_scores)) / len(seeds)
+
+    def precompute(self, seeds: list[int], restart: float = 0.15, epsilon: float = 1e-4,
+                   keep: Optional[int] = None) -> None:
+        """Push every seed in seeds, keeping only its keep highest scores if keep is given, so
+        that later calls to push with the same restart and epsilon reuse them.
+        """
+        self._pushed.max_entries = max(self._pushed.max_entries, len(self._pushed) + len(seeds))
+        for seed in seeds:
+            rows, scores, _ = self._push_seed(seed, restart, epsilon, None)
+            if keep is not None and len(scores) > keep:
+                top = np.argpartition(scores, len(scores) - keep)[len(scores) - keep:]
+                rows, scores = rows[top], scores[top]
+            self._pushed.put((seed, restart, epsilon), (rows, scores), ())
+
+    def _push_seed(self, seed: int, restart: float, epsilon: float,
+                   deadline: Optional[float]) -> tuple[np.ndarray, np.ndarray, bool]:
+        """Push the mass of a walker restarting at seed until the mass left at every row is
+        below epsilon, and return the rows reached, their scores and
+        whether the push finished before deadline.
+        """
+        estimate, residual = self._estimate, self._residual
+        residual[seed] = 1.0
+        touched = [np.array([seed])]
+        frontier = np.array([seed])
+
+        while len(frontier) > 0:
+            mass = residual[frontier]
+            residual[frontier] = 0.0
+            estimate[frontier] += restart * mass
+
+            # Walkers at a row without edges jump back to the seed
+            stuck = mass[self._degrees[frontier] == 0].sum()
+            residual[seed] += (1 - restart) * stuck
+
+            counts = self._degrees[frontier]
+            firsts = np.repeat(self.indptr[frontier] - np.cumsum(counts) + counts, counts)
+            edges = firsts + np.arange(counts.sum())
+            targets = self.indices[edges]
+            np.add.at(residual, targets, (1 - restart) * np.repeat(mass, counts) * self.transition[edges])
+            touched.append(targets)
+
+            candidates = np.append(targets, seed)
+            frontier = self._distinct(candidates[residual[candidates] >= epsilon])
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+
+        rows = self._distinct(np.concatenate(touched))
+        scores = estimate[rows]
+        keep = scores > 0
+        result = rows[keep], scores[keep], len(frontier) == 0
+        estimate[rows] = 0.0
+        residual[rows] = 0.0
+        return result
+
+    def _distinct(self, rows: np.ndarray) -> np.ndarray:
+        """Return the distinct values of rows, in no particular order, without sorting them."""
+        positions = np.arange(len(rows))
+        self._slots[rows] = positions
+        return rows[self._slots[rows] == positions]
+
+
+def best_rows(rows: np.ndarray, scores: np.ndarray, excluded: list[int],
+              count: int) -> tuple[np.ndarray, np.ndarray]:
+    """Return the rows, other than the excluded ones, whose score is among the count highest
+    positive scores, along with their scores.
+
+    Every row tied with the lowest of those scores is returned too, so that ties can be
+    broken afterwards.
+    """
+    keep = (scores > 0) & ~np.isin(rows, excluded)
+    rows, scores = rows[keep], scores[keep]
+    if len(scores) > count > 0:
+        lowest = np.partition(scores, len(scores) - count)[len(scores) - count]
+        keep = scores >= lowest
+        rows, scores = rows[keep], scores[keep]
+    return rows, scores
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['numpy', 'recommendation_cache', 'time'],
+        'allowed-io': [],
+        'max-line-length': 120
+    })
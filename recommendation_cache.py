@@ -0,0 +1,148 @@
+"""CSC111 Winter 2025 Project: Spotify Song Recommendation System
+
+This Python module contains the cache used to answer repeated recommendation queries
+without recomputing them.
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of students
+taking CSC111 at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult our Course Syllabus.
+
+This file is Copyright (c) 2025 Cindy Yang, Kate Shen, Kristen Wong, Sara Kopilovic.
+"""
+from __future__ import annotations
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable, Optional
+
+
+class RecommendationCache:
+    """A bounded cache of recommendation results with least-recently-used eviction and an
+    optional time to live.
+
+    Every entry records the songs its result was computed from, so that a change to one song
+    only invalidates the entries that depend on it.
+
+    Instance Attributes:
+        - max_entries: The maximum number of entries kept; the least recently used entry is
+                       evicted to make room for a new one.
+        - ttl: The number of seconds an entry stays valid after it is stored, or None if
+               entries never expire.
+        - hits: The number of lookups answered from this cache.
+        - misses: The number of lookups that found no valid entry.
+        - evictions: The number of entries evicted to make room for new ones.
+        - expirations: The number of entries dropped because they outlived ttl.
+        - invalidations: The number of entries dropped because a song they depend on changed.
+
+    Private Instance Attributes:
+        - _entries: Maps every key to its (expiry time, result, songs) entry, least recently
+                    used first.
+        - _dependents: Maps every song to the keys of the entries that depend on it.
+        - _clock: The function returning the current time in seconds.
+
+    Representation Invariants:
+        - self.max_entries >= 0
+        - len(self._entries) <= self.max_entries
+        - all(key in self._dependents[song] for key, (_, _, songs) in self._entries.items() for song in songs)
+    """
+    max_entries: int
+    ttl: Optional[float]
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    invalidations: int
+    _entries: OrderedDict[Hashable, tuple[float, Any, tuple]]
+    _dependents: dict[Any, set[Hashable]]
+    _clock: Callable[[], float]
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._dependents = {}
+        self._clock = clock
+
+    def __len__(self) -> int:
+        """Return the number of entries in this cache, including expired ones not yet dropped."""
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the result stored for key, or None if there is no valid entry for it."""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= self._clock():
+            self._drop(key)
+            self.expirations += 1
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: Hashable, result: Any, songs: Iterable) -> None:
+        """Store result for key, as depending on the given songs."""
+        if self.max_entries <= 0:
+            return
+        if key in self._entries:
+            self._drop(key)
+        while len(self._entries) >= self.max_entries:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+        songs = tuple(songs)
+        expiry = self._clock() + self.ttl if self.ttl is not None else float('inf')
+        self._entries[key] = (expiry, result, songs)
+        for song in songs:
+            self._dependents.setdefault(song, set()).add(key)
+
+    def invalidate(self, song: Any) -> None:
+        """Drop every entry that depends on the given song."""
+        keys = self._dependents.get(song)
+        if keys:
+            for key in list(keys):
+                self._drop(key)
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        """Drop every entry of this cache, keeping its counters."""
+        self._entries.clear()
+        self._dependents.clear()
+
+    def stats(self) -> dict[str, int]:
+        """Return the counters and current size of this cache."""
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'expirations': self.expirations,
+                'invalidations': self.invalidations}
+
+    def _drop(self, key: Hashable) -> None:
+        """Remove the entry for key from this cache."""
+        _, _, songs = self._entries.pop(key)
+        for song in songs:
+            keys = self._dependents[song]
+            keys.discard(key)
+            if not keys:
+                del self._dependents[song]
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['collections', 'time'],
+        'allowed-io': [],
+        'max-line-length': 120
+    })
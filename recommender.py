@@ -16,89 +16,624 @@ This file is Copyright (c) 2025 Cindy Yang, Kate Shen, Kristen Wong, Sara Kopilo
 """
 from __future__ import annotations
 import math
-from typing import Any, Dict, List, Optional
+import time
+from array import array
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from instrumentation import DISABLED, Metrics
+from metadata_store import MetadataStore
+from random_walk import RandomWalk, best_rows
+from recommendation_cache import RecommendationCache
+from search import SongSearchIndex
+from vector_search import VectorSearch
+
+# (field_name, weight, min_value, max_value) for every audio feature used to compare songs
+FEATURE_CONFIGURATION = [
+    ('danceability', 0.25, 0.0, 1.0),
+    ('energy', 0.25, 0.0, 1.0),
+    ('valence', 0.15, 0.0, 1.0),
+    ('tempo', 0.1, 50, 200),
+    ('loudness', 0.1, -30, 0),
+    ('acousticness', 0.1, 0.0, 1.0),
+    ('instrumentalness', 0.05, 0.0, 1.0)
+]
+
+# Upper bound on the number of pair scores held in memory at once by the vectorized builder
+_BLOCK_ELEMENTS = 1 << 21
+
+# Slack used when preselecting candidates from vectorized scores, which can differ from
+# the exact scalar scores in the last bit
+_SCORE_TOLERANCE = 1e-12
+
+# The number of edges linked between progress updates of add_similarity_edges
+_LINK_CHUNK = 10000
+
+# The number of edges of the seeds of recommend_songs above which their neighbours are merged in
+# order of decreasing weight instead of all being scanned
+_MERGE_EDGES = 64
 
 
 class _WeightedVertex:
     """A vertex in a weighted song similarity graph, used to represent a song.
 
-    Each vertex item is a song name, represented as a string.
+    Each vertex item is a song name, represented as a string. WeightedGraph does not store
+    vertex objects; get_vertex returns a lightweight view of the graph's arrays instead.
+
+    The weighted features of a vertex are computed once and cached until its metadata or
+    feature configuration is reassigned. Metadata edited in place is not noticed, so replace
+    the whole dict instead. For views of a graph, the metadata is a new dict read from the
+    graph's metadata store on every access.
 
     Instance Attributes:
         - item: The data stored in this vertex, representing a song.
         - metadata: The metadata of each song in the csv file
-        - neighbours: The vertices that are adjacent to this vertex.
+        - neighbours: The vertices that are adjacent to this vertex, mapped to the edge weights.
+                      For views of a graph, this is read from the graph's arrays on every access.
         - feature_configuration: A tuple that defines the audio features that are considered
                                  for every song and their respectives weights. It uses the format:
                                  (feature_name, weight, min_value. max_value)
+                                 For views of a graph, it is the configuration of the graph.
 
     Representation Invariants:
         - self not in self.neighbours
         - all(self in u.neighbours for u in self.neighbours)
     """
+    __slots__ = ('item', '_metadata', '_graph', '_feature_configuration', '_weighted')
     item: str
-    metadata: Optional[dict] = None
-    neighbours: dict[_WeightedVertex, float]
-    feature_configuration: list[tuple[str, float, float, float]]
+    _metadata: dict
+    _graph: Optional[WeightedGraph]
+    _feature_configuration: list[tuple[str, float, float, float]]
+    _weighted: Optional[tuple]
 
-    def __init__(self, item: Any, metadata: Optional[dict] = None) -> None:
-        """Initialize a new vertex with the given.
+    def __init__(self, item: Any, metadata: Optional[dict] = None, graph: Optional[WeightedGraph] = None) -> None:
+        """Initialize a new vertex with the given item and metadata, as a view of graph if given.
 
-        This vertex is initialized with no neighbours.
+        A vertex that is not a view of a graph has no neighbours.
         """
         self.item = item
-        self.metadata = metadata if metadata is not None else {}
-        self.neighbours = {}
-
-        self.feature_configuration = [
-            # (field_name, weight, min_value, max_value)
-            ('danceability', 0.25, 0.0, 1.0),
-            ('energy', 0.25, 0.0, 1.0),
-            ('valence', 0.15, 0.0, 1.0),
-            ('tempo', 0.1, 50, 200),
-            ('loudness', 0.1, -30, 0),
-            ('acousticness', 0.1, 0.0, 1.0),
-            ('instrumentalness', 0.05, 0.0, 1.0)
-        ]
+        self._metadata = metadata if metadata is not None else {}
+        self._graph = graph
+        self._feature_configuration = FEATURE_CONFIGURATION
+        self._weighted = None
+
+    @property
+    def metadata(self) -> dict:
+        """The metadata of each song in the csv file."""
+        if self._graph is None:
+            return self._metadata
+        return self._graph._songs.get(self._graph._ids[self.item])
+
+    @metadata.setter
+    def metadata(self, metadata: dict) -> None:
+        if self._graph is None:
+            self._metadata = metadata
+        else:
+            self._graph._set_metadata(self._graph._ids[self.item], metadata)
+
+    @property
+    def feature_configuration(self) -> list[tuple[str, float, float, float]]:
+        """The features considered for this song, as (feature_name, weight, min_value, max_value)."""
+        if self._graph is None:
+            return self._feature_configuration
+        return self._graph.feature_configuration
+
+    @feature_configuration.setter
+    def feature_configuration(self, feature_configuration: list[tuple[str, float, float, float]]) -> None:
+        if self._graph is None:
+            self._feature_configuration = feature_configuration
+        else:
+            self._graph.feature_configuration = feature_configuration
+
+    @property
+    def neighbours(self) -> dict[_WeightedVertex, float]:
+        """The vertices that are adjacent to this vertex, mapped to the edge weights."""
+        if self._graph is None:
+            return {}
+        return {self._graph.get_vertex(item): weight for item, weight in self._graph.get_neighbours(self.item).items()}
+
+    def __eq__(self, other: Any) -> bool:
+        """Return whether other is this vertex, or a view of the same vertex of the same graph."""
+        if self._graph is None or not isinstance(other, _WeightedVertex):
+            return self is other
+        return self._graph is other._graph and self.item == other.item
+
+    def __hash__(self) -> int:
+        """Return a hash consistent with __eq__."""
+        return hash(self.item)
+
+    def weighted_features(self) -> tuple[tuple[float, ...], float]:
+        """Return the clipped, min-max normalized and weighted features of this vertex, along
+        with their magnitude.
+        """
+        if self._graph is not None:
+            return self._graph._weighted_features(self._graph._ids[self.item])
+        if self._weighted is None or self._weighted[0] is not self._metadata \
+                or self._weighted[1] is not self._feature_configuration:
+            self._weighted = (self._metadata, self._feature_configuration,
+                              *weighted_features(self._metadata, self._feature_configuration))
+        return self._weighted[2], self._weighted[3]
 
     def similarity_score(self, other: '_WeightedVertex') -> float:
-        """Calculate weighted similarity between this vertex and other."""
-        dot_product = 0.0
-        mag1 = 0.0
-        mag2 = 0.0
+        """Calculate weighted similarity between this vertex and other.
+
+        Each vertex is weighted with its own feature configuration.
+        """
+        features1, magnitude1 = self.weighted_features()
+        features2, magnitude2 = other.weighted_features()
+        return _cached_similarity(features1, magnitude1, features2, magnitude2)
+
+
+def weighted_features(metadata: dict, feature_configuration: list[tuple[str, float, float, float]]
+                      ) -> tuple[tuple[float, ...], float]:
+    """Return the clipped, min-max normalized and weighted features of the given song metadata,
+    along with their magnitude.
+    """
+    features = []
+    mag = 0.0
+    for feature, weight, min_val, max_val in feature_configuration:
+        # Clip values to expected ranges
+        val = max(min(metadata[feature], max_val), min_val)
+
+        # Min-max normalization with weighting
+        norm = ((val - min_val) / (max_val - min_val)) * weight
+
+        features.append(norm)
+        mag += norm ** 2
+
+    return tuple(features), math.sqrt(mag)
+
 
-        for feature, weight, min_val, max_val in self.feature_configuration:
-            # Clip values to expected ranges
-            val1 = max(min(self.metadata[feature], max_val), min_val)
-            val2 = max(min(other.metadata[feature], max_val), min_val)
+def _cached_similarity(features1: tuple[float, ...], magnitude1: float,
+                       features2: tuple[float, ...], magnitude2: float) -> float:
+    """Return the similarity score between two songs, given their weighted features and magnitudes."""
+    if magnitude1 == 0 or magnitude2 == 0:
+        return 0.0
 
-            # Min-max normalization with weighting
-            norm1 = ((val1 - min_val) / (max_val - min_val)) * weight
-            norm2 = ((val2 - min_val) / (max_val - min_val)) * weight
+    dot_product = 0.0
+    for norm1, norm2 in zip(features1, features2):
+        dot_product += norm1 * norm2
 
-            dot_product += norm1 * norm2
-            mag1 += norm1 ** 2
-            mag2 += norm2 ** 2
+    raw_score = dot_product / (magnitude1 * magnitude2)
+
+    # Apply non-linear scaling to better distribute scores
+    return raw_score ** 2
+
+
+def normalized_features(metadatas: list[dict],
+                        feature_configuration: Optional[list[tuple[str, float, float, float]]] = None
+                        ) -> tuple[np.ndarray, np.ndarray]:
+    """Return the clipped, min-max normalized and weighted feature matrix of the given song metadata,
+    along with the squared magnitude of every row.
+
+    Row i of the matrix holds the values _WeightedVertex.similarity_score computes for metadatas[i],
+    and the magnitudes are accumulated in the same order, so scores derived from them match the
+    scalar scores exactly.
+    """
+    if feature_configuration is None:
+        feature_configuration = FEATURE_CONFIGURATION
+
+    columns = [np.array([metadata[feature] for metadata in metadatas], dtype=float)
+               for feature, _, _, _ in feature_configuration]
+    return normalized_columns(columns, len(metadatas), feature_configuration)
+
+
+def normalized_columns(columns: list[np.ndarray], size: int,
+                       feature_configuration: list[tuple[str, float, float, float]]
+                       ) -> tuple[np.ndarray, np.ndarray]:
+    """Return the feature matrix and squared magnitudes of normalized_features, given the raw
+    values of size songs for every feature of feature_configuration, in order.
+    """
+    features = np.empty((size, len(feature_configuration)))
+    for f, (_, weight, min_val, max_val) in enumerate(feature_configuration):
+        column = np.maximum(np.minimum(columns[f], max_val), min_val)
+        features[:, f] = ((column - min_val) / (max_val - min_val)) * weight
 
-        if mag1 == 0 or mag2 == 0:
-            return 0.0
+    magnitudes = []
+    for row in features.tolist():
+        mag = 0.0
+        for norm in row:
+            mag += norm ** 2
+        magnitudes.append(mag)
 
-        raw_score = dot_product / (math.sqrt(mag1) * math.sqrt(mag2))
+    return features, np.array(magnitudes)
 
-        # Apply non-linear scaling to better distribute scores
-        return raw_score ** 2
+
+def similarity_block(features: np.ndarray, magnitudes: np.ndarray, rows: slice | np.ndarray,
+                     cols: slice | np.ndarray) -> np.ndarray:
+    """Return the raw (unsquared) cosine similarities between the given rows and columns of features.
+
+    Pairs where either vector has zero magnitude get a similarity of 0.0.
+    """
+    row_features, col_features = features[rows], features[cols]
+    dot = np.zeros((len(row_features), len(col_features)))
+    for f in range(features.shape[1]):
+        dot += row_features[:, f, None] * col_features[None, :, f]
+
+    row_magnitudes, col_magnitudes = magnitudes[rows], magnitudes[cols]
+    denominator = np.sqrt(row_magnitudes)[:, None] * np.sqrt(col_magnitudes)[None, :]
+    raw = np.zeros_like(dot)
+    np.divide(dot, denominator, out=raw, where=(row_magnitudes[:, None] != 0) & (col_magnitudes[None, :] != 0))
+    return raw
+
+
+def pair_scores(features: np.ndarray, magnitudes: np.ndarray, sources: np.ndarray,
+                targets: np.ndarray) -> np.ndarray:
+    """Return the similarity scores between the given pairs of rows of features, computed with
+    the same float operations as _WeightedVertex.similarity_score.
+    """
+    dot = np.zeros(len(sources))
+    for f in range(features.shape[1]):
+        dot += features[sources, f] * features[targets, f]
+
+    source_magnitudes, target_magnitudes = magnitudes[sources], magnitudes[targets]
+    raw = np.zeros_like(dot)
+    np.divide(dot, np.sqrt(source_magnitudes) * np.sqrt(target_magnitudes), out=raw,
+              where=(source_magnitudes != 0) & (target_magnitudes != 0))
+    return np.array([score ** 2 for score in raw.tolist()])
+
+
+def select_top_k(sources: np.ndarray, targets: np.ndarray, scores: np.ndarray,
+                 top_k: Optional[int]) -> np.ndarray:
+    """Return the indices that order the given candidate edges by source, then by descending score,
+    then by target, keeping at most top_k edges per source.
+
+    This is the order a stable sort by descending score of each source's targets would produce.
+    """
+    order = np.lexsort((targets, -scores, sources))
+    if top_k is None or len(order) == 0:
+        return order
+
+    sorted_sources = sources[order]
+    rank = np.arange(len(order)) - np.searchsorted(sorted_sources, sorted_sources, side='left')
+    return order[rank < top_k]
+
+
+def block_candidates(raw: np.ndarray, approx: np.ndarray, threshold: float,
+                     top_k: Optional[int]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return the (rows, columns, scores) of the entries of a block of raw similarities that score
+    above threshold and can be among the top_k of their row, with their exact scores.
+
+    approx holds the squares of raw computed as arrays, with -inf for the entries to skip. They can
+    differ from the exact scores in the last bit, so candidates are preselected from approx with
+    some slack and only they are rescored with the same float operations as pair_scores.
+    """
+    keep = approx > threshold - _SCORE_TOLERANCE
+    if top_k is not None and top_k < approx.shape[1]:
+        masked = np.where(keep, approx, -np.inf)
+        kth = np.partition(masked, approx.shape[1] - top_k, axis=1)[:, approx.shape[1] - top_k]
+        keep &= approx >= kth[:, None] - _SCORE_TOLERANCE
+
+    rows, cols = np.nonzero(keep)
+    scores = np.array([score ** 2 for score in raw[rows, cols].tolist()])
+    passed = scores > threshold
+    return rows[passed], cols[passed], scores[passed]
+
+
+def similar_pairs(features: np.ndarray, magnitudes: np.ndarray, threshold: float = 0.3,
+                  top_k: Optional[int] = 20, start: int = 0, stop: Optional[int] = None,
+                  metrics: Optional[Metrics] = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return the (sources, targets, scores) arrays of the edges kept by the exact graph builder
+    for the rows in range(start, stop).
+
+    Every row i is compared against every row j > i. The top_k pairs scoring above threshold are
+    kept, ordered by descending score with ties broken by j. Scores are first computed block-wise
+    as arrays, then the few candidates that can make the cut are rescored with the same float
+    operations as _WeightedVertex.similarity_score, so the result is identical to the scalar builder.
+
+    If metrics is given, the pairs compared, and the edges kept or rejected by the threshold or
+    by top_k, are counted there.
+    """
+    n = len(features)
+    stop = n if stop is None else stop
+    block_size = max(1, _BLOCK_ELEMENTS // max(n, 1))
+    all_sources, all_targets, all_scores = [], [], []
+
+    for lo in range(start, stop, block_size):
+        hi = min(lo + block_size, stop)
+        raw = similarity_block(features, magnitudes, slice(lo, hi), slice(lo + 1, n))
+        approx = raw * raw
+        # Column c of this block is row lo + 1 + c, which must come after row lo + r
+        approx[np.arange(hi - lo)[:, None] > np.arange(n - lo - 1)[None, :]] = -np.inf
+
+        if metrics is not None:
+            evaluations = (hi - lo) * (2 * n - lo - hi - 1) // 2
+            above = int(np.count_nonzero(approx > threshold))
+            metrics.count('similarity_evaluations', evaluations)
+            metrics.count('edges_rejected_threshold', evaluations - above)
+            metrics.count('edges_above_threshold', above)
+
+        rows, cols, scores = block_candidates(raw, approx, threshold, top_k)
+        all_sources.append(rows + lo)
+        all_targets.append(cols + lo + 1)
+        all_scores.append(scores)
+
+    if not all_scores:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int), np.empty(0)
+
+    sources, targets = np.concatenate(all_sources), np.concatenate(all_targets)
+    scores = np.concatenate(all_scores)
+    order = select_top_k(sources, targets, scores, top_k)
+    if metrics is not None:
+        metrics.count('edges_accepted', len(order))
+    return sources[order], targets[order], scores[order]
+
+
+class _FeatureStore:
+    """The normalized features of the vertices of a graph, kept in growable arrays so that the
+    similarity edges of the graph can be maintained incrementally.
+
+    Rows are assigned in the order vertices are added and are never reused, so the songs
+    added after a vertex are exactly the vertices with a greater row.
+
+    Instance Attributes:
+        - items: The item of every row, or None if its vertex was removed.
+        - rows: Maps the item of every vertex to its row.
+        - features: The normalized feature matrix, with at least one row for every entry of items.
+        - magnitudes: The squared magnitude of every row of features.
+        - units: The rows of features scaled to unit length.
+        - alive: Whether every row still belongs to a vertex.
+        - later: The weights of the edges from every live row to later rows, keyed by row, or None
+                 for removed rows. These are the edges the row chose when the graph was built.
+        - floors: The lowest weight among the top_k later neighbours of every row, or -inf if
+                  the row has fewer than top_k later neighbours.
+        - top_k: The number of later neighbours floors was computed for.
+        - index: The approximate nearest-neighbour index holding every live row, if any.
+        - feature_configuration: The feature configuration the rows of features were computed with.
+
+    Representation Invariants:
+        - len(self.items) <= len(self.features)
+        - all(self.items[row] == item for item, row in self.rows.items())
+    """
+    items: list
+    rows: dict[Any, int]
+    features: np.ndarray
+    magnitudes: np.ndarray
+    units: np.ndarray
+    alive: np.ndarray
+    later: list[Optional[dict[int, float]]]
+    floors: np.ndarray
+    top_k: Optional[int]
+    index: Optional[Any]
+    feature_configuration: list[tuple[str, float, float, float]]
+
+    def __init__(self, top_k: Optional[int],
+                 feature_configuration: list[tuple[str, float, float, float]] = FEATURE_CONFIGURATION) -> None:
+        self.items = []
+        self.rows = {}
+        self.features = np.empty((0, len(feature_configuration)))
+        self.magnitudes = np.empty(0)
+        self.units = np.empty((0, len(feature_configuration)))
+        self.alive = np.empty(0, dtype=bool)
+        self.later = []
+        self.floors = np.empty(0)
+        self.top_k = top_k
+        self.index = None
+        self.feature_configuration = feature_configuration
+
+    def append(self, items: list, features: np.ndarray, magnitudes: np.ndarray) -> np.ndarray:
+        """Add a row for every item, with the matching normalized features and squared magnitude
+        as returned by normalized_features, and return the new rows.
+        """
+        start, stop = len(self.items), len(self.items) + len(items)
+        if stop > len(self.features):
+            capacity = max(stop, 2 * len(self.features), 64)
+            self.features = _resized(self.features, capacity, start)
+            self.magnitudes = _resized(self.magnitudes, capacity, start)
+            self.units = _resized(self.units, capacity, start)
+            self.alive = _resized(self.alive, capacity, start)
+            self.floors = _resized(self.floors, capacity, start)
+
+        roots = np.sqrt(magnitudes)[:, None]
+        self.features[start:stop] = features
+        self.magnitudes[start:stop] = magnitudes
+        self.units[start:stop] = np.divide(features, roots, out=np.zeros_like(features), where=roots != 0)
+        self.alive[start:stop] = True
+        self.floors[start:stop] = -np.inf
+
+        for row, item in enumerate(items, start):
+            self.rows[item] = row
+        self.items.extend(items)
+        self.later.extend({} for _ in items)
+
+        new_rows = np.arange(start, stop)
+        if self.index is not None:
+            self.index.insert(new_rows, self.units)
+        return new_rows
+
+    def remove(self, item: Any) -> int:
+        """Remove the row of the given item and return it."""
+        row = self.rows.pop(item)
+        self.items[row] = None
+        self.later[row] = None
+        self.alive[row] = False
+        if self.index is not None:
+            self.index.remove(np.array([row]), self.units)
+        return row
+
+
+class CandidatePool:
+    """A superset of the similarity edges of a list of songs, from which the edges for another
+    threshold, top_k or feature configuration are chosen without comparing every pair again.
+
+    Every song keeps as candidates the size most similar songs listed after it whose similarity
+    score exceeds threshold, under the feature configuration the pool was built with. For that
+    configuration, the edges similar_pairs keeps with any threshold of at least threshold and any
+    top_k of at most size are among the candidates, so edges returns exactly those edges. For other
+    feature configurations, a song can only become the neighbour of a song it was a candidate of,
+    so the edges are an approximation, which gets closer as size grows.
+
+    Instance Attributes:
+        - items: The songs of the pool, in the order they were listed.
+        - sources: The position in items of the first song of every candidate pair.
+        - targets: The position in items of the second song of every candidate pair, which is
+                   listed after the first.
+        - size: The most candidates kept for every song.
+        - threshold: The score every candidate pair exceeded when the pool was built.
+        - feature_configuration: The feature configuration the pool was built with.
+
+    Representation Invariants:
+        - len(self.sources) == len(self.targets)
+        - all(self.sources < self.targets)
+        - self.size > 0
+    """
+    items: list
+    sources: np.ndarray
+    targets: np.ndarray
+    size: int
+    threshold: float
+    feature_configuration: list[tuple[str, float, float, float]]
+
+    def __init__(self, items: list, sources: np.ndarray, targets: np.ndarray, size: int, threshold: float,
+                 feature_configuration: list[tuple[str, float, float, float]]) -> None:
+        self.items = items
+        self.sources = sources.astype(np.int32)
+        self.targets = targets.astype(np.int32)
+        self.size = size
+        self.threshold = threshold
+        self.feature_configuration = feature_configuration
+
+    def __len__(self) -> int:
+        """Return the number of candidate pairs."""
+        return len(self.sources)
+
+    def covers(self, feature_configuration: list[tuple[str, float, float, float]], threshold: float,
+               top_k: Optional[int]) -> bool:
+        """Return whether edges gives exactly the edges of similar_pairs for the given feature
+        configuration, threshold and top_k.
+        """
+        return feature_configuration == self.feature_configuration and threshold >= self.threshold \
+            and top_k is not None and top_k <= self.size
+
+    def edges(self, features: np.ndarray, magnitudes: np.ndarray, threshold: float, top_k: Optional[int],
+              metrics: Optional[Metrics] = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return the (sources, targets, scores) arrays of the candidate pairs similar_pairs would
+        keep for the songs with the given normalized features and squared magnitudes, one row per
+        song of items, with the given threshold and top_k, in the same order.
+
+        If metrics is given, the candidates rescored, and the edges kept or rejected by the
+        threshold or by top_k, are counted there.
+        """
+        scores = pair_scores(features, magnitudes, self.sources, self.targets)
+        passed = scores > threshold
+        sources, targets, scores = self.sources[passed].astype(int), self.targets[passed].astype(int), scores[passed]
+        order = select_top_k(sources, targets, scores, top_k)
+        if metrics is not None:
+            metrics.count('candidates_rescored', len(self))
+            metrics.count('edges_rejected_threshold', len(self) - len(scores))
+            metrics.count('edges_above_threshold', len(scores))
+            metrics.count('edges_accepted', len(order))
+        return sources[order], targets[order], scores[order]
+
+
+def _candidate_pairs(rows: np.ndarray, candidates: list[np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+    """Return the (rows, candidates) pairs obtained by pairing rows[i] with every row of
+    candidates[i] other than itself.
+    """
+    sources = np.repeat(rows, [len(found) for found in candidates])
+    targets = np.concatenate(candidates) if candidates else np.empty(0, dtype=int)
+    different = sources != targets
+    return sources[different], targets[different]
+
+
+def _resized(array: np.ndarray, capacity: int, size: int) -> np.ndarray:
+    """Return a copy of array with room for capacity rows, keeping its first size rows."""
+    resized = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+    resized[:size] = array[:size]
+    return resized
 
 
 class WeightedGraph:
     """A weighted graph used to represent songs and their similarities.
 
+    Vertices are numbered in the order they are added and their numbers are never reused, so
+    every vertex is stored as a few entries of flat lists rather than as an object.
+
+    Instance Attributes:
+        - feature_configuration: The features considered for every song and their weights, in the
+                                 format of _WeightedVertex.feature_configuration. Reassigning it
+                                 changes the similarity scores computed from then on; existing
+                                 edges keep the weights they were added with.
+        - vector_precision: The precision recommend_songs_direct stores the feature vectors it scans
+                            in, one of vector_search.PRECISIONS. It does not change the results.
+
+    To change the feature configuration along with the edges, use reconfigure instead, and to
+    compare several configurations side by side, use variant.
+
     Private Instance Attributes:
-        -_vertices: A collection of the vertices contained in this graph. Maps item to _Vertex object.
+        -_ids: Maps the item of every vertex to its number, in insertion order.
+        -_items: The item of every vertex number, or None if the vertex was removed.
+        -_songs: The metadata of every vertex, in the row numbered like the vertex.
+        -_neighbour_ids: The numbers of the neighbours of every vertex number, in the order the
+                         edges were added.
+        -_neighbour_weights: The weights of the edges in _neighbour_ids.
+        -_ranked: The neighbours of every vertex number sorted by decreasing edge weight, with their
+                  weights, and sorted by number, with their positions in _neighbour_ids, or None if
+                  they have not been sorted since its edges last changed.
+        -_weighted: The feature configuration the weighted features of every vertex number were
+                    last computed for, followed by those features and their magnitude, or None if
+                    they have not been computed since its metadata was last set.
+        -_store: The feature store used to maintain the edges incrementally, created on first use.
+        -_search: The index used by search_songs, created on first use.
+        -_cache: The cache of recommend_songs results, if caching is enabled.
+        -_adjacency: The items of this graph, the row of every item, and the adjacency in the
+                     form returned by to_csr, created on first use by the batch and multi-hop
+                     recommendations.
+        -_walk: The random walk over _adjacency used by recommend_songs_multi_hop, created on
+                first use.
+        -_vectors: The items of this graph, the row of every item, the vector search over their
+                   features used by recommend_songs_direct and the feature configuration it was
+                   created with, created on first use.
+        -_metrics: The metrics the stages of building and querying this graph are recorded in,
+                   if instrumentation is enabled.
+        -_pool_settings: The size and threshold of the candidate pool kept by add_similarity_edges
+                         and reconfigure, if one is kept.
+        -_pool: The candidate pool of the songs of this graph, if one is kept and has been built
+                since the songs last changed.
+        -_shared: Whether the songs of this graph are shared with another graph by variant, in
+                  which case they can no longer change.
     """
-    _vertices: dict[Any, _WeightedVertex]
+    _ids: dict[Any, int]
+    _items: list
+    _songs: MetadataStore
+    _neighbour_ids: list[array]
+    _neighbour_weights: list[array]
+    _ranked: list[Optional[tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]]
+    _weighted: list[Optional[tuple]]
+    feature_configuration: list[tuple[str, float, float, float]]
+    vector_precision: str
+    _store: Optional[_FeatureStore]
+    _search: Optional[SongSearchIndex]
+    _cache: Optional[RecommendationCache]
+    _adjacency: Optional[tuple[list, dict[Any, int], np.ndarray, np.ndarray, np.ndarray]]
+    _walk: Optional[RandomWalk]
+    _vectors: Optional[tuple[list, dict[Any, int], VectorSearch, list]]
+    _metrics: Optional[Metrics]
+    _pool_settings: Optional[tuple[int, float]]
+    _pool: Optional[CandidatePool]
+    _shared: bool
 
     def __init__(self) -> None:
-        self._vertices = {}
+        self._ids = {}
+        self._items = []
+        self._songs = MetadataStore()
+        self._neighbour_ids = []
+        self._neighbour_weights = []
+        self._ranked = []
+        self._weighted = []
+        self.feature_configuration = FEATURE_CONFIGURATION
+        self.vector_precision = 'float32'
+        self._store = None
+        self._search = None
+        self._cache = None
+        self._adjacency = None
+        self._walk = None
+        self._vectors = None
+        self._metrics = None
+        self._pool_settings = None
+        self._pool = None
+        self._shared = False
 
     def add_vertex(self, item: Any, metadata: Optional[dict] = None) -> None:
         """Add a song vertex to the graph.
@@ -106,101 +641,1054 @@ class WeightedGraph:
         The new vertex is not adjacent to any other vertices.
         Do nothing if the given item is already in this graph.
         """
-        if item not in self._vertices:
-            self._vertices[item] = _WeightedVertex(item, metadata)
+        if item not in self._ids:
+            self._register(item, metadata)
+            if self._store is not None:
+                self._store.append([item], *self._normalized_features([self._ids[item]]))
+
+    def remove_edge(self, item1: Any, item2: Any) -> None:
+        """Remove the edge between item1 and item2.
+
+        Raise a ValueError if item1 and item2 are not adjacent in this graph.
+        """
+        if item1 not in self._ids or item2 not in self._ids:
+            raise ValueError
+        id1, id2 = self._ids[item1], self._ids[item2]
+        if id2 not in self._neighbour_ids[id1]:
+            raise ValueError
+        self._unlink(id1, id2)
+        self._unlink(id2, id1)
+
+    def ingest(self, rows: Iterable[dict], chunk_size: int = 1000, threshold: float = 0.3,
+               top_k: Optional[int] = 20, index: Optional[Any] = None) -> None:
+        """Add the songs described by rows, an iterable of metadata dictionaries like the ones
+        main.read_songs yields, and connect them to the rest of the graph.
+
+        Every song keeps edges to the top_k most similar songs added after it whose similarity
+        score exceeds threshold, so ingesting rows produces the same edges as rebuilding the graph
+        with the rows appended to its catalog. Existing songs adopt the new songs that beat their
+        weakest later neighbour, dropping that neighbour in place. Songs are keyed by their track_id,
+        and a row whose track_id is already in the graph replaces that song.
+
+        rows is consumed chunk_size rows at a time, so memory use is bounded by the chunk size.
+        Without index every chunk is scored against the whole catalog with array operations. With
+        an index like neighbour_index.RandomProjectionForest, only the songs it proposes are scored,
+        so the cost of a chunk depends on its size rather than on the size of the catalog.
+        """
+        self._feature_store(top_k, index)
+        chunk = []
+        for metadata in rows:
+            chunk.append(metadata)
+            if len(chunk) == chunk_size:
+                self._ingest_chunk(chunk, threshold, top_k)
+                chunk = []
+        if chunk:
+            self._ingest_chunk(chunk, threshold, top_k)
+
+    def remove_songs(self, items: Iterable, threshold: float = 0.3, top_k: Optional[int] = 20,
+                     index: Optional[Any] = None) -> None:
+        """Remove the given songs and their edges from this graph.
+
+        Every remaining song that loses one of its top_k later neighbours is given the next most
+        similar later song instead, with the same threshold, top_k and index as ingest.
+
+        Raise a ValueError if an item does not appear as a vertex in this graph.
+        """
+        store = self._feature_store(top_k, index)
+        items = list(items)
+        if any(item not in self._ids for item in items):
+            raise ValueError
+
+        affected = set()
+        for item in items:
+            vertex_id = self._ids[item]
+            row = store.remove(item)
+            for neighbour in self._neighbour_ids[vertex_id].tolist():
+                if neighbour != vertex_id:
+                    self._unlink(neighbour, vertex_id)
+                    neighbour_row = store.rows[self._items[neighbour]]
+                    if neighbour_row < row:
+                        store.later[neighbour_row].pop(row, None)
+                        affected.add(neighbour_row)
+            self._unregister(item)
+
+        sources = np.array(sorted(row for row in affected if store.alive[row]), dtype=int)
+        self._offer(*self._later_candidates(sources, threshold, top_k), top_k)
+
+    def _register(self, item: Any, metadata: Optional[dict]) -> None:
+        """Number the vertex of a new item, with no neighbours, and add it to the name indexes.
+
+        Raise a ValueError if the songs of this graph are shared with another graph.
+        """
+        if self._shared:
+            raise ValueError('the songs of a graph shared by variant cannot change')
+        metadata = metadata if metadata is not None else {}
+        self._ids[item] = self._songs.append(metadata)
+        self._items.append(item)
+        self._neighbour_ids.append(array('l'))
+        self._neighbour_weights.append(array('d'))
+        self._ranked.append(None)
+        self._weighted.append(None)
+        self._adjacency = None
+        self._walk = None
+        self._vectors = None
+        self._pool = None
+
+        if self._search is not None:
+            self._search.add(item, metadata.get('track_name', ''), metadata.get('popularity', 0))
+
+    def _unregister(self, item: Any) -> None:
+        """Remove the vertex of item, which must have no neighbours other than itself, from this
+        graph and the name indexes.
+
+        Raise a ValueError if the songs of this graph are shared with another graph.
+        """
+        if self._shared:
+            raise ValueError('the songs of a graph shared by variant cannot change')
+        vertex_id = self._ids.pop(item)
+        self._items[vertex_id] = None
+        self._songs.remove(vertex_id)
+        self._neighbour_ids[vertex_id] = array('l')
+        self._neighbour_weights[vertex_id] = array('d')
+        self._ranked[vertex_id] = None
+        self._weighted[vertex_id] = None
+        self._adjacency = None
+        self._walk = None
+        self._vectors = None
+        self._pool = None
+        if self._cache is not None:
+            self._cache.invalidate(item)
+
+        if self._search is not None:
+            self._search.remove(item)
+
+    def _weighted_features(self, vertex_id: int) -> tuple[tuple[float, ...], float]:
+        """Return the weighted features of vertex number vertex_id and their magnitude, computing
+        them if its metadata or the feature configuration changed since they were last computed.
+        """
+        cached = self._weighted[vertex_id]
+        if cached is None or cached[0] is not self.feature_configuration:
+            cached = (self.feature_configuration,
+                      *weighted_features(self._songs.get(vertex_id), self.feature_configuration))
+            self._weighted[vertex_id] = cached
+        return cached[1], cached[2]
+
+    def _normalized_features(self, vertex_ids: list[int]) -> tuple[np.ndarray, np.ndarray]:
+        """Return the normalized feature matrix and squared magnitudes of the given vertex numbers,
+        as returned by normalized_features for their metadata.
+        """
+        columns = [self._songs.column(feature, vertex_ids) for feature, _, _, _ in self.feature_configuration]
+        return normalized_columns(columns, len(vertex_ids), self.feature_configuration)
+
+    def _set_metadata(self, vertex_id: int, metadata: dict) -> None:
+        """Replace the metadata of vertex number vertex_id.
+
+        The recommendations of its neighbours, which include its metadata, are invalidated.
+        Raise a ValueError if the songs of this graph are shared with another graph.
+        """
+        if self._shared:
+            raise ValueError('the songs of a graph shared by variant cannot change')
+        self._songs.replace(vertex_id, metadata)
+        self._weighted[vertex_id] = None
+        self._vectors = None
+        self._pool = None
+        if self._cache is not None:
+            for neighbour in self._neighbour_ids[vertex_id]:
+                self._cache.invalidate(self._items[neighbour])
+
+    def _link(self, id1: int, id2: int, weight: float, new: bool = False) -> None:
+        """Set the weight of the edge from vertex number id1 to id2, adding it if needed.
+
+        If new is True, the caller knows there is no such edge yet, and it is added without
+        searching the neighbours of id1 for it.
+        """
+        self._adjacency = None
+        self._walk = None
+        self._ranked[id1] = None
+        if self._cache is not None:
+            self._cache.invalidate(self._items[id1])
+        neighbour_ids = self._neighbour_ids[id1]
+        if not new and id2 in neighbour_ids:
+            self._neighbour_weights[id1][neighbour_ids.index(id2)] = weight
+        else:
+            neighbour_ids.append(id2)
+            self._neighbour_weights[id1].append(weight)
+
+    def _link_new(self, id1: int, id2: int, weight: float) -> None:
+        """Add an edge of the given weight between vertex numbers id1 and id2, or set its weight if
+        there is one already, searching only the shorter of their lists of neighbours for it.
+        """
+        if len(self._neighbour_ids[id1]) <= len(self._neighbour_ids[id2]):
+            new = id2 not in self._neighbour_ids[id1]
+        else:
+            new = id1 not in self._neighbour_ids[id2]
+        self._link(id1, id2, weight, new)
+        self._link(id2, id1, weight, new)
+
+    def _unlink(self, id1: int, id2: int) -> None:
+        """Remove the edge from vertex number id1 to id2, if there is one."""
+        self._adjacency = None
+        self._walk = None
+        self._ranked[id1] = None
+        if self._cache is not None:
+            self._cache.invalidate(self._items[id1])
+        neighbour_ids = self._neighbour_ids[id1]
+        try:
+            position = neighbour_ids.index(id2)
+        except ValueError:
+            return
+        neighbour_ids.pop(position)
+        self._neighbour_weights[id1].pop(position)
+
+    def _feature_store(self, top_k: Optional[int], index: Optional[Any]) -> _FeatureStore:
+        """Return the feature store of this graph, creating it from the current vertices if needed,
+        with its floors computed for top_k and its rows held by index.
+
+        The store is recreated if the feature configuration changed since it was created.
+        """
+        if self._store is not None and self._store.feature_configuration is not self.feature_configuration:
+            self._discard_store()
+
+        if self._store is None:
+            # Floors start unset, so they are computed from the existing edges below
+            self._store = _FeatureStore(None, self.feature_configuration)
+            items = list(self._ids)
+            self._store.append(items, *self._normalized_features([self._ids[item] for item in items]))
+            for row, item in enumerate(items):
+                vertex_id = self._ids[item]
+                for neighbour, weight in zip(self._neighbour_ids[vertex_id], self._neighbour_weights[vertex_id]):
+                    neighbour_row = self._store.rows[self._items[neighbour]]
+                    if neighbour_row > row:
+                        self._store.later[row][neighbour_row] = weight
+
+        store = self._store
+        if store.top_k != top_k:
+            store.top_k = top_k
+            for row in np.flatnonzero(store.alive[:len(store.items)]).tolist():
+                self._update_floor(row, store.later[row], top_k)
+
+        if index is not None and store.index is not index:
+            store.index = index
+            index.insert(np.flatnonzero(store.alive[:len(store.items)]), store.units)
+        return store
+
+    def _discard_store(self) -> None:
+        """Drop the feature store of this graph, removing its rows from its index."""
+        old_store, self._store = self._store, None
+        if old_store is not None and old_store.index is not None:
+            old_store.index.remove(np.flatnonzero(old_store.alive[:len(old_store.items)]), old_store.units)
+
+    def _ingest_chunk(self, chunk: list[dict], threshold: float, top_k: Optional[int]) -> None:
+        """Add the songs of one chunk of rows and connect them to the rest of the graph."""
+        latest = {metadata['track_id']: metadata for metadata in chunk}
+        replaced = [item for item in latest if item in self._ids]
+        if replaced:
+            self.remove_songs(replaced, threshold, top_k, self._store.index)
+
+        items = list(latest)
+        for item in items:
+            self._register(item, latest[item])
+        new_rows = self._store.append(items, *self._normalized_features([self._ids[item] for item in items]))
+        self._offer(*self._earlier_candidates(new_rows, threshold), top_k)
+
+    def _earlier_candidates(self, targets: np.ndarray, threshold: float
+                            ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return the (sources, targets, scores) of the pairs in which a row in targets scores above
+        threshold and above the floor of an earlier source row.
+        """
+        store = self._store
+        if store.index is not None:
+            sources, paired = _candidate_pairs(targets, store.index.candidates(targets, store.units))
+            sources, paired = np.minimum(sources, paired), np.maximum(sources, paired)
+        else:
+            size = int(targets.max()) + 1 if len(targets) else 0
+            block_size = max(1, _BLOCK_ELEMENTS // max(len(targets), 1))
+            all_sources, all_targets = [], []
+            for lo in range(0, size, block_size):
+                hi = min(lo + block_size, size)
+                raw = similarity_block(store.features, store.magnitudes, slice(lo, hi), targets)
+                floors = np.maximum(store.floors[lo:hi], threshold)[:, None]
+                keep = (raw * raw > floors - _SCORE_TOLERANCE) & store.alive[lo:hi, None]
+                keep &= np.arange(lo, hi)[:, None] < targets[None, :]
+                rows, cols = np.nonzero(keep)
+                all_sources.append(rows + lo)
+                all_targets.append(targets[cols])
+            sources = np.concatenate(all_sources) if all_sources else np.empty(0, dtype=int)
+            paired = np.concatenate(all_targets) if all_targets else np.empty(0, dtype=int)
+
+        scores = pair_scores(store.features, store.magnitudes, sources, paired)
+        keep = (scores > threshold) & (scores > store.floors[sources] - _SCORE_TOLERANCE)
+        return sources[keep], paired[keep], scores[keep]
+
+    def _later_candidates(self, sources: np.ndarray, threshold: float, top_k: Optional[int]
+                          ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return the (sources, targets, scores) of the best pairs in which a later target row scores
+        above threshold for a row in sources.
+        """
+        store = self._store
+        size = len(store.items)
+        if store.index is not None:
+            all_sources, targets = _candidate_pairs(sources, store.index.candidates(sources, store.units))
+            keep = (targets > all_sources) & store.alive[targets]
+            all_sources, targets = all_sources[keep], targets[keep]
+        else:
+            found_sources, found_targets = [], []
+            for source in sources.tolist():
+                raw = similarity_block(store.features, store.magnitudes, slice(source, source + 1),
+                                       slice(source + 1, size))[0]
+                approx = np.where(store.alive[source + 1:size], raw * raw, -np.inf)
+                keep = approx > threshold - _SCORE_TOLERANCE
+                if top_k is not None and top_k < len(approx):
+                    kth = np.partition(approx, len(approx) - top_k)[len(approx) - top_k]
+                    keep &= approx >= kth - _SCORE_TOLERANCE
+                found_targets.append(np.flatnonzero(keep) + source + 1)
+                found_sources.append(np.full(len(found_targets[-1]), source))
+            all_sources = np.concatenate(found_sources) if found_sources else np.empty(0, dtype=int)
+            targets = np.concatenate(found_targets) if found_targets else np.empty(0, dtype=int)
+
+        scores = pair_scores(store.features, store.magnitudes, all_sources, targets)
+        keep = scores > threshold
+        return all_sources[keep], targets[keep], scores[keep]
+
+    def _offer(self, sources: np.ndarray, targets: np.ndarray, scores: np.ndarray, top_k: Optional[int]) -> None:
+        """Offer every target row as a later neighbour of the matching source row, so that each source
+        keeps the top_k best of its current and offered later neighbours.
+        """
+        store = self._store
+        order = np.lexsort((targets, sources))
+        sources, targets, scores = sources[order].tolist(), targets[order].tolist(), scores[order].tolist()
+
+        start = 0
+        while start < len(sources):
+            stop = start
+            while stop < len(sources) and sources[stop] == sources[start]:
+                stop += 1
+            source = sources[start]
+            current = store.later[source]
+            offered = dict(current)
+            offered.update(zip(targets[start:stop], scores[start:stop]))
+            kept = sorted(offered.items(), key=lambda x: (-x[1], x[0]))[:top_k]
+
+            source_item = store.items[source]
+            kept_rows = {row for row, _ in kept}
+            for row in current:
+                if row not in kept_rows:
+                    self.remove_edge(source_item, store.items[row])
+            for row, score in kept:
+                if row not in current:
+                    self._link_new(self._ids[source_item], self._ids[store.items[row]], score)
+            store.later[source] = dict(kept)
+            self._update_floor(source, store.later[source], top_k)
+            start = stop
+
+    def _update_floor(self, row: int, later: dict[int, float], top_k: Optional[int]) -> None:
+        """Record the lowest weight among the later neighbours of row if it has top_k of them."""
+        if top_k is not None and len(later) >= top_k:
+            self._store.floors[row] = sorted(later.values(), reverse=True)[top_k - 1]
+        else:
+            self._store.floors[row] = -np.inf
 
     def add_edge(self, item1: Any, item2: Any, weight: Optional[float] = None) -> None:
         """Add a weighted edge between two songs, item1 and item2, and the given weight.
 
         Raise a ValueError if item1 or item2 do not appear as vertices in this graph.
         """
-        if item1 in self._vertices and item2 in self._vertices:
-            v1 = self._vertices[item1]
-            v2 = self._vertices[item2]
-            weight = weight if weight is not None else v1.similarity_score(v2)
-            v1.neighbours[v2] = weight
-            v2.neighbours[v1] = weight
+        if item1 in self._ids and item2 in self._ids:
+            id1, id2 = self._ids[item1], self._ids[item2]
+            if weight is None:
+                weight = _cached_similarity(*self._weighted_features(id1), *self._weighted_features(id2))
+            self._link(id1, id2, weight)
+            self._link(id2, id1, weight)
         else:
             raise ValueError
 
+    def add_similarity_edges(self, items: list, threshold: float = 0.3, top_k: Optional[int] = 20,
+                             index: Optional[Any] = None) -> None:
+        """Connect every item in items to the top_k most similar items listed after it whose
+        similarity score exceeds threshold.
+
+        Edges are added in the same order, and with the same weights, as comparing every pair
+        with get_similarity_score and stable-sorting each item's matches by descending score.
+        If index is given, it must have a similar_pairs method like
+        neighbour_index.RandomProjectionForest, and only the pairs it proposes are compared.
+        parallel_build.ParallelBuilder proposes every pair, and compares them on several processes.
+        Only the exact serial build counts the pairs it compares and rejects in the metrics of this graph;
+        a build from a candidate pool counts the candidates it rescores and rejects instead.
+        If a candidate pool is kept (see use_candidate_pool), it is built for items in the same
+        pass, and the edges are chosen from it.
+
+        Raise a ValueError if an item does not appear as a vertex in this graph.
+        """
+        if any(item not in self._ids for item in items):
+            raise ValueError
+
+        metrics = self._metrics
+        with DISABLED if metrics is None else metrics.stage('features'):
+            features, magnitudes = self._normalized_features([self._ids[item] for item in items])
+        with DISABLED if metrics is None else metrics.stage('similar_pairs'):
+            if self._pool_settings is not None:
+                self._pool = self._build_pool(list(items), features, magnitudes, *self._pool_settings, index)
+                sources, targets, scores = self._pool.edges(features, magnitudes, threshold, top_k, metrics)
+            elif index is None:
+                sources, targets, scores = similar_pairs(features, magnitudes, threshold, top_k, metrics=metrics)
+            else:
+                sources, targets, scores = index.similar_pairs(features, magnitudes, threshold, top_k)
+                if metrics is not None:
+                    metrics.count('edges_accepted', len(scores))
+        with DISABLED if metrics is None else metrics.stage('link'):
+            self._link_pairs([self._ids[item] for item in items], sources, targets, scores)
+
+    def use_candidate_pool(self, size: Optional[int] = 64, threshold: float = 0.0) -> None:
+        """Keep a candidate pool of the size most similar later songs of every song scoring above
+        threshold, so that reconfigure and variant only score those pairs again, or stop keeping
+        one if size is None.
+
+        The pool is built by the next call to add_similarity_edges, reconfigure or variant, and
+        again whenever songs are added, removed or changed. It is exact for reconfigurations
+        that keep the feature configuration, with a threshold of at least threshold and a top_k
+        of at most size; see CandidatePool. It takes 8 bytes per candidate pair.
+        """
+        self._pool_settings = None if size is None else (size, threshold)
+        self._pool = None
+
+    def reconfigure(self, feature_configuration: list[tuple[str, float, float, float]],
+                    threshold: float = 0.3, top_k: Optional[int] = 20, index: Optional[Any] = None) -> None:
+        """Replace the feature configuration of this graph, and all its edges with the edges
+        add_similarity_edges would give every song, in insertion order, under that configuration
+        with the given threshold and top_k.
+
+        If a candidate pool is kept, only its pairs are scored again, so reconfiguring is
+        cheap, but the edges are only exact under the conditions described by CandidatePool;
+        it is built first if needed, comparing the pairs proposed by index if given, or every
+        pair otherwise. Without a pool, every pair is compared again, like add_similarity_edges
+        does. Edges added with add_edge are dropped, and the edges of songs ingested afterwards
+        are chosen by ingest with its own threshold and top_k.
+        """
+        metrics = self._metrics
+        if metrics is None:
+            self._reconfigure(feature_configuration, threshold, top_k, index)
+        else:
+            with metrics.operation('reconfigure'):
+                self._reconfigure(feature_configuration, threshold, top_k, index)
+
+    def _reconfigure(self, feature_configuration: list[tuple[str, float, float, float]],
+                     threshold: float, top_k: Optional[int], index: Optional[Any]) -> None:
+        """Reconfigure this graph as described by reconfigure."""
+        metrics = self._metrics
+        items = list(self._ids)
+        vertex_ids = [self._ids[item] for item in items]
+        self.feature_configuration = feature_configuration
+        with DISABLED if metrics is None else metrics.stage('features'):
+            features, magnitudes = self._normalized_features(vertex_ids)
+
+        with DISABLED if metrics is None else metrics.stage('candidates'):
+            pool = self._pool
+            if pool is None or pool.items != items:
+                settings = self._pool_settings
+                if settings is None:
+                    settings = (top_k if top_k is not None else max(len(items), 1), threshold)
+                pool = self._build_pool(items, features, magnitudes, *settings, index)
+                if self._pool_settings is not None:
+                    self._pool = pool
+            sources, targets, scores = pool.edges(features, magnitudes, threshold, top_k, metrics)
+
+        with DISABLED if metrics is None else metrics.stage('link'):
+            for vertex_id in vertex_ids:
+                self._neighbour_ids[vertex_id] = array('l')
+                self._neighbour_weights[vertex_id] = array('d')
+                self._ranked[vertex_id] = None
+            # The random walk holds the scores precomputed for the old edges too
+            self._adjacency = None
+            self._walk = None
+            if self._cache is not None:
+                self._cache.clear()
+            self._discard_store()
+            self._link_pairs(vertex_ids, sources, targets, scores)
+
+    def variant(self, feature_configuration: list[tuple[str, float, float, float]],
+                threshold: float = 0.3, top_k: Optional[int] = 20, index: Optional[Any] = None) -> WeightedGraph:
+        """Return a graph of the songs of this graph with the feature configuration and edges that
+        reconfigure would give them, leaving this graph unchanged.
+
+        The new graph shares the metadata and candidate pool of this graph instead of copying
+        them, so several configurations can be compared side by side, for example in an A/B
+        test, at the cost of one set of edges each. Songs can no longer be added to, removed
+        from or changed in either graph afterwards.
+        """
+        graph = WeightedGraph()
+        graph._ids = dict(self._ids)
+        graph._items = list(self._items)
+        graph._songs = self._songs
+        graph._neighbour_ids = [array('l') for _ in self._items]
+        graph._neighbour_weights = [array('d') for _ in self._items]
+        graph._ranked = [None] * len(self._items)
+        graph._weighted = [None] * len(self._items)
+        graph.vector_precision = self.vector_precision
+        graph._metrics = self._metrics
+        graph._pool_settings = self._pool_settings
+
+        if self._pool_settings is not None:
+            items = list(self._ids)
+            if self._pool is None or self._pool.items != items:
+                features, magnitudes = self._normalized_features([self._ids[item] for item in items])
+                self._pool = self._build_pool(items, features, magnitudes, *self._pool_settings, index)
+            graph._pool = self._pool
+
+        graph.reconfigure(feature_configuration, threshold, top_k, index)
+        self._shared = graph._shared = True
+        return graph
+
+    def _build_pool(self, items: list, features: np.ndarray, magnitudes: np.ndarray, size: int,
+                    threshold: float, index: Optional[Any]) -> CandidatePool:
+        """Return the candidate pool of the given items, with the given normalized features and
+        squared magnitudes under the current feature configuration, comparing the pairs proposed by
+        index if given, or every pair otherwise.
+
+        The pairs compared are not counted in the metrics of this graph, since the pool keeps
+        them under its own threshold and size; CandidatePool.edges counts the edges chosen.
+        """
+        if index is None:
+            sources, targets, _ = similar_pairs(features, magnitudes, threshold, size)
+        else:
+            sources, targets, _ = index.similar_pairs(features, magnitudes, threshold, size)
+        return CandidatePool(items, sources, targets, size, threshold, self.feature_configuration)
+
+    def _link_pairs(self, vertex_ids: list[int], sources: np.ndarray, targets: np.ndarray,
+                    scores: np.ndarray) -> None:
+        """Link the vertices vertex_ids[sources[i]] and vertex_ids[targets[i]] with weight scores[i],
+        in order, counting the edges linked in the metrics of this graph.
+        """
+        metrics = self._metrics
+        # The pairs are distinct, so an edge can only exist already among the edges a vertex had before
+        degrees = [len(self._neighbour_ids[vertex_id]) for vertex_id in vertex_ids]
+        for lo in range(0, len(scores), _LINK_CHUNK):
+            for source, target, score in zip(sources[lo:lo + _LINK_CHUNK].tolist(),
+                                             targets[lo:lo + _LINK_CHUNK].tolist(),
+                                             scores[lo:lo + _LINK_CHUNK].tolist()):
+                id1, id2 = vertex_ids[source], vertex_ids[target]
+                new = degrees[source] == 0 or degrees[target] == 0 \
+                    or id2 not in self._neighbour_ids[id1][:degrees[source]]
+                self._link(id1, id2, score, new)
+                self._link(id2, id1, score, new)
+            if metrics is not None:
+                metrics.count('edges_linked', min(_LINK_CHUNK, len(scores) - lo))
+
     def get_vertex(self, item: Any) -> Optional['_WeightedVertex']:
         """Return the vertex for the given item if it exists."""
-        return self._vertices.get(item)
+        vertex_id = self._ids.get(item)
+        if vertex_id is None:
+            return None
+        return _WeightedVertex(item, None, self)
+
+    def get_neighbours(self, item: Any) -> dict[Any, float]:
+        """Return the items adjacent to the given item, mapped to the edge weights, in the order
+        the edges were added.
+
+        Raise a ValueError if item does not appear as a vertex in this graph.
+        """
+        if item not in self._ids:
+            raise ValueError
+        vertex_id = self._ids[item]
+        return {self._items[neighbour]: weight
+                for neighbour, weight in zip(self._neighbour_ids[vertex_id], self._neighbour_weights[vertex_id])}
 
     def get_all_vertices(self) -> set:
         """Return a set of all vertex items in this weighted graph."""
-        return set(self._vertices.keys())
+        return set(self._ids.keys())
+
+    def to_csr(self) -> tuple[list, np.ndarray, np.ndarray, np.ndarray]:
+        """Return the items of this graph in insertion order, along with its adjacency in
+        compressed sparse row form (indptr, indices, weights).
+
+        The neighbours of items[i] are indices[indptr[i]:indptr[i + 1]], with the matching
+        weights, in the order their edges were added.
+        """
+        items = list(self._ids)
+        vertex_ids = [self._ids[item] for item in items]
+        positions = np.full(len(self._items), -1, dtype=np.int64)
+        positions[vertex_ids] = np.arange(len(items))
+
+        indptr = np.zeros(len(items) + 1, dtype=np.int64)
+        np.cumsum([len(self._neighbour_ids[vertex_id]) for vertex_id in vertex_ids], out=indptr[1:])
+        indices, weights = np.empty(indptr[-1], dtype=np.int64), np.empty(indptr[-1])
+        for i, vertex_id in enumerate(vertex_ids):
+            indices[indptr[i]:indptr[i + 1]] = positions[np.frombuffer(self._neighbour_ids[vertex_id], dtype=np.int_)]
+            weights[indptr[i]:indptr[i + 1]] = np.frombuffer(self._neighbour_weights[vertex_id])
+        return items, indptr, indices, weights
 
     def get_similarity_score(self, item1: Any, item2: Any) -> float:
         """Return the similarity score between two vertices."""
-        v1 = self._vertices.get(item1)
-        v2 = self._vertices.get(item2)
-        if v1 is None or v2 is None:
+        id1, id2 = self._ids.get(item1), self._ids.get(item2)
+        if id1 is None or id2 is None:
             raise ValueError()
-        return v1.similarity_score(v2)
+        return _cached_similarity(*self._weighted_features(id1), *self._weighted_features(id2))
+
+    def find_song_id(self, song_name: str) -> Optional[Any]:
+        """Find a song's vertex key (its track_id) by its track name (case-insensitive)."""
+        vertex_ids = self._songs.find(song_name.lower().strip())
+        return self._items[vertex_ids[0]] if vertex_ids else None  # The first vertex added with that name, if any
 
-    def find_song_id(self, song_name: str) -> Optional[str]:
-        """Find a song's vertex key (track name) by its name (case-insensitive)."""
-        target_name = song_name.lower().strip()
-        for vertex_key, vertex in self._vertices.items():
-            if vertex.metadata.get('track_name', '').lower() == target_name:
-                return vertex_key  # Return the vertex's key (track name)
-        return None  # Song not found
+    def search_songs(self, query: str, limit: int = 10) -> list:
+        """Return the keys of up to limit songs whose track name matches the free-text query,
+        best matches first.
+
+        Matching ignores case, accents, punctuation and featured artist credits, and tolerates
+        typos; see search.SongSearchIndex.
+        """
+        if self._search is None:
+            self._search = SongSearchIndex()
+            for item, vertex_id in self._ids.items():
+                self._search.add(item, self._songs.value(vertex_id, 'track_name', ''),
+                                 self._songs.value(vertex_id, 'popularity', 0))
+        return self._search.search(query, limit)
+
+    def use_cache(self, cache: Optional[RecommendationCache]) -> None:
+        """Cache the results of recommend_songs in the given cache, or stop caching if it is None.
+
+        Queries are keyed on their seed songs, in any order, and their limit. Entries are
+        invalidated whenever an edge of one of their seed songs, or the metadata of one of
+        the songs they recommend, changes.
+        """
+        self._cache = cache
+
+    def use_metrics(self, metrics: Optional[Metrics]) -> None:
+        """Record the stages of building and querying this graph in the given metrics, or stop
+        recording them if it is None.
+        """
+        self._metrics = metrics
 
     def recommend_songs(self, song_names: List[str], limit: int = 5) -> List[Dict]:
-        """Generate recommendations based on multiple seed songs."""
+        """Generate recommendations based on multiple seed songs.
+
+        If caching is enabled, the seed songs are looked up first and the recommendations are
+        cached for them in the order given, since the order of the seeds can break ties, so the
+        results are the same with or without the cache.
+        """
+        if self._metrics is not None:
+            with self._metrics.operation('recommend_songs'):
+                return self._recommend_cached(song_names, limit)
+        return self._recommend_cached(song_names, limit)
+
+    def _recommend_cached(self, song_names: List[str], limit: int) -> List[Dict]:
+        """Return the recommendations for the given seed songs, using the cache if it is enabled."""
+        if self._cache is None:
+            return self._recommend(song_names, limit)
+
+        seeds = [song_id for song_id in map(self._resolve, song_names) if song_id]
+        key = (tuple(seeds), limit)
+        results = self._cache.get(key)
+        if results is None:
+            results = self._recommend(seeds, limit)
+            self._cache.put(key, results, set(seeds))
+        elif self._metrics is not None:
+            self._metrics.count('cache_hits')
+        return [dict(result) for result in results]
+
+    def recommend_songs_batch(self, seed_lists: Iterable[List[str]], limit: int = 5,
+                              chunk_size: int = 10000) -> List[List[Dict]]:
+        """Return the recommendations for every list of seed songs in seed_lists, exactly as
+        recommend_songs would, computing up to chunk_size lists at a time.
+
+        The seed lists of a chunk are encoded as a sparse matrix of users by seed songs and
+        multiplied by the adjacency of the graph: every seed song's row of neighbour weights is
+        expanded and the products are summed per (user, neighbour) pair. The sums are
+        accumulated one seed position at a time, in the order recommend_songs adds them, so
+        the averages are identical. Ties are broken by popularity and then by the order
+        recommend_songs first meets each neighbour.
+        """
+        results = []
+        batch = []
+        for seed_list in seed_lists:
+            batch.append(seed_list)
+            if len(batch) == chunk_size:
+                results.extend(self._recommend_chunk(batch, limit))
+                batch = []
+        if batch:
+            results.extend(self._recommend_chunk(batch, limit))
+        return results
+
+    def _recommend_chunk(self, seed_lists: list[List[str]], limit: int) -> List[List[Dict]]:
+        """Return the recommendations for every list of seed songs in seed_lists."""
+        items, rows_of, indptr, indices, weights = self._csr()
+        n = len(items)
+
+        # The (user, seed row) entries of the sparse seed matrix, by position in the seed list
+        users, seeds, positions, skipped = [], [], [], []
+        for user, song_names in enumerate(seed_lists):
+            position = 0
+            for name in song_names:
+                song_id = self._resolve(name)
+                if song_id:
+                    users.append(user)
+                    seeds.append(rows_of[song_id])
+                    positions.append(position)
+                    position += 1
+                    skipped.append(user * n + rows_of[song_id])
+
+        users, seeds, positions = np.array(users, dtype=np.int64), np.array(seeds, dtype=np.int64), \
+            np.array(positions, dtype=np.int64)
+        counts = indptr[seeds + 1] - indptr[seeds]
+        edges = np.repeat(indptr[seeds] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        users, positions = np.repeat(users, counts), np.repeat(positions, counts)
+        neighbours, contributions = indices[edges], weights[edges]
+        # The order recommend_songs meets every contribution in
+        met = positions * (int(counts.max(initial=0)) + 1) + (edges - np.repeat(indptr[seeds], counts))
+
+        keys = users * n + neighbours
+        kept = ~np.isin(keys, skipped)
+        keys, positions, contributions, met = keys[kept], positions[kept], contributions[kept], met[kept]
+
+        pairs, slots = np.unique(keys, return_inverse=True)
+        totals = np.zeros(len(pairs))
+        for position in range(int(positions.max(initial=-1)) + 1):
+            at = positions == position
+            np.add.at(totals, slots[at], contributions[at])
+        hits = np.bincount(slots, minlength=len(pairs))
+        first_met = np.full(len(pairs), np.iinfo(np.int64).max)
+        np.minimum.at(first_met, slots, met)
+
+        pair_users, pair_rows = pairs // n, pairs % n
+        scores = totals / hits
+        # Only the pairs scoring at least the limit-th best score of their user can be returned
+        by_score = np.argsort(-scores)
+        by_score = by_score[np.argsort(pair_users[by_score], kind='stable')]
+        ranks = np.arange(len(by_score)) - np.searchsorted(pair_users[by_score], pair_users[by_score], side='left')
+        cutoffs = np.full(len(seed_lists), -np.inf)
+        cutoffs[pair_users[by_score[ranks == limit - 1]]] = scores[by_score[ranks == limit - 1]]
+        candidates = np.flatnonzero((scores >= cutoffs[pair_users]) & (limit > 0))
+        popularity_of = np.zeros(n)
+        candidate_rows = np.unique(pair_rows[candidates])
+        popularity_of[candidate_rows] = self._songs.column(
+            'popularity', [self._ids[items[row]] for row in candidate_rows.tolist()], 0.0)
+
+        order = candidates[np.lexsort((first_met[candidates], -popularity_of[pair_rows[candidates]],
+                                       -scores[candidates], pair_users[candidates]))]
+        ranks = np.arange(len(order)) - np.searchsorted(pair_users[order], pair_users[order], side='left')
+        order = order[ranks < limit]
+
+        results = [[] for _ in seed_lists]
+        for user, row, score in zip(pair_users[order].tolist(), pair_rows[order].tolist(), scores[order].tolist()):
+            metadata = self._songs.get(self._ids[items[row]])
+            results[user].append({
+                'track': metadata['track_name'],
+                'artist': metadata['artists'],
+                'album': metadata['album_name'],
+                'score': score,
+                'popularity': metadata.get('popularity', 0)
+            })
+        return results
+
+    def recommend_songs_multi_hop(self, song_names: List[str], limit: int = 5, restart: float = 0.15,
+                                  max_iterations: int = 50, tolerance: float = 1e-6,
+                                  time_limit: Optional[float] = None,
+                                  push_epsilon: Optional[float] = None) -> List[Dict]:
+        """Generate recommendations based on multiple seed songs, scoring every song by a random
+        walk with restart from the seeds, so that songs several hops away are recommended too.
+
+        Scores are computed by at most max_iterations rounds of power iteration, stopping early
+        once they change by less than tolerance, or, if push_epsilon is given, by the faster
+        push approximation of random_walk.RandomWalk. Results have the same form as
+        recommend_songs, with the visit probability as the score.
+
+        If time_limit is given, computation stops after about time_limit seconds, not counting
+        the time taken to build the random walk, returning the best scores so far; at least one
+        round of power iteration or push is always run. A capped call may therefore return a
+        ranking that has not converged, and which differs from the uncapped one.
+        """
+        seeds = [song_id for song_id in map(self._resolve, song_names) if song_id]
+        if not seeds:
+            return []
+
+        walk, items, rows_of = self._random_walk()
+        deadline = None if time_limit is None else time.perf_counter() + time_limit
+        seed_rows = [rows_of[song_id] for song_id in seeds]
+        rows, scores = walk.visit_scores(seed_rows, restart, max_iterations, tolerance, push_epsilon, deadline)
+        rows, scores = best_rows(rows, scores, seed_rows, limit)
+
+        results = []
+        for row, score in zip(rows.tolist(), scores.tolist()):
+            metadata = self._songs.get(self._ids[items[row]])
+            results.append({
+                'track': metadata['track_name'],
+                'artist': metadata['artists'],
+                'album': metadata['album_name'],
+                'score': score,
+                'popularity': metadata.get('popularity', 0)
+            })
+
+        # Sort by score (descending) then popularity (descending)
+        results.sort(key=lambda x: (-x['score'], -x['popularity']))
+
+        return results[:limit]
+
+    def recommend_songs_direct(self, song_names: List[str], limit: int = 5) -> List[Dict]:
+        """Generate recommendations based on multiple seed songs by comparing the seeds with
+        every song of this graph, without using its edges.
+
+        Every song is scored by the mean of its similarity scores with the seeds, so the result
+        is the one recommend_songs would return if every pair of songs were connected, except
+        that ties in score and popularity are broken by insertion order. Songs do not need
+        edges, so this works as soon as they are added, at the cost of scanning the features
+        of every song; see vector_search.VectorSearch.
+        """
+        if self._metrics is not None:
+            with self._metrics.operation('recommend_songs_direct'):
+                return self._recommend_direct(song_names, limit)
+        return self._recommend_direct(song_names, limit)
+
+    def _recommend_direct(self, song_names: List[str], limit: int) -> List[Dict]:
+        """Return the recommendations of recommend_songs_direct for the given seed songs."""
+        metrics = self._metrics
+        with DISABLED if metrics is None else metrics.stage('seed_lookup'):
+            items, rows_of, search = self._vector_search()
+            seeds = [rows_of[song_id] for song_id in map(self._resolve, song_names) if song_id]
+
+        with DISABLED if metrics is None else metrics.stage('scan'):
+            rows, scores = search.search(seeds, limit, metrics=metrics)
+
+        results = []
+        for row, score in zip(rows.tolist(), scores.tolist()):
+            metadata = self._songs.get(self._ids[items[row]])
+            results.append({
+                'track': metadata['track_name'],
+                'artist': metadata['artists'],
+                'album': metadata['album_name'],
+                'score': score,
+                'popularity': metadata.get('popularity', 0)
+            })
+        return results
+
+    def precompute_multi_hop(self, items: Optional[Iterable] = None, restart: float = 0.15,
+                             push_epsilon: float = 1e-4, keep: Optional[int] = 200) -> None:
+        """Push the random walks of the given songs, or of every song if items is None, ahead of
+        time, so that recommend_songs_multi_hop with the same restart and push_epsilon only adds
+        up stored scores for them. Only the keep highest scores of every song are stored.
+
+        The stored scores are discarded when the edges of this graph change.
+        """
+        walk, _, rows_of = self._random_walk()
+        seeds = list(rows_of.values()) if items is None else [rows_of[item] for item in items]
+        walk.precompute(seeds, restart, push_epsilon, keep)
+
+    def _random_walk(self) -> tuple[RandomWalk, list, dict[Any, int]]:
+        """Return the random walk over this graph, the item of every row of it and the row of
+        every item, creating them if needed.
+        """
+        items, rows_of, indptr, indices, weights = self._csr()
+        if self._walk is None:
+            self._walk = RandomWalk(indptr, indices, weights)
+        return self._walk, items, rows_of
+
+    def _vector_search(self) -> tuple[list, dict[Any, int], VectorSearch]:
+        """Return the items of this graph, the row of every item and the vector search over their
+        features, creating them if needed.
+
+        They are recreated if the feature configuration or vector precision changed since they
+        were created.
+        """
+        if self._vectors is None or self._vectors[3] is not self.feature_configuration \
+                or self._vectors[2].precision != self.vector_precision:
+            items = list(self._ids)
+            vertex_ids = [self._ids[item] for item in items]
+            features, magnitudes = self._normalized_features(vertex_ids)
+            popularity = self._songs.column('popularity', vertex_ids, 0.0)
+            self._vectors = (items, {item: row for row, item in enumerate(items)},
+                             VectorSearch(features, magnitudes, popularity, self.vector_precision),
+                             self.feature_configuration)
+        return self._vectors[:3]
+
+    def _csr(self) -> tuple[list, dict[Any, int], np.ndarray, np.ndarray, np.ndarray]:
+        """Return the items of this graph, the row of every item and the adjacency in the form
+        returned by to_csr, creating them if needed.
+        """
+        if self._adjacency is None:
+            items, indptr, indices, weights = self.to_csr()
+            self._adjacency = (items, {item: row for row, item in enumerate(items)}, indptr, indices, weights)
+        return self._adjacency
+
+    def _recommend(self, song_names: List[str], limit: int) -> List[Dict]:
+        """Return the recommendations for the given seed songs, without using the cache."""
         if not song_names:
             return []
 
+        metrics = self._metrics
+        with DISABLED if metrics is None else metrics.stage('seed_lookup'):
+            seed_ids = [self._ids[song_id] for song_id in map(self._resolve, song_names) if song_id]
+
+        if 0 < limit and sum(len(self._neighbour_ids[vertex_id]) for vertex_id in set(seed_ids)) > _MERGE_EDGES:
+            with DISABLED if metrics is None else metrics.stage('merge'):
+                ranked = self._merge_neighbours(seed_ids, limit)
+        else:
+            ranked = self._scan_neighbours(seed_ids)
+
+            # Sort by average score (descending) then popularity (descending)
+            with DISABLED if metrics is None else metrics.stage('sort'):
+                ranked.sort(key=lambda x: (-x[0], -x[1]))
+
+        results = []
+        for avg_score, song_popularity, neighbor in ranked[:limit]:
+            metadata = self._songs.get(neighbor)
+            results.append({
+                'track': metadata['track_name'],
+                'artist': metadata['artists'],
+                'album': metadata['album_name'],
+                'score': avg_score,
+                'popularity': song_popularity
+            })
+        return results
+
+    def _scan_neighbours(self, seed_ids: list[int]) -> list[tuple[float, float, int]]:
+        """Return the average edge weight, popularity and number of every neighbour of the seed
+        vertex numbers other than the seeds, in the order they are first reached.
+        """
+        metrics = self._metrics
+        skipped = set(seed_ids)
+
         # Initialize recommendation scores
         recommendations = {}
 
-        for name in song_names:
-            song_id = self.find_song_id(name)
-            if not song_id:
-                continue
-
-            vertex = self._vertices[song_id]
+        for vertex_id in seed_ids:
+            if metrics is not None:
+                metrics.count('neighbours_scanned', len(self._neighbour_ids[vertex_id]))
 
-            for neighbor, weight in vertex.neighbours.items():
-                if neighbor.item in song_names:  # Skip seed songs
+            for neighbor, weight in zip(self._neighbour_ids[vertex_id], self._neighbour_weights[vertex_id]):
+                if neighbor in skipped:  # Skip seed songs
                     continue
 
-                if neighbor.item in recommendations:
+                if neighbor in recommendations:
                     # If we've seen this recommendation before, add to its score
-                    recommendations[neighbor.item]['total_score'] += weight
-                    recommendations[neighbor.item]['count'] += 1
+                    recommendations[neighbor][0] += weight
+                    recommendations[neighbor][1] += 1
                 else:
                     # New recommendation
-                    recommendations[neighbor.item] = {
-                        'total_score': weight,
-                        'count': 1,
-                        'metadata': neighbor.metadata
-                    }
+                    recommendations[neighbor] = [weight, 1]
 
-        # Calculate average scores and prepare results
-        results = []
-        for song_id, data in recommendations.items():
-            avg_score = data['total_score'] / data['count']
-            results.append({
-                'track': data['metadata']['track_name'],
-                'artist': data['metadata']['artists'],
-                'album': data['metadata']['album_name'],
-                'score': avg_score,
-                'popularity': data['metadata'].get('popularity', 0)
-            })
+        # Calculate average scores, reading only the popularity of every song until the best are known
+        popularity = self._songs.floats['popularity']
+        ranked = []
+        for neighbor, (total_score, count) in recommendations.items():
+            song_popularity = float(popularity[neighbor])
+            ranked.append((total_score / count, 0 if song_popularity != song_popularity else song_popularity,
+                           neighbor))
+        return ranked
 
-        # Sort by average score (descending) then popularity (descending)
-        results.sort(key=lambda x: (-x['score'], -x['popularity']))
+    def _merge_neighbours(self, seed_ids: list[int], limit: int) -> list[tuple[float, float, int]]:
+        """Return the limit first neighbours of _scan_neighbours for the seed vertex numbers once
+        sorted by average edge weight, then popularity (both descending), best first.
 
-        return results[:limit]
+        This is the threshold algorithm of Fagin, Lotem and Naor, reading blocks of neighbours at
+        a time: the neighbours of every distinct seed are read in order of decreasing weight, to
+        the same depth for every seed, and the weights of every neighbour read for the first time
+        are looked up in all the seeds, so its average is exact. A neighbour not read yet has no
+        weight above the next unread weight of any seed, so reading stops once limit neighbours
+        have a greater average than all of them; otherwise the depth read is doubled.
+
+        Averages are added up seed by seed in the order of seed_ids, exactly as _scan_neighbours
+        does, and ties are broken in the order _scan_neighbours first reaches the neighbours.
+        """
+        distinct = list(dict.fromkeys(seed_ids))
+        ranked_lists = {vertex_id: self._ranked_neighbours(vertex_id) for vertex_id in distinct}
+        weights_of = {vertex_id: np.frombuffer(self._neighbour_weights[vertex_id], dtype=np.float64)
+                      for vertex_id in distinct}
+        popularity = self._songs.floats['popularity']
+        longest = max(len(ids) for ids, _, _, _ in ranked_lists.values())
+        if longest == 0:
+            return []
+
+        # Whether every vertex number is a seed or was read already, and the last index of every
+        # vertex number in the block being read
+        read = np.zeros(len(self._items), dtype=bool)
+        read[distinct] = True
+        last = np.empty(len(self._items), dtype=np.int_)
+
+        # The rounding error of an average of weights that are all at most the next unread weight
+        largest = max(max(abs(weights[0]), abs(weights[-1])) for _, weights, _, _ in ranked_lists.values()
+                      if len(weights))
+        slack = (len(seed_ids) + 2) * math.ulp(1.0) * float(largest)
+
+        neighbours, averages, popularities, firsts, positions = [], [], [], [], []
+        evaluated, depth, step = 0, 0, limit
+        while depth < longest:
+            block = np.concatenate([ids[depth:depth + step] for ids, _, _, _ in ranked_lists.values()])
+            block = block[~read[block]]
+            last[block] = np.arange(len(block))
+            new = np.sort(block[last[block] == np.arange(len(block))])
+            read[new] = True
+            evaluated += len(new)
+            depth += step
+            step *= 2
+
+            # -0.0 is the sum of no weights, so every total is added up exactly like in _scan_neighbours
+            totals, counts = np.full(len(new), -0.0), np.zeros(len(new), dtype=np.int_)
+            first, position = np.full(len(new), len(seed_ids)), np.zeros(len(new), dtype=np.int_)
+            for k, seed in enumerate(seed_ids):
+                _, _, by_id, by_id_positions = ranked_lists[seed]
+                if len(by_id) == 0:
+                    continue
+                found = np.minimum(np.searchsorted(by_id, new), len(by_id) - 1)
+                hits = np.flatnonzero(by_id[found] == new)
+                hit_positions = by_id_positions[found[hits]]
+                totals[hits] += weights_of[seed][hit_positions]
+                counts[hits] += 1
+                reached = first[hits] == len(seed_ids)
+                first[hits[reached]] = k
+                position[hits[reached]] = hit_positions[reached]
+
+            neighbours.append(new)
+            averages.append(totals / counts)
+            popularities.append(np.nan_to_num(popularity[new].astype(np.float64), nan=0.0))
+            firsts.append(first)
+            positions.append(position)
+
+            unread = max((weights[depth] for _, weights, _, _ in ranked_lists.values() if depth < len(weights)),
+                         default=-math.inf)
+            if evaluated >= limit:
+                scores = np.concatenate(averages)
+                if np.partition(scores, len(scores) - limit)[len(scores) - limit] > unread + slack:
+                    break
+
+        if self._metrics is not None:
+            self._metrics.count('neighbours_scanned', sum(min(depth, len(ids)) for ids, _, _, _ in
+                                                          ranked_lists.values()))
+        neighbours, averages = np.concatenate(neighbours), np.concatenate(averages)
+        order = np.lexsort((np.concatenate(positions), np.concatenate(firsts), -np.concatenate(popularities),
+                            -averages))[:limit]
+
+        ranked = []
+        for neighbor, avg_score in zip(neighbours[order].tolist(), averages[order].tolist()):
+            song_popularity = float(popularity[neighbor])
+            ranked.append((avg_score, 0 if song_popularity != song_popularity else song_popularity, neighbor))
+        return ranked
+
+    def _ranked_neighbours(self, vertex_id: int) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Return the neighbours of vertex number vertex_id sorted by decreasing edge weight and
+        their weights, then its neighbours sorted by number and their positions in the order the
+        edges were added, sorting them if needed.
+        """
+        ranked = self._ranked[vertex_id]
+        if ranked is None:
+            neighbour_ids = np.frombuffer(self._neighbour_ids[vertex_id], dtype=np.int_)
+            weights = np.frombuffer(self._neighbour_weights[vertex_id], dtype=np.float64)
+            by_weight, by_id = np.argsort(-weights, kind='stable'), np.argsort(neighbour_ids)
+            ranked = (neighbour_ids[by_weight], weights[by_weight], neighbour_ids[by_id], by_id)
+            self._ranked[vertex_id] = ranked
+        return ranked
+
+    def _resolve(self, song_name: Any) -> Optional[Any]:
+        """Return the key of the song given by song_name, which is either its key (its track_id)
+        or its track name, as looked up by find_song_id.
+        """
+        if song_name in self._ids:
+            return song_name
+        return self.find_song_id(song_name)
 
 
 if __name__ == '__main__':
     import python_ta
 
     python_ta.check_all(config={
-        'extra-imports': ['pygame', 'csv', 'recommender', 'math'],
+        'extra-imports': ['pygame', 'csv', 'recommender', 'math', 'numpy', 'search', 'array', 'metadata_store',
+                          'recommendation_cache', 'random_walk', 'time', 'instrumentation', 'vector_search'],
         'allowed-io': [],
         'max-line-length': 120
     })
@@ -0,0 +1,177 @@
+"""CSC111 Winter 2025 Project: Spotify Song Recommendation System
+
+This Python module contains the helpers that keep the pygame window cheap to draw: a cache of
+rendered text, and a scheduler that only redraws a frame when something on it has changed,
+updates only the parts of the display that changed, and caps the frame rate.
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of students
+taking CSC111 at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult our Course Syllabus.
+
+This file is Copyright (c) 2025 Cindy Yang, Kate Shen, Kristen Wong, Sara Kopilovic.
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Any, Iterable, Optional
+
+import pygame
+
+
+class TextCache:
+    """A cache of rendered text surfaces, keyed by font, text, antialiasing and colour.
+
+    The least recently used surface is dropped once the cache holds max_entries surfaces.
+
+    Instance Attributes:
+        - max_entries: The largest number of surfaces kept, or 0 to render all text every time.
+        - hits: The number of renders answered from the cache.
+        - misses: The number of renders that had to render the text.
+
+    Private Instance Attributes:
+        - _surfaces: The cached surfaces, from least to most recently used.
+
+    Representation Invariants:
+        - self.max_entries >= 0
+        - len(self._surfaces) <= self.max_entries
+    """
+    max_entries: int
+    hits: int
+    misses: int
+    _surfaces: OrderedDict[tuple, pygame.Surface]
+
+    def __init__(self, max_entries: int = 512) -> None:
+        """Initialize an empty cache holding up to max_entries surfaces."""
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._surfaces = OrderedDict()
+
+    def render(self, font: pygame.font.Font, text: str, antialias: bool, colour: Any) -> pygame.Surface:
+        """Return the surface of text rendered in the given font and colour, like font.render.
+
+        The surface returned may be shared with other callers, so it must not be drawn on.
+        """
+        key = (font, text, antialias, tuple(colour) if isinstance(colour, (list, pygame.Color)) else colour)
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self._surfaces.move_to_end(key)
+            return surface
+
+        self.misses += 1
+        surface = font.render(text, antialias, colour)
+        if self.max_entries > 0:
+            self._surfaces[key] = surface
+            if len(self._surfaces) > self.max_entries:
+                self._surfaces.popitem(last=False)
+        return surface
+
+    def clear(self) -> None:
+        """Drop every cached surface."""
+        self._surfaces.clear()
+
+
+class FrameScheduler:
+    """A scheduler deciding which frames of the window are redrawn and which parts of the display
+    they update, and capping the frame rate.
+
+    A frame is redrawn after invalidate is called, when the value passed to watch changes, or
+    when the mouse moves onto or off one of the rectangles passed to hover. In the last case,
+    only those rectangles of the display are updated.
+
+    Instance Attributes:
+        - fps: The largest number of frames per second, or 0 for no limit.
+        - full_redraw: Whether every frame is redrawn and updates the whole display.
+        - frames: The number of frames so far.
+        - redrawn: The number of frames that were redrawn.
+
+    Private Instance Attributes:
+        - _clock: The clock capping the frame rate.
+        - _dirty: The rectangles of the display to update once the frame is drawn, or None for the
+                  whole display.
+        - _needs_redraw: Whether the current frame has to be redrawn.
+        - _hovered: The rectangle under the mouse when it was last checked, if any.
+        - _watched: The value last passed to watch.
+    """
+    fps: int
+    full_redraw: bool
+    frames: int
+    redrawn: int
+    _clock: pygame.time.Clock
+    _dirty: Optional[list[pygame.Rect]]
+    _needs_redraw: bool
+    _hovered: Optional[pygame.Rect]
+    _watched: Any
+
+    def __init__(self, fps: int = 60, full_redraw: bool = False) -> None:
+        """Initialize a scheduler whose first frame redraws the whole window."""
+        self.fps = fps
+        self.full_redraw = full_redraw
+        self.frames = 0
+        self.redrawn = 0
+        self._clock = pygame.time.Clock()
+        self._dirty = None
+        self._needs_redraw = True
+        self._hovered = None
+        self._watched = None
+
+    @property
+    def needs_redraw(self) -> bool:
+        """Whether the current frame has to be redrawn."""
+        return self.full_redraw or self._needs_redraw
+
+    def invalidate(self) -> None:
+        """Redraw the whole window in the current frame."""
+        self._needs_redraw = True
+        self._dirty = None
+
+    def watch(self, value: Any) -> None:
+        """Redraw the whole window in the current frame if value differs from the last value watched."""
+        if value != self._watched:
+            self._watched = value
+            self.invalidate()
+
+    def hover(self, rects: Iterable[Optional[pygame.Rect]], mouse: tuple[int, int]) -> None:
+        """Redraw the rectangles the mouse moved onto or off since the last call, given the
+        rectangles that change colour under the mouse, some of which may be None.
+        """
+        hovered = next((rect for rect in rects if rect is not None and rect.collidepoint(mouse)), None)
+        if hovered != self._hovered:
+            for rect in (self._hovered, hovered):
+                if rect is not None:
+                    self._needs_redraw = True
+                    if self._dirty is not None:
+                        self._dirty.append(pygame.Rect(rect))
+            self._hovered = hovered
+
+    def present(self) -> None:
+        """Put the frame just drawn on the display."""
+        if self.full_redraw or self._dirty is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(self._dirty)
+        self.redrawn += 1
+        self._needs_redraw = False
+        self._dirty = []
+
+    def tick(self) -> int:
+        """End the current frame, waiting as long as needed to keep to the frame rate, and return the
+        milliseconds since the previous frame ended.
+        """
+        self.frames += 1
+        return self._clock.tick(self.fps)
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['collections', 'pygame'],
+        'allowed-io': [],
+        'max-line-length': 120
+    })
@@ -0,0 +1,252 @@
+"""CSC111 Winter 2025 Project: Spotify Song Recommendation System
+
+This Python module contains the index used to look up songs by free-text queries,
+for typeahead and fuzzy search.
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of students
+taking CSC111 at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult our Course Syllabus.
+
+This file is Copyright (c) 2025 Cindy Yang, Kate Shen, Kristen Wong, Sara Kopilovic.
+"""
+from __future__ import annotations
+import bisect
+import heapq
+import re
+import unicodedata
+from array import array
+from typing import Any
+
+# Matches a featured artist credit and everything after it, such as "(feat. Someone)" or "ft. Someone"
+_FEATURING = re.compile(r'[(\[]?\b(?:feat|ft|featuring)\b\.?.*$')
+
+# Matches apostrophes, which are dropped so that "don't" and "dont" match
+_APOSTROPHES = re.compile("['\u2019]")
+
+# Matches every run of characters that are not letters or digits
+_PUNCTUATION = re.compile(r'[\W_]+')
+
+# The maximum number of songs whose trigrams are compared with the query in a fuzzy search
+_FUZZY_CANDIDATE_LIMIT = 500
+
+# The minimum Dice coefficient between the trigrams of a query and a title for a fuzzy match
+_FUZZY_MIN_SCORE = 0.3
+
+
+def normalize_title(title: str) -> str:
+    """Return title in the form used for searching: lowercase, without accents, punctuation or
+    featured artist credits, and with single spaces between words.
+
+    >>> normalize_title('Beyoncé - Halo (feat. Someone)')
+    'beyonce halo'
+    >>> normalize_title("Don't Stop   Me Now")
+    'dont stop me now'
+    """
+    decomposed = unicodedata.normalize('NFKD', title)
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+    without_featuring = _FEATURING.sub('', stripped)
+    if without_featuring.strip():
+        stripped = without_featuring
+    return _PUNCTUATION.sub(' ', _APOSTROPHES.sub('', stripped)).strip()
+
+
+def trigrams(normalized: str) -> set[str]:
+    """Return the set of three character substrings of normalized, padded with spaces so that
+    the start and end of the title count as well.
+
+    >>> sorted(trigrams('abc'))
+    ['  a', ' ab', 'abc', 'bc ']
+    """
+    padded = f'  {normalized} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SongSearchIndex:
+    """An index of song titles supporting exact, prefix and fuzzy lookups.
+
+    Exact lookups use a hash table of normalized titles. Prefix lookups binary search a sorted
+    list holding the normalized title starting at each of its words, so "you" finds
+    "Shape of You". Fuzzy lookups compare trigrams with the songs sharing the query's rarest
+    trigrams. Removed songs are skipped lazily and purged when the lists are next rebuilt.
+
+    Private Instance Attributes:
+        - _ids: Maps every song item in this index to its id.
+        - _items: The item of every id, or None if it was removed.
+        - _titles: The normalized title of every id.
+        - _gram_counts: The number of distinct trigrams in the title of every id.
+        - _popularity: The popularity of every id, used to rank matches.
+        - _exact: Maps every normalized title to the ids that have it, in insertion order.
+        - _prefixes: The sorted (title suffix starting at a word, id) pairs.
+        - _pending: The prefix pairs added since _prefixes was last sorted.
+        - _grams: Maps every trigram to the ids of the titles containing it.
+        - _removed: The number of removed ids still referenced by _prefixes and _grams.
+    """
+    _ids: dict[Any, int]
+    _items: list
+    _titles: list[str]
+    _gram_counts: list[int]
+    _popularity: list[float]
+    _exact: dict[str, list[int]]
+    _prefixes: list[tuple[str, int]]
+    _pending: list[tuple[str, int]]
+    _grams: dict[str, array]
+    _removed: int
+
+    def __init__(self) -> None:
+        self._ids = {}
+        self._items = []
+        self._titles = []
+        self._gram_counts = []
+        self._popularity = []
+        self._exact = {}
+        self._prefixes = []
+        self._pending = []
+        self._grams = {}
+        self._removed = 0
+
+    def add(self, item: Any, title: str, popularity: float = 0.0) -> None:
+        """Add a song with the given title and popularity to this index.
+
+        Do nothing if item is already in this index.
+        """
+        if item not in self._ids:
+            self._insert(item, normalize_title(title), popularity)
+
+    def _insert(self, item: Any, normalized: str, popularity: float) -> None:
+        """Add item, whose title is already normalized, to this index."""
+        song_id = len(self._items)
+        self._ids[item] = song_id
+        self._items.append(item)
+        self._titles.append(normalized)
+        self._popularity.append(popularity)
+        self._exact.setdefault(normalized, []).append(song_id)
+
+        words = normalized.split(' ')
+        for i in range(len(words)):
+            self._pending.append((' '.join(words[i:]), song_id))
+        grams = trigrams(normalized)
+        self._gram_counts.append(len(grams))
+        for gram in grams:
+            self._grams.setdefault(gram, array('l')).append(song_id)
+
+    def remove(self, item: Any) -> None:
+        """Remove the given song from this index, if it is in it."""
+        song_id = self._ids.pop(item, None)
+        if song_id is None:
+            return
+
+        self._items[song_id] = None
+        self._exact[self._titles[song_id]].remove(song_id)
+        if not self._exact[self._titles[song_id]]:
+            del self._exact[self._titles[song_id]]
+        self._removed += 1
+        if self._removed > len(self._ids):
+            self._rebuild()
+
+    def lookup(self, title: str) -> list:
+        """Return the songs whose normalized title equals the normalized title, in insertion order."""
+        return [self._items[song_id] for song_id in self._exact.get(normalize_title(title), [])]
+
+    def search(self, query: str, limit: int = 10) -> list:
+        """Return up to limit songs matching query, best matches first.
+
+        Exact title matches come first, then titles with a word starting with the query, then
+        titles with similar trigrams. Ties are broken by descending popularity.
+        """
+        normalized = normalize_title(query)
+        if not normalized or limit <= 0:
+            return []
+
+        found = sorted(self._exact.get(normalized, []), key=lambda song_id: -self._popularity[song_id])
+        seen = set(found)
+
+        prefix_matches = [song_id for song_id in self._prefix_ids(normalized) if song_id not in seen]
+        # Prefer titles that start with the query over titles with a later word that does. Only
+        # the best limit matches are needed, but all of them are ranked, however many there are
+        prefix_matches = heapq.nsmallest(limit, prefix_matches,
+                                         key=lambda song_id: (not self._titles[song_id].startswith(normalized),
+                                                              -self._popularity[song_id]))
+        seen.update(prefix_matches)
+        found.extend(prefix_matches)
+
+        if len(found) < limit:
+            for song_id in self._fuzzy_ids(normalized):
+                if song_id not in seen:
+                    seen.add(song_id)
+                    found.append(song_id)
+
+        return [self._items[song_id] for song_id in found[:limit]]
+
+    def _prefix_ids(self, normalized: str) -> list[int]:
+        """Return the live ids of the titles with a word starting with normalized, once each, in
+        the order of those words.
+        """
+        if self._pending:
+            self._pending.sort()
+            self._prefixes = sorted(self._prefixes + self._pending)
+            self._pending = []
+
+        start = bisect.bisect_left(self._prefixes, (normalized, -1))
+        stop = bisect.bisect_left(self._prefixes, (normalized + '\U0010ffff', -1), start)
+        ids = {}
+        for _, song_id in self._prefixes[start:stop]:
+            if self._items[song_id] is not None:
+                ids.setdefault(song_id)
+        return list(ids)
+
+    def _fuzzy_ids(self, normalized: str) -> list[int]:
+        """Return the live ids of the titles whose trigrams are similar to those of normalized,
+        most similar first.
+        """
+        query_grams = trigrams(normalized)
+        postings = sorted((self._grams[gram] for gram in query_grams if gram in self._grams), key=len)
+
+        candidates = set()
+        for posting in postings:
+            if candidates and len(candidates) + len(posting) > _FUZZY_CANDIDATE_LIMIT:
+                break
+            if len(posting) > _FUZZY_CANDIDATE_LIMIT:
+                # Keep the most popular songs of a common trigram rather than the first ones added
+                posting = heapq.nlargest(_FUZZY_CANDIDATE_LIMIT, posting, key=self._popularity.__getitem__)
+            candidates.update(posting)
+
+        scored = []
+        for song_id in candidates:
+            if self._items[song_id] is None:
+                continue
+            padded = f'  {self._titles[song_id]} '
+            shared = sum(1 for gram in query_grams if gram in padded)
+            score = 2 * shared / (len(query_grams) + self._gram_counts[song_id])
+            if score >= _FUZZY_MIN_SCORE:
+                scored.append((-score, -self._popularity[song_id], song_id))
+        scored.sort()
+        return [song_id for _, _, song_id in scored]
+
+    def _rebuild(self) -> None:
+        """Rebuild this index without the removed songs."""
+        live = [(item, self._titles[song_id], self._popularity[song_id])
+                for item, song_id in sorted(self._ids.items(), key=lambda x: x[1])]
+        self._ids, self._items, self._titles, self._gram_counts, self._popularity = {}, [], [], [], []
+        self._exact, self._prefixes, self._pending, self._grams = {}, [], [], {}
+        self._removed = 0
+        for item, normalized, popularity in live:
+            self._insert(item, normalized, popularity)
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod()
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['array', 'bisect', 'heapq', 're', 'unicodedata'],
+        'allowed-io': [],
+        'max-line-length': 120
+    })
@@ -0,0 +1,406 @@
+"""CSC111 Winter 2025 Project: Spotify Song Recommendation System
+
+This Python module contains a headless recommendation server. It loads the song graph once
+and answers requests sent as newline-delimited JSON over TCP or a Unix socket.
+
+Every request is a JSON object on its own line, with an "op" and an optional "id" that is
+copied into the response:
+
+    {"id": 1, "op": "find", "name": "Hello"}
+    {"id": 2, "op": "search", "query": "helo", "limit": 10}
+    {"id": 3, "op": "recommend", "songs": ["Hello", "Yellow"], "limit": 5}
+    {"id": 4, "op": "sample", "count": 7}
+    {"id": 5, "op": "stats"}
+
+Every response is a JSON object on its own line, either {"id": ..., "ok": true, "result": ...}
+or {"id": ..., "ok": false, "error": ...}. A connection may send many requests without
+waiting for their responses; the responses are sent back in request order.
+
+Start it with, for example:
+
+    python server.py --songs data/spotify_songs_small.csv --port 8765
+
+and measure it with load_generator.py.
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of students
+taking CSC111 at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult our Course Syllabus.
+
+This file is Copyright (c) 2025 Cindy Yang, Kate Shen, Kristen Wong, Sara Kopilovic.
+"""
+from __future__ import annotations
+import asyncio
+import json
+import os
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+from instrumentation import Metrics
+from recommender import WeightedGraph
+from snapshot import SnapshotGraph
+
+# The longest request line accepted, in bytes
+MAX_LINE_BYTES = 1 << 20
+
+# The most recommendations a single request may ask for
+MAX_LIMIT = 100
+
+# The number of most recent request latencies the stats are computed from
+_LATENCY_WINDOW = 10000
+
+
+class ServerError(Exception):
+    """An error answered to the client instead of a result."""
+
+
+class RecommendationServer:
+    """A server answering recommendation requests on a loaded song graph.
+
+    Recommendation requests arriving at about the same time, from any connection, are scored
+    together: the batcher waits up to batch_delay seconds for up to max_batch requests and
+    scores them with one call to recommend_songs_batch. Scoring and the find and search lookups
+    run on a single worker thread, so the graph is never used by two threads at once, and the
+    event loop keeps reading requests in the meantime; the requests that arrive while a batch
+    is scored form the next batch, so under load batches fill up even without a delay.
+
+    Every connection has at most max_pipeline requests in progress; once it has that many, the
+    server stops reading from it until a response is sent, so the client is slowed down by TCP
+    flow control. Once max_pending recommendation requests are waiting to be scored, new ones
+    are answered with an "overloaded" error right away.
+
+    Instance Attributes:
+        - graph: The song graph requests are answered from.
+        - max_batch: The most recommendation requests scored together.
+        - batch_delay: The seconds the batcher waits for more requests after the first one.
+        - max_pending: The most recommendation requests waiting to be scored.
+        - max_pipeline: The most requests in progress on a single connection.
+        - metrics: The metrics of the graph, included in the stats if given.
+
+    Private Instance Attributes:
+        - _items: The items of the graph, sampled by the sample operation.
+        - _queue: The (songs, limit, future) of every recommendation request waiting to be scored.
+        - _wakeup: Set while _queue is not empty, while the server is running.
+        - _connections: The writer and handler task of every open connection.
+        - _executor: The worker thread scoring the batches and looking songs up in the graph.
+        - _batcher: The task running the batcher, while the server is running.
+        - _counters: The number of connections, requests, errors and so on since the server started.
+        - _latencies: The seconds taken to answer the most recent requests.
+        - _started: The time.monotonic() the server started at.
+        - _rng: The random number generator of the sample operation.
+    """
+    graph: WeightedGraph | SnapshotGraph
+    max_batch: int
+    batch_delay: float
+    max_pending: int
+    max_pipeline: int
+    metrics: Optional[Metrics]
+    _items: list
+    _queue: deque[tuple[list, int, asyncio.Future]]
+    _wakeup: Optional[asyncio.Event]
+    _connections: dict[asyncio.StreamWriter, asyncio.Task]
+    _executor: ThreadPoolExecutor
+    _batcher: Optional[asyncio.Task]
+    _counters: dict[str, int]
+    _latencies: deque[float]
+    _started: float
+    _rng: random.Random
+
+    def __init__(self, graph: WeightedGraph | SnapshotGraph, max_batch: int = 64, batch_delay: float = 0.0,
+                 max_pending: int = 4096, max_pipeline: int = 128, metrics: Optional[Metrics] = None) -> None:
+        self.graph = graph
+        self.max_batch = max_batch
+        self.batch_delay = batch_delay
+        self.max_pending = max_pending
+        self.max_pipeline = max_pipeline
+        self.metrics = metrics
+        self._items = list(graph.get_all_vertices())
+        self._queue = deque()
+        self._wakeup = None
+        self._connections = {}
+        self._executor = ThreadPoolExecutor(1)
+        self._batcher = None
+        self._counters = {'connections': 0, 'open_connections': 0, 'requests': 0, 'errors': 0,
+                          'rejected': 0, 'batches': 0, 'batched_requests': 0}
+        self._latencies = deque(maxlen=_LATENCY_WINDOW)
+        self._started = time.monotonic()
+        self._rng = random.Random()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8765, path: Optional[str] = None,
+                    ready: Optional[asyncio.Event] = None) -> None:
+        """Serve requests on the given TCP host and port, or on the Unix socket at path if it is
+        given, until cancelled. Set ready once the socket is listening.
+
+        Once cancelled, the requests not yet scored are answered with a "shutting down" error
+        and every connection is closed.
+        """
+        self._wakeup = asyncio.Event()
+        self._batcher = asyncio.create_task(self._run_batcher())
+        if path is not None:
+            if os.path.exists(path):
+                os.unlink(path)
+            server = await asyncio.start_unix_server(self._handle_connection, path, limit=MAX_LINE_BYTES)
+        else:
+            server = await asyncio.start_server(self._handle_connection, host, port, limit=MAX_LINE_BYTES)
+
+        try:
+            if ready is not None:
+                ready.set()
+            await server.serve_forever()
+        finally:
+            server.close()
+            self._batcher.cancel()
+            self._batcher = None
+            while self._queue:
+                _fail(self._queue.popleft()[2])
+            handlers = list(self._connections.values())
+            for writer in list(self._connections):
+                writer.close()
+            if handlers:
+                await asyncio.wait(handlers, timeout=1.0)
+            self._executor.shutdown(wait=True)
+            if path is not None and os.path.exists(path):
+                os.unlink(path)
+
+    def stats(self) -> dict[str, Any]:
+        """Return the counters of this server, the latency of its recent requests, and the
+        metrics of the graph if they are recorded.
+        """
+        stats: dict[str, Any] = dict(self._counters)
+        stats['uptime_seconds'] = time.monotonic() - self._started
+        stats['pending'] = len(self._queue)
+        stats['mean_batch_size'] = self._counters['batched_requests'] / max(self._counters['batches'], 1)
+        if self._latencies:
+            p50, p99 = np.percentile(list(self._latencies), [50, 99])
+            stats['latency_p50_ms'] = float(p50) * 1000
+            stats['latency_p99_ms'] = float(p99) * 1000
+        if self.metrics is not None:
+            stats['metrics'] = self.metrics.snapshot()
+        return stats
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answer the requests of a connection until the client closes it."""
+        self._counters['connections'] += 1
+        self._counters['open_connections'] += 1
+        self._connections[writer] = asyncio.current_task()
+        responses = asyncio.Queue(self.max_pipeline)
+        sender = asyncio.create_task(self._send_responses(responses, writer))
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ConnectionError, ValueError):
+                    break  # The client went away, or sent a line longer than MAX_LINE_BYTES
+                if not line:
+                    break
+                await responses.put(asyncio.ensure_future(self._respond(line)))
+            await responses.put(None)
+            await sender
+        finally:
+            sender.cancel()
+            self._connections.pop(writer, None)
+            self._counters['open_connections'] -= 1
+            writer.close()
+
+    async def _send_responses(self, responses: asyncio.Queue, writer: asyncio.StreamWriter) -> None:
+        """Send the responses of a connection in request order, until a None is queued."""
+        broken = False
+        while True:
+            response = await responses.get()
+            if response is None:
+                return
+            line = (json.dumps(await response) + '\n').encode('utf-8')
+            if not broken:
+                try:
+                    writer.write(line)
+                    await writer.drain()
+                except ConnectionError:
+                    broken = True  # Keep consuming responses so that the reader is not blocked
+
+    async def _respond(self, line: bytes) -> dict:
+        """Return the response to the request on the given line."""
+        start = time.perf_counter()
+        self._counters['requests'] += 1
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ServerError('a request must be a JSON object')
+            request_id = request.get('id')
+            response = {'id': request_id, 'ok': True, 'result': await self._answer(request)}
+        except (ServerError, json.JSONDecodeError, UnicodeDecodeError) as error:
+            self._counters['errors'] += 1
+            response = {'id': request_id, 'ok': False, 'error': str(error)}
+        self._latencies.append(time.perf_counter() - start)
+        return response
+
+    async def _answer(self, request: dict) -> Any:
+        """Return the result of the given request.
+
+        Raise a ServerError if the request is malformed, or if the server is overloaded.
+        """
+        op = request.get('op')
+        if op == 'recommend':
+            songs, limit = request.get('songs'), _limit(request, 5)
+            if not isinstance(songs, list) or not all(isinstance(song, str) for song in songs):
+                raise ServerError('songs must be a list of song names')
+            return await self._recommend(songs, limit)
+        elif op == 'find':
+            name = request.get('name')
+            if not isinstance(name, str):
+                raise ServerError('name must be a song name')
+            return await self._lookup(self.graph.find_song_id, name)
+        elif op == 'search':
+            query = request.get('query')
+            if not isinstance(query, str):
+                raise ServerError('query must be a string')
+            return await self._lookup(self.graph.search_songs, query, _limit(request, 10))
+        elif op == 'sample':
+            return self._rng.sample(self._items, min(_limit(request, 7, 'count', len(self._items)), len(self._items)))
+        elif op == 'stats':
+            return self.stats()
+        raise ServerError(f'unknown op {op!r}')
+
+    async def _recommend(self, songs: list[str], limit: int) -> list[dict]:
+        """Return the recommendations for the given seed songs, once the batcher has scored them.
+
+        Raise a ServerError if max_pending requests are already waiting to be scored, or if the
+        server is shutting down.
+        """
+        if self._batcher is None:
+            raise ServerError('shutting down')
+        if len(self._queue) >= self.max_pending:
+            self._counters['rejected'] += 1
+            raise ServerError('overloaded')
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((songs, limit, future))
+        self._wakeup.set()
+        return await future
+
+    async def _lookup(self, function: Callable[..., Any], *args: Any) -> Any:
+        """Return function(*args), called on the worker thread so that it never uses the graph
+        while a batch is scored.
+
+        Raise a ServerError if the server is shutting down.
+        """
+        if self._batcher is None:
+            raise ServerError('shutting down')
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    async def _run_batcher(self) -> None:
+        """Score the waiting recommendation requests in batches, until cancelled."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            if len(self._queue) < self.max_batch and self.batch_delay > 0:
+                await asyncio.sleep(self.batch_delay)
+            batch = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+            if not self._queue:
+                self._wakeup.clear()
+            if not batch:
+                continue
+
+            self._counters['batches'] += 1
+            self._counters['batched_requests'] += len(batch)
+            try:
+                results = await loop.run_in_executor(self._executor, self._score,
+                                                     [(songs, limit) for songs, limit, _ in batch])
+            except asyncio.CancelledError:
+                for _, _, future in batch:
+                    _fail(future)
+                raise
+            except Exception as error:  # Answer every request of the batch rather than stall them
+                results = [ServerError(f'internal error: {error!r}')] * len(batch)
+            for (_, _, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def _score(self, batch: list[tuple[list[str], int]]) -> list[list[dict]]:
+        """Return the recommendations for every (songs, limit) in batch, scoring the requests
+        with the same limit together when the graph supports it.
+        """
+        if len(batch) == 1 or not hasattr(self.graph, 'recommend_songs_batch'):
+            return [self.graph.recommend_songs(songs, limit) for songs, limit in batch]
+
+        results = [None] * len(batch)
+        by_limit = {}
+        for position, (songs, limit) in enumerate(batch):
+            by_limit.setdefault(limit, []).append(position)
+        for limit, positions in by_limit.items():
+            scored = self.graph.recommend_songs_batch([batch[position][0] for position in positions], limit)
+            for position, result in zip(positions, scored):
+                results[position] = result
+        return results
+
+
+def _fail(future: asyncio.Future) -> None:
+    """Answer the recommendation request waiting on future with a "shutting down" error."""
+    if not future.done():
+        future.set_exception(ServerError('shutting down'))
+
+
+def _limit(request: dict, default: int, key: str = 'limit', maximum: int = MAX_LIMIT) -> int:
+    """Return the integer under key in request, or default if it is missing.
+
+    Raise a ServerError if it is not an integer between 1 and maximum.
+    """
+    value = request.get(key, default)
+    if not isinstance(value, int) or isinstance(value, bool) or not 1 <= value <= maximum:
+        raise ServerError(f'{key} must be an integer between 1 and {maximum}')
+    return value
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """Load the graph and serve it as described by the command line arguments argv."""
+    import argparse
+
+    from main import load_graph
+
+    parser = argparse.ArgumentParser(description='Serve song recommendations as newline-delimited JSON.')
+    parser.add_argument('--songs', default='data/spotify_songs_smaller.csv')
+    parser.add_argument('--snapshot', help='the snapshot file to load the graph from, or save it to')
+    parser.add_argument('--workers', type=int, default=1, help='the processes building the graph')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='the Unix socket to listen on instead of TCP')
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--batch-delay', type=float, default=0.0)
+    parser.add_argument('--max-pending', type=int, default=4096)
+    parser.add_argument('--max-pipeline', type=int, default=128)
+    parser.add_argument('--metrics', action='store_true', help='record the stages of the build and queries')
+    args = parser.parse_args(argv)
+
+    metrics = Metrics() if args.metrics else None
+    graph = load_graph(args.songs, snapshot_file=args.snapshot, workers=args.workers, metrics=metrics)
+    server = RecommendationServer(graph, args.max_batch, args.batch_delay, args.max_pending, args.max_pipeline,
+                                  metrics)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['argparse', 'asyncio', 'collections', 'concurrent.futures', 'json', 'os', 'random', 'time',
+                          'numpy', 'instrumentation', 'main', 'recommender', 'snapshot'],
+        'allowed-io': [],
+        'max-line-length': 120
+    })
@@ -0,0 +1,629 @@
+"""CSC111 Winter 2025 Project: Spotify Song Recommendation System
+
+This Python module contains the sharded song similarity graph. The songs are partitioned into
+shards, by genre or by clusters of their audio features, and every shard is built as a graph
+of its own, on several processes at once. A bounded cross-shard pass then links the tracks on
+the boundary of every shard to their most similar tracks in the nearest other shards, and
+recommendations are routed to the shards of their seed songs.
+
+Every shard is saved to its own snapshot file in a shard directory, along with a boundary file
+holding the cross-shard comparisons. When the songs change, only the shards whose songs changed
+are built again, and only the cross-shard comparisons involving them are repeated.
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of students
+taking CSC111 at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult our Course Syllabus.
+
+This file is Copyright (c) 2025 Cindy Yang, Kate Shen, Kristen Wong, Sara Kopilovic.
+"""
+from __future__ import annotations
+import hashlib
+import itertools
+import json
+import math
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from instrumentation import DISABLED, Metrics
+from recommender import WeightedGraph, block_candidates, normalized_features, pair_scores, select_top_k, \
+    similar_pairs, similarity_block
+from search import SongSearchIndex
+from snapshot import SnapshotGraph, load_snapshot, save_snapshot
+
+# The ways songs can be partitioned into shards
+SHARD_MODES = {'genre', 'features'}
+
+# The average number of songs of a shard when songs are partitioned by their audio features
+CLUSTER_SIZE = 1000
+
+# The file holding the cross-shard comparisons in a shard directory
+BOUNDARY_FILE = 'boundary.json'
+BOUNDARY_VERSION = 1
+
+# The number of edges linked between two checks of the metrics of a build
+_LINK_CHUNK = 65536
+
+# Upper bound on the number of cross-shard pair scores held in memory at once
+_COMPARE_ELEMENTS = 1 << 20
+
+
+class ShardedGraph:
+    """A song similarity graph split into shards, each a graph of its own songs and the edges
+    between them, along with the cross-shard edges of the boundary tracks of every shard.
+
+    It answers the queries of the window, the server and the batch recommender like a
+    WeightedGraph: recommend_songs gathers the neighbours of every seed song from the graph of
+    its shard and from its cross-shard edges, and ranks them like WeightedGraph.recommend_songs.
+
+    Instance Attributes:
+        - shards: The graph of every shard, by name. Shards loaded from a snapshot are
+                  SnapshotGraphs, and shards that were built are WeightedGraphs.
+
+    Private Instance Attributes:
+        - _shard_of: Maps the key of every song to the name of its shard, in the order the songs
+                     were listed.
+        - _popularity: Maps the key of every song to its popularity, used to break ties.
+        - _boundary: Maps the key of every song with cross-shard edges to its cross-shard
+                     neighbours and the edge weights, in the order the edges were added.
+        - _search: The index used by search_songs, created on first use.
+        - _metrics: The metrics the stages of querying this graph are recorded in, if
+                    instrumentation is enabled.
+
+    Representation Invariants:
+        - all(self._shard_of[item] in self.shards for item in self._shard_of)
+        - all(self._shard_of[item] != self._shard_of[neighbour]
+              for item in self._boundary for neighbour in self._boundary[item])
+    """
+    shards: dict[str, WeightedGraph | SnapshotGraph]
+    _shard_of: dict[str, str]
+    _popularity: dict[str, float]
+    _boundary: dict[str, dict[str, float]]
+    _search: Optional[SongSearchIndex]
+    _metrics: Optional[Metrics]
+
+    def __init__(self, shards: dict[str, WeightedGraph | SnapshotGraph], shard_of: dict[str, str],
+                 popularity: dict[str, float]) -> None:
+        """Initialize a graph of the given shards, with no cross-shard edges."""
+        self.shards = shards
+        self._shard_of = shard_of
+        self._popularity = popularity
+        self._boundary = {}
+        self._search = None
+        self._metrics = None
+
+    def shard_of(self, item: Any) -> Optional[str]:
+        """Return the name of the shard of the given item, if it exists."""
+        return self._shard_of.get(item)
+
+    def add_boundary_edge(self, item1: str, item2: str, weight: float) -> None:
+        """Add a cross-shard edge between item1 and item2 with the given weight.
+
+        Raise a ValueError if item1 or item2 do not appear as vertices in this graph, or if they
+        are in the same shard.
+        """
+        shard1, shard2 = self._shard_of.get(item1), self._shard_of.get(item2)
+        if shard1 is None or shard2 is None or shard1 == shard2:
+            raise ValueError
+        self._boundary.setdefault(item1, {})[item2] = weight
+        self._boundary.setdefault(item2, {})[item1] = weight
+
+    def get_vertex(self, item: Any) -> Optional[Any]:
+        """Return a vertex holding the metadata of the given item if it exists.
+
+        The neighbours of the returned vertex are those in its shard only.
+        """
+        shard = self._shard_of.get(item)
+        return None if shard is None else self.shards[shard].get_vertex(item)
+
+    def get_neighbours(self, item: Any) -> dict[Any, float]:
+        """Return the items adjacent to the given item, in its shard and then in other shards,
+        mapped to the edge weights.
+
+        Raise a ValueError if item does not appear as a vertex in this graph.
+        """
+        shard = self._shard_of.get(item)
+        if shard is None:
+            raise ValueError
+        neighbours = self.shards[shard].get_neighbours(item)
+        neighbours.update(self._boundary.get(item, {}))
+        return neighbours
+
+    def get_all_vertices(self) -> set:
+        """Return a set of all vertex items in this weighted graph."""
+        return set(self._shard_of)
+
+    def get_similarity_score(self, item1: Any, item2: Any) -> float:
+        """Return the similarity score between two vertices, which may be in different shards."""
+        vertex1, vertex2 = self.get_vertex(item1), self.get_vertex(item2)
+        if vertex1 is None or vertex2 is None:
+            raise ValueError()
+        features, magnitudes = normalized_features([vertex1.metadata, vertex2.metadata])
+        return float(pair_scores(features, magnitudes, np.array([0]), np.array([1]))[0])
+
+    def find_song_id(self, song_name: str) -> Optional[str]:
+        """Find a song's vertex key (its track_id) by its track name (case-insensitive).
+
+        Shards are searched in the order their first song was listed.
+        """
+        for shard in self.shards.values():
+            item = shard.find_song_id(song_name)
+            if item is not None:
+                return item
+        return None
+
+    def search_songs(self, query: str, limit: int = 10) -> list:
+        """Return the keys of up to limit songs whose track name matches the free-text query,
+        best matches first, like WeightedGraph.search_songs.
+
+        The search index of every song is built on first use.
+        """
+        if self._search is None:
+            self._search = SongSearchIndex()
+            for item, shard in self._shard_of.items():
+                self._search.add(item, self.shards[shard].get_vertex(item).metadata.get('track_name', ''),
+                                 self._popularity[item])
+        return self._search.search(query, limit)
+
+    def use_metrics(self, metrics: Optional[Metrics]) -> None:
+        """Record the stages of querying this graph in the given metrics, or stop recording
+        them if it is None.
+        """
+        self._metrics = metrics
+
+    def recommend_songs(self, song_names: List[str], limit: int = 5) -> List[Dict]:
+        """Generate recommendations based on multiple seed songs.
+
+        Every seed song is looked up in its own shard, and its neighbours there are combined with
+        its cross-shard neighbours, so only the shards of the seeds are read.
+        """
+        if self._metrics is not None:
+            with self._metrics.operation('recommend_songs'):
+                return self._recommend(song_names, limit)
+        return self._recommend(song_names, limit)
+
+    def recommend_songs_batch(self, seed_lists: Iterable[List[str]], limit: int = 5,
+                              chunk_size: int = 10000) -> List[List[Dict]]:
+        """Return the recommendations for every list of seed songs in seed_lists, exactly as
+        recommend_songs would, answering up to chunk_size lists at a time.
+
+        The neighbours of every seed song of a chunk are read from its shard once and shared by
+        the lists of the chunk.
+        """
+        results = []
+        batch = []
+        for seed_list in seed_lists:
+            batch.append(seed_list)
+            if len(batch) == chunk_size:
+                results.extend(self._recommend_chunk(batch, limit))
+                batch = []
+        if batch:
+            results.extend(self._recommend_chunk(batch, limit))
+        return results
+
+    def _recommend_chunk(self, seed_lists: list[List[str]], limit: int) -> List[List[Dict]]:
+        """Return the recommendations for every list of seed songs in seed_lists."""
+        neighbours_of = {}
+        return [self._recommend(seed_list, limit, neighbours_of) for seed_list in seed_lists]
+
+    def _recommend(self, song_names: List[str], limit: int,
+                   neighbours_of: Optional[dict[str, dict[Any, float]]] = None) -> List[Dict]:
+        """Return the recommendations for the given seed songs.
+
+        If neighbours_of is given, the neighbours of the seeds are looked up there first and the
+        ones read from the shards are added to it.
+        """
+        if not song_names:
+            return []
+
+        metrics = self._metrics
+        with DISABLED if metrics is None else metrics.stage('seed_lookup'):
+            seeds = [item for item in map(self._resolve, song_names) if item is not None]
+        skipped = set(seeds)
+
+        recommendations = {}
+        for seed in seeds:
+            neighbours = None if neighbours_of is None else neighbours_of.get(seed)
+            if neighbours is None:
+                neighbours = self.get_neighbours(seed)
+                if neighbours_of is not None:
+                    neighbours_of[seed] = neighbours
+                if metrics is not None:
+                    metrics.count('shards_queried')
+            if metrics is not None:
+                metrics.count('neighbours_scanned', len(neighbours))
+
+            for neighbour, weight in neighbours.items():
+                if neighbour in skipped:  # Skip seed songs
+                    continue
+
+                if neighbour in recommendations:
+                    recommendations[neighbour][0] += weight
+                    recommendations[neighbour][1] += 1
+                else:
+                    recommendations[neighbour] = [weight, 1]
+
+        ranked = [(total_score / count, self._popularity[neighbour], neighbour)
+                  for neighbour, (total_score, count) in recommendations.items()]
+
+        # Sort by average score (descending) then popularity (descending)
+        with DISABLED if metrics is None else metrics.stage('sort'):
+            ranked.sort(key=lambda x: (-x[0], -x[1]))
+
+        results = []
+        for avg_score, song_popularity, neighbour in ranked[:limit]:
+            metadata = self.get_vertex(neighbour).metadata
+            results.append({
+                'track': metadata['track_name'],
+                'artist': metadata['artists'],
+                'album': metadata['album_name'],
+                'score': avg_score,
+                'popularity': song_popularity
+            })
+        return results
+
+    def _resolve(self, song_name: Any) -> Optional[str]:
+        """Return the key of the song given by song_name, which is either its key (its track_id)
+        or its track name, as looked up by find_song_id.
+        """
+        if song_name in self._shard_of:
+            return song_name
+        return self.find_song_id(song_name)
+
+
+def assign_shards(metadatas: list[dict], shard_by: str = 'genre') -> list[str]:
+    """Return the name of the shard of every song with the given metadata, partitioning the songs
+    by genre, or by clusters of their audio features if shard_by is 'features'.
+
+    Raise a ValueError if shard_by is not in SHARD_MODES.
+    """
+    if shard_by == 'genre':
+        return genre_shards(metadatas)
+    elif shard_by == 'features':
+        return cluster_shards(metadatas, math.ceil(len(metadatas) / CLUSTER_SIZE))
+    raise ValueError(f'shard_by must be one of {", ".join(sorted(SHARD_MODES))}')
+
+
+def genre_shards(metadatas: list[dict]) -> list[str]:
+    """Return the shard of every song with the given metadata: its genre, or 'unknown' if it has none."""
+    return [metadata.get('track_genre') or 'unknown' for metadata in metadatas]
+
+
+def cluster_shards(metadatas: list[dict], count: int, seed: int = 111, iterations: int = 20) -> list[str]:
+    """Return the shard of every song with the given metadata: 'cluster-<i>' for the cluster its
+    normalized audio features belong to among count clusters.
+
+    The clusters are found by spherical k-means, which compares songs by the cosine of their
+    feature vectors like the similarity score does, starting from count songs chosen at random
+    with the given seed. Adding or changing songs can move songs between clusters.
+    """
+    if not metadatas:
+        return []
+
+    features, magnitudes = normalized_features(metadatas)
+    units = _units(features, magnitudes)
+    count = max(1, min(count, len(units)))
+    rng = np.random.default_rng(seed)
+    centroids = units[rng.choice(len(units), size=count, replace=False)]
+
+    labels = np.argmax(units @ centroids.T, axis=1)
+    for _ in range(iterations):
+        for cluster in range(count):
+            members = labels == cluster
+            if members.any():
+                centroids[cluster] = _units(units[members].sum(axis=0, keepdims=True))[0]
+        updated = np.argmax(units @ centroids.T, axis=1)
+        if np.array_equal(updated, labels):
+            break
+        labels = updated
+
+    width = len(str(count - 1))
+    return [f'cluster-{label:0{width}d}' for label in labels.tolist()]
+
+
+def build_sharded_graph(metadatas: list[dict], shards: list[str], directory: Optional[str] = None,
+                        threshold: float = 0.3, top_k: Optional[int] = 20, index: Optional[Any] = None,
+                        workers: int = 1, boundary_fraction: float = 0.05, probes: int = 2,
+                        boundary_top_k: int = 5, metrics: Optional[Metrics] = None,
+                        on_vertices: Optional[Callable[[ShardedGraph], None]] = None) -> ShardedGraph:
+    """Return the sharded graph of the songs with the given metadata, keyed by their track_id,
+    with song i in the shard named shards[i]. A song listed more than once is only added the
+    first time, like WeightedGraph.add_vertex does.
+
+    Every shard connects each of its songs to its top_k most similar later songs of the shard
+    above threshold, like WeightedGraph.add_similarity_edges, comparing the pairs proposed by
+    index if given, or every pair otherwise, on the given number of worker processes. Then the
+    boundary_fraction of the songs of every shard closest to the centre of another shard are
+    compared with every song of the probes shards whose centres are closest to them, and
+    connected to the boundary_top_k most similar of those songs above threshold.
+
+    If directory is given, every shard whose songs and build settings match its snapshot file
+    there is memory-mapped from it instead of being built, the shards built are saved there,
+    and the cross-shard comparisons between unchanged shards are read from its boundary file.
+
+    If metrics is given, the stages of the build and the shards loaded and built are recorded
+    there. If on_vertices is given, it is called with the graph as soon as every song is a
+    vertex, before the edges are built.
+
+    Raise a ValueError if two shards would be saved to the same file.
+    """
+    settings = {'threshold': threshold, 'top_k': top_k,
+                'index': None if index is None else [index.n_trees, index.leaf_size, index.seed]}
+    first_rows = {}
+    for row, metadata in enumerate(metadatas):
+        first_rows.setdefault(metadata['track_id'], row)
+    metadatas = [metadatas[row] for row in first_rows.values()]
+    shards = [shards[row] for row in first_rows.values()]
+    keys = list(first_rows)
+    groups = {}
+    for row, shard in enumerate(shards):
+        groups.setdefault(shard, []).append(row)
+    groups = {shard: np.array(rows) for shard, rows in groups.items()}
+    digests = {shard: _songs_digest([metadatas[row] for row in rows.tolist()]) for shard, rows in groups.items()}
+    paths = _shard_paths(directory, list(groups)) if directory is not None else {}
+
+    graphs, built = {}, []
+    with DISABLED if metrics is None else metrics.stage('load_shards'):
+        for shard, rows in groups.items():
+            snapshot = None
+            if directory is not None:
+                snapshot = load_snapshot(paths[shard], None, dict(settings, songs=digests[shard]))
+            if snapshot is not None:
+                graphs[shard] = snapshot
+            else:
+                graph = WeightedGraph()
+                for row in rows.tolist():
+                    graph.add_vertex(keys[row], metadatas[row])
+                graphs[shard] = graph
+                built.append(shard)
+    if metrics is not None:
+        metrics.count('shards_loaded', len(groups) - len(built))
+        metrics.count('shards_built', len(built))
+        metrics.count('pairs_planned', sum(len(groups[shard]) * (len(groups[shard]) - 1) // 2 for shard in built))
+
+    popularity = {key: float(metadata.get('popularity', 0)) for key, metadata in zip(keys, metadatas)}
+    sharded = ShardedGraph(graphs, dict(zip(keys, shards)), popularity)
+    if on_vertices is not None:
+        on_vertices(sharded)
+
+    features, magnitudes = normalized_features(metadatas)
+    cached = _read_boundary(os.path.join(directory, BOUNDARY_FILE), settings, boundary_top_k) \
+        if directory is not None else {}
+    with DISABLED if metrics is None else metrics.stage('boundary'):
+        comparisons = boundary_comparisons(features, magnitudes, groups, boundary_fraction, probes)
+        blocks = {}
+        for (source, target), tracks in comparisons.items():
+            block = cached.get((source, target))
+            unchanged = block is not None and block['source_songs'] == digests[source] \
+                and block['target_songs'] == digests[target]
+            blocks[source, target] = _compare_boundary(features, magnitudes, keys, tracks, groups[target],
+                                                       threshold, boundary_top_k, block if unchanged else None,
+                                                       metrics)
+            blocks[source, target].update(source_songs=digests[source], target_songs=digests[target])
+        boundary = _boundary_edges(blocks.values(), {key: row for row, key in enumerate(keys)}, boundary_top_k)
+
+    with DISABLED if metrics is None else metrics.stage('similar_pairs'):
+        edges = _shard_edges([(features[groups[shard]], magnitudes[groups[shard]]) for shard in built],
+                             threshold, top_k, index, workers, metrics)
+        if metrics is not None:
+            metrics.count('edges_accepted', len(boundary[0]))
+
+    with DISABLED if metrics is None else metrics.stage('link'):
+        for shard, (sources, targets, scores) in zip(built, edges):
+            shard_keys = [keys[row] for row in groups[shard].tolist()]
+            _link_edges(graphs[shard].add_edge, shard_keys, sources, targets, scores, metrics)
+        _link_edges(sharded.add_boundary_edge, keys, *boundary, metrics)
+
+    if directory is not None:
+        with DISABLED if metrics is None else metrics.stage('save_shards'):
+            os.makedirs(directory, exist_ok=True)
+            for shard in built:
+                save_snapshot(graphs[shard], paths[shard], None, dict(settings, songs=digests[shard]))
+            _write_boundary(os.path.join(directory, BOUNDARY_FILE), settings, boundary_top_k, blocks)
+
+    return sharded
+
+
+def boundary_comparisons(features: np.ndarray, magnitudes: np.ndarray, groups: dict[str, np.ndarray],
+                         fraction: float, probes: int) -> dict[tuple[str, str], np.ndarray]:
+    """Return the rows of the boundary tracks of every shard to compare with every song of another
+    shard, keyed by (shard, other shard).
+
+    groups maps every shard to the rows of its songs. The centre of a shard is the mean of the
+    unit feature vectors of its songs; the boundary tracks of a shard are the ceil(fraction * size)
+    songs whose score with the centre of another shard comes closest to their score with the
+    centre of their own shard, and each is compared with the probes other shards whose centres it
+    scores best with.
+    """
+    if len(groups) < 2 or fraction <= 0 or probes <= 0:
+        return {}
+
+    names = list(groups)
+    units = _units(features, magnitudes)
+    centres = _units(np.array([units[rows].mean(axis=0) for rows in groups.values()]))
+    labels = np.empty(len(features), dtype=int)
+    for shard, rows in enumerate(groups.values()):
+        labels[rows] = shard
+
+    affinity = (units @ centres.T) ** 2
+    everyone = np.arange(len(features))
+    own = affinity[everyone, labels]
+    affinity[everyone, labels] = -np.inf
+    nearest = np.argsort(-affinity, axis=1, kind='stable')[:, :min(probes, len(names) - 1)]
+    margins = own - affinity[everyone, nearest[:, 0]]
+
+    comparisons = {}
+    for shard, rows in groups.items():
+        tracks = rows[np.argsort(margins[rows], kind='stable')[:math.ceil(fraction * len(rows))]]
+        for target in np.unique(nearest[tracks]).tolist():
+            comparisons[shard, names[target]] = np.sort(tracks[(nearest[tracks] == target).any(axis=1)])
+    return comparisons
+
+
+def _compare_boundary(features: np.ndarray, magnitudes: np.ndarray, keys: list[str], tracks: np.ndarray,
+                      targets: np.ndarray, threshold: float, top_k: int, cached: Optional[dict],
+                      metrics: Optional[Metrics]) -> dict:
+    """Return the block of cross-shard edges of the given track rows with the songs at the target
+    rows: the keys of the tracks and the top_k edges of each above threshold, as [track, song,
+    score] lists.
+
+    The edges of the tracks in the cached block of the same shards, if given, are reused, and
+    only the other tracks are compared. Like similar_pairs, the scores are computed block-wise and
+    only the candidates that can make the cut are rescored exactly.
+    """
+    tracks_keys = [keys[row] for row in tracks.tolist()]
+    reused = set(cached['tracks']).intersection(tracks_keys) if cached is not None else set()
+    edges = [edge for edge in cached['edges'] if edge[0] in reused] if cached is not None else []
+    new = np.array([row for row, key in zip(tracks.tolist(), tracks_keys) if key not in reused], dtype=int)
+    if metrics is not None:
+        metrics.count('pairs_planned', len(new) * len(targets))
+
+    step = max(1, _COMPARE_ELEMENTS // max(len(targets), 1))
+    for lo in range(0, len(new) if len(targets) > 0 else 0, step):
+        rows = new[lo:lo + step]
+        raw = similarity_block(features, magnitudes, rows, targets)
+        if metrics is not None:
+            metrics.count('similarity_evaluations', raw.size)
+
+        candidates, columns, scores = block_candidates(raw, raw * raw, threshold, top_k)
+        sources, columns = rows[candidates], targets[columns]
+        order = select_top_k(sources, columns, scores, top_k)
+        edges += [[keys[source], keys[column], score] for source, column, score
+                  in zip(sources[order].tolist(), columns[order].tolist(), scores[order].tolist())]
+    return {'tracks': tracks_keys, 'edges': edges}
+
+
+def _boundary_edges(blocks: Iterable[dict], rows: dict[str, int], top_k: int
+                    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return the (sources, targets, scores) arrays of the cross-shard edges kept from the given
+    blocks, as the rows given by rows of the keys of their songs: the top_k of every boundary
+    track over all the shards it was compared with, ordered like select_top_k, with every pair
+    of songs kept once.
+    """
+    edges = [edge for block in blocks for edge in block['edges']]
+    sources = np.array([rows[edge[0]] for edge in edges], dtype=int)
+    targets = np.array([rows[edge[1]] for edge in edges], dtype=int)
+    scores = np.array([edge[2] for edge in edges], dtype=float)
+
+    order = select_top_k(sources, targets, scores, top_k)
+    kept, pairs = [], set()
+    for position, source, target in zip(order.tolist(), sources[order].tolist(), targets[order].tolist()):
+        pair = (min(source, target), max(source, target))
+        if pair not in pairs:
+            pairs.add(pair)
+            kept.append(position)
+    kept = np.array(kept, dtype=int)
+    return sources[kept], targets[kept], scores[kept]
+
+
+def _shard_edges(shards: list[tuple[np.ndarray, np.ndarray]], threshold: float, top_k: Optional[int],
+                 index: Optional[Any], workers: int, metrics: Optional[Metrics]
+                 ) -> list[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Return the (sources, targets, scores) arrays of the edges of every shard with the given
+    normalized features and squared magnitudes, as kept by similar_pairs, or by index if given.
+
+    Shards are built on the given number of worker processes when index is None; the edges do
+    not depend on the number of workers.
+    """
+    if index is not None:
+        edges = [index.similar_pairs(features, magnitudes, threshold, top_k) for features, magnitudes in shards]
+        if metrics is not None:
+            metrics.count('edges_accepted', sum(len(scores) for _, _, scores in edges))
+        return edges
+    elif workers <= 1 or len(shards) < 2:
+        return [similar_pairs(features, magnitudes, threshold, top_k, metrics=metrics)
+                for features, magnitudes in shards]
+
+    edges = []
+    with ProcessPoolExecutor(min(workers, len(shards))) as executor:
+        for (features, _), shard_edges in zip(shards, executor.map(similar_pairs, *zip(*shards),
+                                                                   itertools.repeat(threshold),
+                                                                   itertools.repeat(top_k))):
+            if metrics is not None:
+                metrics.count('similarity_evaluations', len(features) * (len(features) - 1) // 2)
+                metrics.count('edges_accepted', len(shard_edges[2]))
+            edges.append(shard_edges)
+    return edges
+
+
+def _link_edges(add_edge: Callable[[Any, Any, float], None], keys: list, sources: np.ndarray,
+                targets: np.ndarray, scores: np.ndarray, metrics: Optional[Metrics]) -> None:
+    """Add the edges between keys[sources[i]] and keys[targets[i]] with weight scores[i] with
+    add_edge, in order, counting the edges linked in metrics if given.
+    """
+    for lo in range(0, len(scores), _LINK_CHUNK):
+        for source, target, score in zip(sources[lo:lo + _LINK_CHUNK].tolist(), targets[lo:lo + _LINK_CHUNK].tolist(),
+                                         scores[lo:lo + _LINK_CHUNK].tolist()):
+            add_edge(keys[source], keys[target], score)
+        if metrics is not None:
+            metrics.count('edges_linked', min(_LINK_CHUNK, len(scores) - lo))
+
+
+def _units(features: np.ndarray, magnitudes: Optional[np.ndarray] = None) -> np.ndarray:
+    """Return the rows of features scaled to unit length, given their squared magnitudes if known.
+
+    Rows of length zero stay zero.
+    """
+    if magnitudes is None:
+        magnitudes = (features ** 2).sum(axis=1)
+    roots = np.sqrt(magnitudes)[:, None]
+    return np.divide(features, roots, out=np.zeros(features.shape), where=roots != 0)
+
+
+def _songs_digest(metadatas: list[dict]) -> str:
+    """Return the SHA-256 hex digest of the given song metadata, in order."""
+    return hashlib.sha256(json.dumps(metadatas, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _shard_paths(directory: str, shards: list[str]) -> dict[str, str]:
+    """Return the path of the snapshot file of every shard in directory.
+
+    Raise a ValueError if two shards would be saved to the same file.
+    """
+    paths = {shard: os.path.join(directory, re.sub(r'[^A-Za-z0-9_-]', '_', shard) + '.graph') for shard in shards}
+    if len(set(paths.values())) < len(paths):
+        raise ValueError('two shards have the same file name')
+    return paths
+
+
+def _read_boundary(path: str, settings: dict, top_k: int) -> dict[tuple[str, str], dict]:
+    """Return the blocks of cross-shard edges saved at path, keyed by (shard, other shard), or
+    no blocks if the file does not exist or was saved with other settings.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as file:
+        saved = json.load(file)
+    if saved.get('version') != BOUNDARY_VERSION or saved.get('settings') != json.loads(json.dumps(settings)) \
+            or saved.get('top_k') != top_k:
+        return {}
+    return {(block['source'], block['target']): block for block in saved['blocks']}
+
+
+def _write_boundary(path: str, settings: dict, top_k: int, blocks: dict[tuple[str, str], dict]) -> None:
+    """Save the given blocks of cross-shard edges at path, replacing the file atomically."""
+    saved = {'version': BOUNDARY_VERSION, 'settings': settings, 'top_k': top_k,
+             'blocks': [dict(block, source=source, target=target) for (source, target), block in blocks.items()]}
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as file:
+        json.dump(saved, file)
+    os.replace(temporary_path, path)
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['concurrent.futures', 'hashlib', 'itertools', 'json', 'math', 'os', 're', 'numpy',
+                          'instrumentation', 'recommender', 'search', 'snapshot'],
+        'allowed-io': ['_read_boundary', '_write_boundary'],
+        'max-line-length': 120
+    })
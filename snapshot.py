@@ -0,0 +1,519 @@
+"""CSC111 Winter 2025 Project: Spotify Song Recommendation System
+
+This Python module contains the binary snapshot format used to save a built song
+similarity graph and memory-map it back without parsing the CSV file again.
+
+A snapshot file starts with an 8 byte magic string, the length of a JSON header
+as a little-endian unsigned 64 bit integer, and the JSON header itself. The
+header records the format version, a fingerprint of the source CSV file, the
+build settings and the byte offset, dtype and shape of every array section.
+Each section starts on a 64 byte boundary:
+
+    - indptr, indices, weights: the adjacency in compressed sparse row form,
+      with float32 weights and neighbours in the order their edges were added
+    - raw_features: the unnormalized audio features, popularity, duration and
+      explicit flag of every song
+    - features, magnitudes: the normalized feature matrix used for scoring
+    - string_offsets, strings: the UTF-8 track, artist, album, genre and key
+      (track_id) of every song, song i using strings 5 * i to 5 * i + 4
+    - name_hashes, name_order: the hashes of the lowercased track names in
+      sorted order, and the songs they belong to, for lookups by name
+    - key_hashes, key_order: the same for the keys of the songs
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of students
+taking CSC111 at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult our Course Syllabus.
+
+This file is Copyright (c) 2025 Cindy Yang, Kate Shen, Kristen Wong, Sara Kopilovic.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from instrumentation import DISABLED, Metrics
+from recommender import FEATURE_CONFIGURATION, WeightedGraph, _WeightedVertex, normalized_features, pair_scores
+from random_walk import RandomWalk, best_rows
+from search import SongSearchIndex
+from vector_search import VectorSearch
+
+SNAPSHOT_MAGIC = b'SPOTGRPH'
+SNAPSHOT_VERSION = 2
+
+# Every array section starts on a multiple of this many bytes
+_ALIGNMENT = 64
+
+# The metadata keys stored as raw_features, in column order
+_RAW_KEYS = [feature for feature, _, _, _ in FEATURE_CONFIGURATION] + ['popularity', 'duration_ms', 'explicit']
+
+# The metadata keys stored in the string table, in order, followed by the key of the song
+_STRING_KEYS = ['track_name', 'artists', 'album_name', 'track_genre']
+
+# The number of strings of every song in the string table
+_STRINGS_PER_SONG = len(_STRING_KEYS) + 1
+
+
+class SnapshotGraph:
+    """A read-only song similarity graph backed by the arrays of a memory-mapped snapshot file.
+
+    Loading creates no per-song Python objects; they are only created for the songs a query
+    touches. Processes that load the same snapshot share its pages through the OS page cache.
+
+    Instance Attributes:
+        - vector_precision: The precision recommend_songs_direct stores the feature vectors it scans
+                            in, one of vector_search.PRECISIONS. It does not change the results.
+
+    Private Instance Attributes:
+        - _arrays: The sections of the snapshot file, as views into the memory map.
+        - _search: The index used by search_songs, created on first use.
+        - _walk: The random walk used by recommend_songs_multi_hop, created on first use.
+        - _vectors: The vector search used by recommend_songs_direct, created on first use.
+        - _metrics: The metrics the stages of querying this graph are recorded in, if
+                    instrumentation is enabled.
+    """
+    vector_precision: str
+    _arrays: dict[str, np.ndarray]
+    _search: Optional[SongSearchIndex]
+    _walk: Optional[RandomWalk]
+    _vectors: Optional[VectorSearch]
+    _metrics: Optional[Metrics]
+
+    def __init__(self, arrays: dict[str, np.ndarray]) -> None:
+        self.vector_precision = 'float32'
+        self._arrays = arrays
+        self._search = None
+        self._walk = None
+        self._vectors = None
+        self._metrics = None
+
+    def get_vertex(self, item: Any) -> Optional[_WeightedVertex]:
+        """Return a vertex holding the metadata of the given item if it exists.
+
+        The neighbours of the returned vertex are not materialized.
+        """
+        index = self._index_of(item)
+        if index is None:
+            return None
+        return _WeightedVertex(item, self._metadata(index))
+
+    def get_neighbours(self, item: Any) -> dict[Any, float]:
+        """Return the items adjacent to the given item, mapped to the edge weights, in the order
+        the edges were added, like WeightedGraph.get_neighbours.
+
+        Raise a ValueError if item does not appear as a vertex in this graph.
+        """
+        index = self._index_of(item)
+        if index is None:
+            raise ValueError
+        start, stop = int(self._arrays['indptr'][index]), int(self._arrays['indptr'][index + 1])
+        return {self._key(neighbour): weight for neighbour, weight in
+                zip(self._arrays['indices'][start:stop].tolist(), self._arrays['weights'][start:stop].tolist())}
+
+    def get_all_vertices(self) -> set:
+        """Return a set of all vertex items in this weighted graph."""
+        return {self._key(i) for i in range(len(self._arrays['magnitudes']))}
+
+    def get_similarity_score(self, item1: Any, item2: Any) -> float:
+        """Return the similarity score between two vertices."""
+        index1, index2 = self._index_of(item1), self._index_of(item2)
+        if index1 is None or index2 is None:
+            raise ValueError()
+        scores = pair_scores(self._arrays['features'], self._arrays['magnitudes'],
+                             np.array([index1]), np.array([index2]))
+        return float(scores[0])
+
+    def find_song_id(self, song_name: str) -> Optional[str]:
+        """Find a song's vertex key (its track_id) by its track name (case-insensitive)."""
+        index = self._find_index(song_name)
+        return None if index is None else self._key(index)
+
+    def search_songs(self, query: str, limit: int = 10) -> list:
+        """Return the keys of up to limit songs whose track name matches the free-text query,
+        best matches first, like WeightedGraph.search_songs.
+
+        The search index is built from the string table on first use.
+        """
+        if self._search is None:
+            self._search = SongSearchIndex()
+            popularity = self._arrays['raw_features'][:, _RAW_KEYS.index('popularity')].tolist()
+            for i, song_popularity in enumerate(popularity):
+                self._search.add(self._key(i), self._text(i, 'track_name'), song_popularity)
+        return self._search.search(query, limit)
+
+    def use_metrics(self, metrics: Optional[Metrics]) -> None:
+        """Record the stages of querying this graph in the given metrics, or stop recording
+        them if it is None.
+        """
+        self._metrics = metrics
+
+    def recommend_songs(self, song_names: List[str], limit: int = 5) -> List[Dict]:
+        """Generate recommendations based on multiple seed songs.
+
+        The result matches WeightedGraph.recommend_songs on the graph this snapshot was saved
+        from: the edge weights are stored as float32, so the weights of the seeds' edges are
+        computed again exactly from the normalized features before they are averaged.
+        """
+        if self._metrics is not None:
+            with self._metrics.operation('recommend_songs'):
+                return self._recommend(song_names, limit)
+        return self._recommend(song_names, limit)
+
+    def _recommend(self, song_names: List[str], limit: int) -> List[Dict]:
+        """Return the recommendations for the given seed songs."""
+        if not song_names:
+            return []
+
+        metrics = self._metrics
+        with DISABLED if metrics is None else metrics.stage('seed_lookup'):
+            seeds = [index for index in map(self._resolve, song_names) if index is not None]
+        skipped = set(seeds)
+
+        indptr, indices = self._arrays['indptr'], self._arrays['indices']
+        recommendations = {}
+
+        for index in seeds:
+            start, stop = int(indptr[index]), int(indptr[index + 1])
+            if metrics is not None:
+                metrics.count('neighbours_scanned', stop - start)
+            for neighbour, weight in zip(indices[start:stop].tolist(), self._exact_weights(index).tolist()):
+                if neighbour in skipped:  # Skip seed songs
+                    continue
+
+                if neighbour in recommendations:
+                    recommendations[neighbour][0] += weight
+                    recommendations[neighbour][1] += 1
+                else:
+                    recommendations[neighbour] = [weight, 1]
+
+        results = []
+        popularity = _RAW_KEYS.index('popularity')
+        for neighbour, (total_score, count) in recommendations.items():
+            results.append({
+                'track': self._text(neighbour, 'track_name'),
+                'artist': self._text(neighbour, 'artists'),
+                'album': self._text(neighbour, 'album_name'),
+                'score': total_score / count,
+                'popularity': float(self._arrays['raw_features'][neighbour, popularity])
+            })
+
+        # Sort by average score (descending) then popularity (descending)
+        with DISABLED if metrics is None else metrics.stage('sort'):
+            results.sort(key=lambda x: (-x['score'], -x['popularity']))
+
+        return results[:limit]
+
+    def _exact_weights(self, index: int) -> np.ndarray:
+        """Return the weights of the edges of the song at the given index, in order, as float64.
+
+        An edge whose float32 weight is its similarity score rounded gets that score, as computed
+        by pair_scores when the graph was built; any other edge, such as one added with a weight
+        of its own, keeps its stored weight.
+        """
+        start, stop = int(self._arrays['indptr'][index]), int(self._arrays['indptr'][index + 1])
+        neighbours, stored = self._arrays['indices'][start:stop], self._arrays['weights'][start:stop]
+        scores = pair_scores(self._arrays['features'], self._arrays['magnitudes'],
+                             np.full(stop - start, index), neighbours)
+        return np.where(scores.astype(np.float32) == stored, scores, stored.astype(np.float64))
+
+    def recommend_songs_multi_hop(self, song_names: List[str], limit: int = 5, restart: float = 0.15,
+                                  max_iterations: int = 50, tolerance: float = 1e-6,
+                                  time_limit: Optional[float] = None,
+                                  push_epsilon: Optional[float] = None) -> List[Dict]:
+        """Generate recommendations based on multiple seed songs by a random walk with restart,
+        like WeightedGraph.recommend_songs_multi_hop. A call capped by time_limit may return a
+        ranking that has not converged.
+        """
+        seeds = [index for index in map(self._resolve, song_names) if index is not None]
+        if not seeds:
+            return []
+
+        walk = self._random_walk()
+        deadline = None if time_limit is None else time.perf_counter() + time_limit
+        rows, scores = walk.visit_scores(seeds, restart, max_iterations, tolerance, push_epsilon, deadline)
+        rows, scores = best_rows(rows, scores, seeds, limit)
+
+        results = []
+        popularity = _RAW_KEYS.index('popularity')
+        for row, score in zip(rows.tolist(), scores.tolist()):
+            results.append({
+                'track': self._text(row, 'track_name'),
+                'artist': self._text(row, 'artists'),
+                'album': self._text(row, 'album_name'),
+                'score': score,
+                'popularity': float(self._arrays['raw_features'][row, popularity])
+            })
+
+        # Sort by score (descending) then popularity (descending)
+        results.sort(key=lambda x: (-x['score'], -x['popularity']))
+
+        return results[:limit]
+
+    def recommend_songs_direct(self, song_names: List[str], limit: int = 5) -> List[Dict]:
+        """Generate recommendations based on multiple seed songs by comparing the seeds with
+        every song, without using the edges, like WeightedGraph.recommend_songs_direct.
+        """
+        if self._metrics is not None:
+            with self._metrics.operation('recommend_songs_direct'):
+                return self._recommend_direct(song_names, limit)
+        return self._recommend_direct(song_names, limit)
+
+    def _recommend_direct(self, song_names: List[str], limit: int) -> List[Dict]:
+        """Return the recommendations of recommend_songs_direct for the given seed songs."""
+        metrics = self._metrics
+        with DISABLED if metrics is None else metrics.stage('seed_lookup'):
+            seeds = [index for index in map(self._resolve, song_names) if index is not None]
+            if self._vectors is None or self._vectors.precision != self.vector_precision:
+                self._vectors = VectorSearch(self._arrays['features'], self._arrays['magnitudes'],
+                                             self._arrays['raw_features'][:, _RAW_KEYS.index('popularity')],
+                                             self.vector_precision)
+
+        with DISABLED if metrics is None else metrics.stage('scan'):
+            rows, scores = self._vectors.search(seeds, limit, metrics=metrics)
+
+        results = []
+        popularity = _RAW_KEYS.index('popularity')
+        for row, score in zip(rows.tolist(), scores.tolist()):
+            results.append({
+                'track': self._text(row, 'track_name'),
+                'artist': self._text(row, 'artists'),
+                'album': self._text(row, 'album_name'),
+                'score': score,
+                'popularity': float(self._arrays['raw_features'][row, popularity])
+            })
+        return results
+
+    def precompute_multi_hop(self, items: Optional[Iterable] = None, restart: float = 0.15,
+                             push_epsilon: float = 1e-4, keep: Optional[int] = 200) -> None:
+        """Push the random walks of the given songs, or of every song if items is None, ahead of
+        time, like WeightedGraph.precompute_multi_hop.
+        """
+        if items is None:
+            seeds = list(range(len(self._arrays['magnitudes'])))
+        else:
+            seeds = [self._index_of(item) for item in items]
+        self._random_walk().precompute(seeds, restart, push_epsilon, keep)
+
+    def _random_walk(self) -> RandomWalk:
+        """Return the random walk over this graph, creating it on first use."""
+        if self._walk is None:
+            self._walk = RandomWalk(self._arrays['indptr'], self._arrays['indices'], self._arrays['weights'])
+        return self._walk
+
+    def _string(self, position: int) -> str:
+        """Return the string at the given position of the string table."""
+        offsets = self._arrays['string_offsets']
+        return self._arrays['strings'][offsets[position]:offsets[position + 1]].tobytes().decode('utf-8')
+
+    def _text(self, index: int, key: str) -> str:
+        """Return the metadata under the given key of _STRING_KEYS of the song at the given index."""
+        return self._string(_STRINGS_PER_SONG * index + _STRING_KEYS.index(key))
+
+    def _key(self, index: int) -> str:
+        """Return the key of the song at the given index."""
+        return self._string(_STRINGS_PER_SONG * index + len(_STRING_KEYS))
+
+    def _metadata(self, index: int) -> dict:
+        """Return the metadata dictionary of the song at the given index."""
+        metadata = dict(zip(_RAW_KEYS, self._arrays['raw_features'][index].tolist()))
+        metadata['duration_ms'] = int(metadata['duration_ms'])
+        metadata['explicit'] = bool(metadata['explicit'])
+        for key in _STRING_KEYS:
+            metadata[key] = self._text(index, key)
+        metadata['track_id'] = self._key(index)
+        return metadata
+
+    def _candidates(self, name: str, kind: str = 'name') -> list[int]:
+        """Return the indices of the songs whose lowercased track name, or key if kind is 'key',
+        hashes like name, in insertion order.
+        """
+        hashes = self._arrays[kind + '_hashes']
+        key = np.uint64(_name_hash(name))
+        lo, hi = np.searchsorted(hashes, key, side='left'), np.searchsorted(hashes, key, side='right')
+        return self._arrays[kind + '_order'][lo:hi].tolist()
+
+    def _index_of(self, item: Any) -> Optional[int]:
+        """Return the index of the song whose key is exactly item, if it exists."""
+        if not isinstance(item, str):
+            return None
+        for index in self._candidates(item, 'key'):
+            if self._key(index) == item:
+                return index
+        return None
+
+    def _find_index(self, song_name: str) -> Optional[int]:
+        """Return the index of the first song with the given track name (case-insensitive), if any."""
+        target_name = song_name.lower().strip()
+        for index in self._candidates(target_name):
+            if self._text(index, 'track_name').lower() == target_name:
+                return index
+        return None
+
+    def _resolve(self, song_name: str) -> Optional[int]:
+        """Return the index of the song given by song_name, which is either its key or its track name,
+        like WeightedGraph._resolve.
+        """
+        index = self._index_of(song_name)
+        return index if index is not None else self._find_index(song_name)
+
+
+def save_snapshot(graph: WeightedGraph, path: str, source_file: Optional[str] = None,
+                  build_settings: Optional[dict] = None) -> None:
+    """Save graph to a snapshot file at path.
+
+    If source_file is given, the snapshot records its fingerprint so that load_snapshot can
+    detect when it changes. build_settings is any JSON-serializable description of how the
+    edges were built, which load_snapshot also checks. The file is replaced atomically, so
+    processes still reading an older snapshot are unaffected.
+    """
+    items, indptr, indices, weights = graph.to_csr()
+    metadatas = [graph.get_vertex(item).metadata for item in items]
+    features, magnitudes = normalized_features(metadatas, graph.feature_configuration)
+
+    encoded = [string.encode('utf-8') for item, metadata in zip(items, metadatas)
+               for string in [metadata.get(key, '') for key in _STRING_KEYS] + [item]]
+    string_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(string) for string in encoded], out=string_offsets[1:])
+
+    name_hashes = np.array([_name_hash(metadata.get('track_name', '').lower()) for metadata in metadatas],
+                           dtype=np.uint64)
+    name_order = np.argsort(name_hashes, kind='stable')
+    key_hashes = np.array([_name_hash(item) for item in items], dtype=np.uint64)
+    key_order = np.argsort(key_hashes, kind='stable')
+
+    arrays = {
+        'indptr': indptr,
+        'indices': indices.astype(np.int32),
+        'weights': weights.astype(np.float32),
+        'raw_features': np.array([[metadata.get(key, 0.0) for key in _RAW_KEYS] for metadata in metadatas],
+                                 dtype=np.float64).reshape(len(items), len(_RAW_KEYS)),
+        'features': features,
+        'magnitudes': magnitudes,
+        'string_offsets': string_offsets,
+        'strings': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+        'name_hashes': name_hashes[name_order],
+        'name_order': name_order.astype(np.int64),
+        'key_hashes': key_hashes[key_order],
+        'key_order': key_order.astype(np.int64)
+    }
+
+    header = {
+        'version': SNAPSHOT_VERSION,
+        'source': None if source_file is None else _fingerprint(source_file),
+        'build_settings': build_settings,
+        'feature_configuration': graph.feature_configuration,
+        'sections': {}
+    }
+    # Section offsets depend on the header length, so lay them out relative to the data start
+    offset = 0
+    for name, array in arrays.items():
+        header['sections'][name] = [offset, array.dtype.str, list(array.shape)]
+        offset = _aligned(offset + array.nbytes)
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = _aligned(len(SNAPSHOT_MAGIC) + 8 + len(header_bytes))
+
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as file:
+        file.write(SNAPSHOT_MAGIC)
+        file.write(len(header_bytes).to_bytes(8, 'little'))
+        file.write(header_bytes)
+        for name, array in arrays.items():
+            file.seek(data_start + header['sections'][name][0])
+            file.write(np.ascontiguousarray(array).tobytes())
+    os.replace(temporary_path, path)
+
+
+def load_snapshot(path: str, source_file: Optional[str] = None,
+                  build_settings: Optional[dict] = None) -> Optional[SnapshotGraph]:
+    """Memory-map the snapshot file at path and return the graph it holds.
+
+    Return None if the file does not exist, was written by another format version or feature
+    configuration, was built with different build_settings, or is stale because source_file
+    changed since it was saved.
+    """
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'rb') as file:
+        if file.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            return None
+        header_length = int.from_bytes(file.read(8), 'little')
+        header = json.loads(file.read(header_length).decode('utf-8'))
+
+    expected_configuration = json.loads(json.dumps(FEATURE_CONFIGURATION))
+    if header['version'] != SNAPSHOT_VERSION or header['feature_configuration'] != expected_configuration:
+        return None
+    if json.loads(json.dumps(build_settings)) != header['build_settings']:
+        return None
+    if source_file is not None and not _matches_fingerprint(source_file, header['source']):
+        return None
+
+    data_start = _aligned(len(SNAPSHOT_MAGIC) + 8 + header_length)
+    # A plain array view of the map is still backed by the file, and is sliced without the memmap overhead
+    buffer = np.memmap(path, dtype=np.uint8, mode='r').view(np.ndarray)
+    arrays = {}
+    for name, (offset, dtype, shape) in header['sections'].items():
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape, dtype=np.int64))
+        start = data_start + offset
+        arrays[name] = buffer[start:start + count * dtype.itemsize].view(dtype).reshape(shape)
+
+    return SnapshotGraph(arrays)
+
+
+def _aligned(offset: int) -> int:
+    """Return the first multiple of _ALIGNMENT that is at least offset."""
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+def _name_hash(name: str) -> int:
+    """Return a 64 bit hash of name that is the same in every process."""
+    return int.from_bytes(hashlib.blake2b(name.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _file_hash(path: str) -> str:
+    """Return the SHA-256 hex digest of the file at path."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _fingerprint(path: str) -> dict:
+    """Return the size, modification time and hash of the file at path."""
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': _file_hash(path)}
+
+
+def _matches_fingerprint(path: str, fingerprint: Optional[dict]) -> bool:
+    """Return whether the file at path still matches the given fingerprint.
+
+    The file is only hashed again when its size matches but its modification time changed.
+    """
+    if fingerprint is None or not os.path.exists(path):
+        return False
+    stat = os.stat(path)
+    if stat.st_size != fingerprint['size']:
+        return False
+    return stat.st_mtime_ns == fingerprint['mtime_ns'] or _file_hash(path) == fingerprint['sha256']
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['hashlib', 'json', 'os', 'numpy', 'recommender', 'search', 'random_walk', 'time',
+                          'instrumentation', 'vector_search'],
+        'allowed-io': ['save_snapshot', 'load_snapshot', '_file_hash'],
+        'max-line-length': 120
+    })
@@ -0,0 +1,185 @@
+"""CSC111 Winter 2025 Project: Spotify Song Recommendation System
+
+This Python module contains the pytest tests checking that the faster recommendation paths
+return exactly what the simple ones do.
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of students
+taking CSC111 at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult our Course Syllabus.
+
+This file is Copyright (c) 2025 Cindy Yang, Kate Shen, Kristen Wong, Sara Kopilovic.
+"""
+from __future__ import annotations
+import random
+
+import pytest
+
+import vector_search
+from main import read_songs
+from recommendation_cache import RecommendationCache
+from recommender import WeightedGraph
+from sharding import build_sharded_graph, genre_shards
+from snapshot import load_snapshot, save_snapshot
+
+SONGS_FILE = 'data/spotify_songs_smaller.csv'
+
+
+@pytest.fixture(scope='module')
+def songs() -> list[dict]:
+    """Return the songs of SONGS_FILE, keeping the first row of every track_id."""
+    rows = {}
+    for metadata in read_songs(SONGS_FILE):
+        rows.setdefault(metadata['track_id'], metadata)
+    return list(rows.values())
+
+
+@pytest.fixture(scope='module')
+def graph(songs: list[dict]) -> WeightedGraph:
+    """Return the graph of songs with the default similarity edges."""
+    return _build(songs)
+
+
+@pytest.fixture(scope='module')
+def complete_graph(songs: list[dict]) -> WeightedGraph:
+    """Return the graph of songs with an edge between every pair of songs."""
+    return _build(songs, threshold=-1.0, top_k=None)
+
+
+def _build(songs: list[dict], threshold: float = 0.3, top_k: int = 20) -> WeightedGraph:
+    """Return a graph of the given songs with their similarity edges."""
+    graph = WeightedGraph()
+    for metadata in songs:
+        graph.add_vertex(metadata['track_id'], metadata)
+    graph.add_similarity_edges([metadata['track_id'] for metadata in songs], threshold, top_k)
+    return graph
+
+
+def _same_edges(graph1: WeightedGraph, graph2: WeightedGraph) -> bool:
+    """Return whether graph1 and graph2 have the same songs and the same weighted edges."""
+    return graph1.get_all_vertices() == graph2.get_all_vertices() \
+        and all(graph1.get_neighbours(item) == graph2.get_neighbours(item) for item in graph1.get_all_vertices())
+
+
+def _seed_lists(items: list, count: int, seed: int) -> list[list[str]]:
+    """Return count random lists of seed songs, with repeated and unknown seeds among them."""
+    rng = random.Random(seed)
+    seed_lists = []
+    for i in range(count):
+        seeds = rng.sample(items, rng.randint(1, 4))
+        if i % 5 == 0:
+            seeds.append(seeds[0])
+        if i % 7 == 0:
+            seeds.append('no such song')
+        seed_lists.append(seeds)
+    return seed_lists
+
+
+@pytest.mark.parametrize('trial', range(400))
+def test_merge_equals_scan(trial: int) -> None:
+    """Test that merging the seeds' ranked neighbour lists gives the sorted full scan, on a
+    random small graph with many tied weights and popularities.
+    """
+    rng = random.Random(trial)
+    graph = WeightedGraph()
+    n = rng.randint(2, 60)
+    for i in range(n):
+        metadata = {'track_id': f't{i}', 'track_name': f'song {i}', 'artists': 'a', 'album_name': 'b'}
+        if rng.random() < 0.8:
+            metadata['popularity'] = rng.choice([10, 20, 30, float(rng.randint(0, 100))])
+        graph.add_vertex(f't{i}', metadata)
+
+    levels = rng.choice([3, 10, 1000])
+    for _ in range(rng.randint(0, n * n)):
+        item1, item2 = rng.sample(range(n), 2)
+        graph.add_edge(f't{item1}', f't{item2}', rng.randint(0, levels) / levels)
+    if rng.random() < 0.3:
+        for _ in range(5):
+            item1, item2 = rng.sample(range(n), 2)
+            if f't{item2}' in graph.get_neighbours(f't{item1}'):
+                graph.remove_edge(f't{item1}', f't{item2}')
+
+    for _ in range(10):
+        seed_ids = [rng.randrange(n) for _ in range(rng.randint(1, 6))]
+        limit = rng.randint(1, n + 3)
+        expected = graph._scan_neighbours(seed_ids)
+        expected.sort(key=lambda entry: (-entry[0], -entry[1]))
+        assert repr(graph._merge_neighbours(seed_ids, limit)) == repr(expected[:limit])
+
+
+def test_ingest_equals_rebuild(songs: list[dict], graph: WeightedGraph) -> None:
+    """Test that ingesting songs into a graph in chunks gives the graph built from all of them."""
+    grown = _build(songs[:700])
+    grown.ingest(songs[700:], chunk_size=100)
+    assert _same_edges(grown, graph)
+
+
+def test_remove_equals_rebuild(songs: list[dict]) -> None:
+    """Test that removing songs from a graph gives the graph built without them."""
+    graph = _build(songs)
+    removed = set(random.Random(2).sample([metadata['track_id'] for metadata in songs], 100))
+    graph.remove_songs(removed)
+    assert _same_edges(graph, _build([metadata for metadata in songs if metadata['track_id'] not in removed]))
+
+
+@pytest.mark.parametrize('precision', ['float32', 'float16', 'uint8'])
+@pytest.mark.parametrize('block', [vector_search._SCAN_BLOCK, 97])
+def test_direct_equals_complete_graph(complete_graph: WeightedGraph, precision: str, block: int,
+                                      monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that scanning every song's features recommends what the complete graph does, at
+    every vector precision and when the scan is split into blocks.
+    """
+    monkeypatch.setattr(vector_search, '_SCAN_BLOCK', block)
+    monkeypatch.setattr(complete_graph, '_vectors', None)
+    monkeypatch.setattr(complete_graph, 'vector_precision', precision)
+    rng = random.Random(3)
+    for seeds in _seed_lists(sorted(complete_graph.get_all_vertices()), 100, 3):
+        limit = rng.choice([1, 5, 10, 50])
+        assert complete_graph.recommend_songs_direct(seeds, limit) == complete_graph.recommend_songs(seeds, limit)
+
+
+def test_batch_equals_single(graph: WeightedGraph) -> None:
+    """Test that recommending for a batch of seed lists, in several chunks, gives what
+    recommend_songs gives for every list.
+    """
+    seed_lists = _seed_lists(sorted(graph.get_all_vertices()), 1000, 0) + [[], ['no such song']]
+    expected = [graph.recommend_songs(seeds, 7) for seeds in seed_lists]
+    assert graph.recommend_songs_batch(seed_lists, 7, chunk_size=300) == expected
+
+
+def test_sharded_batch_equals_single(songs: list[dict]) -> None:
+    """Test that recommending for a batch of seed lists on a sharded graph, in several chunks,
+    gives what recommend_songs gives for every list.
+    """
+    graph = build_sharded_graph(songs, genre_shards(songs))
+    seed_lists = _seed_lists(sorted(graph.get_all_vertices()), 1000, 5) + [[], ['no such song']]
+    expected = [graph.recommend_songs(seeds, 7) for seeds in seed_lists]
+    assert graph.recommend_songs_batch(seed_lists, 7, chunk_size=300) == expected
+
+
+def test_cache_keeps_results(songs: list[dict]) -> None:
+    """Test that the recommendations are the same with and without the cache, including for
+    the same seeds in another order.
+    """
+    graph = _build(songs)
+    seed_lists = _seed_lists(sorted(graph.get_all_vertices()), 300, 1)
+    seed_lists += [list(reversed(seeds)) for seeds in seed_lists]
+    expected = [graph.recommend_songs(seeds, 5) for seeds in seed_lists]
+    graph.use_cache(RecommendationCache(1000))
+    assert [graph.recommend_songs(seeds, 5) for seeds in seed_lists + seed_lists] == expected + expected
+
+
+def test_snapshot_equals_graph(graph: WeightedGraph, tmp_path) -> None:
+    """Test that a snapshot of a graph has its edges and recommends what it does."""
+    path = str(tmp_path / 'songs.graph')
+    save_snapshot(graph, path)
+    snapshot = load_snapshot(path)
+    items = sorted(graph.get_all_vertices())
+    assert snapshot.get_all_vertices() == graph.get_all_vertices()
+    assert all(snapshot.get_neighbours(item).keys() == graph.get_neighbours(item).keys() for item in items)
+    for seeds in _seed_lists(items, 300, 4):
+        assert snapshot.recommend_songs(seeds, 10) == graph.recommend_songs(seeds, 10)
@@ -0,0 +1,154 @@
+"""CSC111 Winter 2025 Project: Spotify Song Recommendation System
+
+This Python module contains a headless benchmark of the pygame window in main.py. It drives
+the window through a scripted session (moving the mouse over the buttons, typing a search,
+choosing songs and a number of recommendations, and trying again) with the dummy SDL video
+driver, and reports the time spent on every frame and the processor time per frame.
+
+Every session is run twice: once with every frame redrawn in full and all text rendered
+again, as the window used to, and once with the text cache and the redraw scheduling of
+rendering.py. For example:
+
+    python ui_benchmark.py --rounds 5 --fps 0
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of students
+taking CSC111 at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult our Course Syllabus.
+
+This file is Copyright (c) 2025 Cindy Yang, Kate Shen, Kristen Wong, Sara Kopilovic.
+"""
+from __future__ import annotations
+import json
+import os
+import time
+from typing import Callable, Optional
+
+# The dummy video driver draws into memory, so the benchmark runs without a display
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import numpy as np
+import pygame
+
+from background_loader import BackgroundLoader
+from main import load_graph, run_app
+from rendering import TextCache
+
+# The number of frames with no events after every scripted action
+IDLE_FRAMES = 5
+
+
+def session_script(rounds: int = 1) -> list[list[pygame.event.Event]]:
+    """Return the events of every frame of a session going through the window rounds times.
+
+    The session never clicks a Listen button, which would open a web browser.
+    """
+    def move(x: int, y: int) -> list[pygame.event.Event]:
+        return [pygame.event.Event(pygame.MOUSEMOTION, pos=(x, y), rel=(0, 0), buttons=(0, 0, 0))]
+
+    def click(x: int, y: int) -> list[pygame.event.Event]:
+        return move(x, y) + [pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=(x, y), button=1),
+                             pygame.event.Event(pygame.MOUSEBUTTONUP, pos=(x, y), button=1)]
+
+    def key(character: str) -> list[pygame.event.Event]:
+        code = pygame.K_BACKSPACE if character == '\b' else ord(character)
+        return [pygame.event.Event(pygame.KEYDOWN, key=code, unicode=character, mod=0, scancode=0)]
+
+    actions = [move(100, 100), move(640, 385), move(100, 100), click(640, 385)]
+    for _ in range(rounds):
+        actions += [move(1000, 127 + 75 * i) for i in range(7)] + [move(500, 20)]
+        actions += [click(400, 665)] + [key(character) for character in 'love'] + [key('\b')] * 4
+        actions += [click(400, 130), click(400, 205), click(1000, 665)]
+        actions += [move(640, 485), move(640, 20), click(70 + 114 * 4 + 50, 360), click(640, 485)]
+        actions += [move(1100, 152 + 50 * i) for i in range(1, 6)] + [move(1090, 125), click(1090, 125)]
+
+    frames = []
+    for action in actions:
+        frames.append(action)
+        frames.extend([] for _ in range(IDLE_FRAMES))
+    return frames
+
+
+def scripted_events(frames: list[list[pygame.event.Event]]) -> Callable[[], list[pygame.event.Event]]:
+    """Return a function giving the events of the next frame of frames every time it is called,
+    and a quit event once they run out.
+    """
+    remaining = iter(frames)
+
+    def events() -> list[pygame.event.Event]:
+        pygame.event.pump()
+        return next(remaining, [pygame.event.Event(pygame.QUIT)])
+
+    return events
+
+
+def benchmark_window(loader: BackgroundLoader, rounds: int = 3, fps: int = 0, cached: bool = True) -> dict:
+    """Run a scripted session of rounds rounds in a hidden window and return its frame timings.
+
+    With cached True, the window uses the text cache and redraws only what changed; otherwise it
+    renders every text and redraws the whole window in every frame. The frame rate is capped at
+    fps, or not at all if it is 0.
+    """
+    screen = pygame.display.set_mode((1280, 720))
+    frames = session_script(rounds)
+    start, start_cpu = time.perf_counter(), time.process_time()
+    stats = run_app(screen, loader, fps, scripted_events(frames), text_cache=TextCache(512 if cached else 0),
+                    full_redraw=not cached)
+    seconds, cpu = time.perf_counter() - start, time.process_time() - start_cpu
+
+    p50, p99 = np.percentile(stats['frame_seconds'], [50, 99])
+    return {
+        'cached': cached,
+        'frames': stats['frames'],
+        'redrawn': stats['redrawn'],
+        'redrawn_frame_mean_ms': float(np.mean(stats['frame_seconds'])) * 1000,
+        'redrawn_frame_p50_ms': float(p50) * 1000,
+        'redrawn_frame_p99_ms': float(p99) * 1000,
+        'cpu_per_frame_ms': cpu / stats['frames'] * 1000,
+        'cpu_utilization': cpu / seconds,
+        'text_hits': stats['text_hits'],
+        'text_misses': stats['text_misses'],
+        'seconds': seconds
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """Run the benchmark described by the command line arguments argv and print the report."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Measure the frame times of the window without a display.')
+    parser.add_argument('--songs', default='data/spotify_songs_smaller.csv')
+    parser.add_argument('--snapshot', help='the snapshot file to load the graph from, or save it to')
+    parser.add_argument('--rounds', type=int, default=3, help='the times the session goes through the window')
+    parser.add_argument('--fps', type=int, default=0, help='the frame rate cap, or 0 for none')
+    args = parser.parse_args(argv)
+
+    pygame.init()
+    loader = BackgroundLoader(load_graph, args.songs, snapshot_file=args.snapshot)
+    loader.start()
+    while not loader.done:
+        time.sleep(0.05)
+    if loader.error is not None:
+        raise loader.error
+
+    report = [benchmark_window(loader, args.rounds, args.fps, cached) for cached in (False, True)]
+    pygame.quit()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['argparse', 'json', 'os', 'time', 'numpy', 'pygame', 'background_loader', 'main',
+                          'rendering'],
+        'allowed-io': ['main'],
+        'max-line-length': 120
+    })
@@ -0,0 +1,223 @@
+"""CSC111 Winter 2025 Project: Spotify Song Recommendation System
+
+This Python module contains the direct vector search used to recommend songs without a
+similarity graph. Every song is scored against the seed songs from the feature vectors
+alone, so recommendations are available as soon as the songs are loaded and are not limited
+to the edges kept when a graph is built.
+
+The feature vectors scanned can be stored as float32, float16 or uint8, trading a larger
+number of candidates to score again exactly for less memory; the songs returned and their
+scores are the same with every precision.
+
+Copyright and Usage Information
+===============================
+
+This file is provided solely for the personal and private use of students
+taking CSC111 at the University of Toronto St. George campus. All forms of
+distribution of this code, whether as given or with any changes, are
+expressly prohibited. For more information on copyright for CSC111 materials,
+please consult our Course Syllabus.
+
+This file is Copyright (c) 2025 Cindy Yang, Kate Shen, Kristen Wong, Sara Kopilovic.
+"""
+from __future__ import annotations
+from typing import Iterable, Optional
+
+import numpy as np
+
+from instrumentation import Metrics
+
+# The number of songs scored at once by a scan; a block of float32 unit vectors of this many
+# songs stays in the processor cache
+_SCAN_BLOCK = 1 << 16
+
+# Slack used when preselecting candidates from the float32 scan, whose scores can differ from
+# the exact scores by about 1e-6 on top of the error of the precision the vectors are stored in
+_SCAN_TOLERANCE = 1e-5
+
+# The dtype each precision stores the components of the unit feature vectors in
+PRECISIONS = {'float32': np.float32, 'float16': np.float16, 'uint8': np.uint8}
+
+# The step between two uint8 codes. Every normalized feature lies between 0 and its weight, so the
+# components of a unit vector lie between 0 and 1 when the weights of the feature configuration are
+# not negative; components outside that range are clipped, which only widens the error bound
+_UINT8_STEP = 1 / 255
+
+
+class VectorSearch:
+    """An exact search for the songs most similar on average to a list of seed songs.
+
+    The score of a song is the mean of its similarity scores with every seed, the score an edge
+    from each seed would have in a WeightedGraph. Every song is scored with blocked float32 dot
+    products of the exact unit vectors of the seeds with its stored unit vector, the best songs
+    of every block are kept with argpartition, and those candidates are scored again exactly,
+    with the same float operations as recommender.pair_scores, before they are ranked.
+
+    A stored unit vector at distance d from the exact one gives a score within d * (2 + d) of
+    the exact score, so that distance is measured for every song when its vector is stored and
+    a song is only dropped when even its best possible score is below the worst possible score
+    of limit other songs. Storing vectors as uint8 takes a quarter of the memory of float32 but
+    keeps more candidates, since d is about 0.003 instead of 1e-7, and is not faster: with this
+    few features, the scan is bound by the matrix products rather than by memory bandwidth.
+
+    Instance Attributes:
+        - features: The normalized feature matrix, as returned by recommender.normalized_features.
+        - magnitudes: The squared magnitude of every row of features.
+        - popularity: The popularity of every song, used to break ties.
+        - precision: The precision the unit vectors are stored in, one of PRECISIONS.
+
+    Private Instance Attributes:
+        - _units: The rows of features scaled to unit length, stored in the given precision (as
+                  multiples of _UINT8_STEP for uint8), one column per song.
+        - _errors: The largest difference between the score of every song computed from _units
+                   and its exact score, as float32.
+
+    Representation Invariants:
+        - self.precision in PRECISIONS
+    """
+    features: np.ndarray
+    magnitudes: np.ndarray
+    popularity: np.ndarray
+    precision: str
+    _units: np.ndarray
+    _errors: np.ndarray
+
+    def __init__(self, features: np.ndarray, magnitudes: np.ndarray, popularity: np.ndarray,
+                 precision: str = 'float32') -> None:
+        """Initialize a search over the songs with the given normalized features, squared
+        magnitudes and popularity, storing their unit vectors in the given precision.
+
+        Raise a ValueError if precision is not one of PRECISIONS.
+        """
+        if precision not in PRECISIONS:
+            raise ValueError(f'precision must be one of {", ".join(PRECISIONS)}')
+        self.features = features
+        self.magnitudes = magnitudes
+        self.popularity = popularity
+        self.precision = precision
+
+        roots = np.sqrt(magnitudes)[:, None]
+        units = np.divide(features, roots, out=np.zeros(features.shape), where=roots != 0)
+        if precision == 'uint8':
+            stored = np.rint(np.clip(units, 0.0, 1.0) / _UINT8_STEP).astype(np.uint8)
+            distances = np.linalg.norm(stored * _UINT8_STEP - units, axis=1)
+        else:
+            stored = units.astype(PRECISIONS[precision])
+            distances = np.linalg.norm(stored - units, axis=1)
+        self._units = np.ascontiguousarray(stored.T)
+        self._errors = (distances * (2 + distances)).astype(np.float32)
+
+    def __len__(self) -> int:
+        """Return the number of songs searched."""
+        return len(self.magnitudes)
+
+    def search(self, seeds: list[int], limit: int = 5, excluded: Iterable[int] = (),
+               metrics: Optional[Metrics] = None) -> tuple[np.ndarray, np.ndarray]:
+        """Return the rows of the limit songs with the best mean score against the seed rows, and
+        their scores, best first.
+
+        Seeds may repeat, in which case they count once per occurrence. The seeds and the rows in
+        excluded are never returned. Ties are broken by popularity, then by row.
+        If metrics is given, the rows scanned and candidates rescored are counted there.
+        """
+        if not seeds or limit <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        excluded = np.unique(np.concatenate([np.asarray(seeds, dtype=np.int64),
+                                             np.fromiter(excluded, dtype=np.int64)]))
+        seed_units = self._seed_units(seeds)
+        bound = -np.inf
+        candidate_rows, candidate_scores, candidate_errors, found = [], [], [], 0
+        for start in range(0, len(self), _SCAN_BLOCK):
+            stop = min(start + _SCAN_BLOCK, len(self))
+            approximate = self._scan(seed_units, start, stop)
+            inside = excluded[(excluded >= start) & (excluded < stop)]
+            approximate[inside - start] = -np.inf
+            errors = self._errors[start:stop]
+
+            # Compare with the largest error of the block first, then with the error of every row
+            rows = np.flatnonzero(approximate >= bound - _SCAN_TOLERANCE - errors.max())
+            rows = rows[approximate[rows] + errors[rows] >= bound - _SCAN_TOLERANCE]
+            candidate_rows.append(rows + start)
+            candidate_scores.append(approximate[rows])
+            candidate_errors.append(errors[rows])
+            found += len(rows)
+            if found > 4 * limit:
+                # Tighten the bound to the limit-th best lowest possible score so far
+                scores, errors = np.concatenate(candidate_scores), np.concatenate(candidate_errors)
+                lowest = scores - errors
+                bound = max(bound, np.partition(lowest, len(lowest) - limit)[len(lowest) - limit])
+                kept = scores + errors >= bound - _SCAN_TOLERANCE
+                candidate_rows, candidate_scores = [np.concatenate(candidate_rows)[kept]], [scores[kept]]
+                candidate_errors = [errors[kept]]
+                found = len(candidate_rows[0])
+
+        rows = np.concatenate(candidate_rows)
+        rows = rows[np.isfinite(np.concatenate(candidate_scores))]
+        if metrics is not None:
+            metrics.count('rows_scanned', len(self))
+            metrics.count('candidates_rescored', len(rows))
+
+        scores = self.exact_scores(seeds, rows)
+        order = np.lexsort((rows, -self.popularity[rows], -scores))[:limit]
+        return rows[order], scores[order]
+
+    def approximate_scores(self, seeds: list[int], start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """Return the mean score against the seed rows of every row from start to stop, or to the
+        last row, computed in float32 from the stored unit vectors of those rows.
+
+        The score of row i differs from its exact score by at most self._errors[i] + _SCAN_TOLERANCE.
+        """
+        return self._scan(self._seed_units(seeds), start, stop)
+
+    def memory_usage(self) -> int:
+        """Return the number of bytes of the stored unit vectors and their errors, which are
+        scanned by every search.
+        """
+        return self._units.nbytes + self._errors.nbytes
+
+    def _seed_units(self, seeds: list[int]) -> np.ndarray:
+        """Return the exact unit vectors of the seed rows, scaled like the stored unit vectors, as
+        float32.
+        """
+        roots = np.sqrt(self.magnitudes[seeds])[:, None]
+        seed_units = np.divide(self.features[seeds], roots, out=np.zeros((len(seeds), self.features.shape[1])),
+                               where=roots != 0)
+        if self.precision == 'uint8':
+            seed_units *= _UINT8_STEP
+        return seed_units.astype(np.float32)
+
+    def _scan(self, seed_units: np.ndarray, start: int, stop: Optional[int]) -> np.ndarray:
+        """Return the scores of approximate_scores for the seeds with the given unit vectors, as
+        returned by _seed_units.
+        """
+        dot = seed_units @ self._units[:, start:stop].astype(np.float32, copy=False)
+        return np.einsum('ij,ij->j', dot, dot) / len(seed_units)
+
+    def exact_scores(self, seeds: list[int], rows: np.ndarray) -> np.ndarray:
+        """Return the mean similarity score of every given row against the seed rows, adding up
+        the scores of the seeds in order.
+        """
+        totals = np.zeros(len(rows))
+        row_magnitudes = self.magnitudes[rows]
+        for seed in seeds:
+            dot = np.zeros(len(rows))
+            for f in range(self.features.shape[1]):
+                dot += self.features[seed, f] * self.features[rows, f]
+
+            raw = np.zeros_like(dot)
+            if self.magnitudes[seed] != 0:
+                np.divide(dot, np.sqrt(self.magnitudes[seed]) * np.sqrt(row_magnitudes), out=raw,
+                          where=row_magnitudes != 0)
+            totals += np.array([score ** 2 for score in raw.tolist()])
+        return totals / len(seeds)
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['numpy', 'instrumentation'],
+        'allowed-io': [],
+        'max-line-length': 120
+    })